@@ -184,14 +184,19 @@ let facts_to_json (facts: Ast.facts_db) : Yojson.Basic.t =
     ) facts.facts))
   ]
 
-(* Parse JSON to facts database *)
+(* Parse JSON to facts database.
+   A fact is either {"predicate": p, "arguments": [...]} or the compact
+   positional form [p, arg1, arg2, ...]. *)
 let json_to_facts (j: Yojson.Basic.t) : Ast.facts_db =
   let open Yojson.Basic.Util in
   let facts_list = j |> member "facts" |> to_list in
   let facts = List.map (fun fact ->
-    let pred = fact |> member "predicate" |> to_string in
-    let args = fact |> member "arguments" |> to_list |> List.map to_string in
-    (pred, args)
+    match fact with
+    | `List (pred :: args) -> (to_string pred, List.map to_string args)
+    | _ ->
+        let pred = fact |> member "predicate" |> to_string in
+        let args = fact |> member "arguments" |> to_list |> List.map to_string in
+        (pred, args)
   ) facts_list in
   { facts }
 
@@ -236,11 +241,10 @@ type query_request = {
   regulation_filter: string option;
 }
 
-(* Parse a query request from JSON *)
-let parse_query_request (json_str: string) : query_request =
+(* Parse a query request from an already-decoded JSON value *)
+let query_request_of_json (json: Yojson.Basic.t) : query_request =
   try
     let open Yojson.Basic.Util in
-    let json = Yojson.Basic.from_string json_str in
     
     let formula_str = json |> member "formula" |> to_string in
     let facts = json |> member "facts" |> json_to_facts in
@@ -253,6 +257,12 @@ let parse_query_request (json_str: string) : query_request =
   with e ->
     failwith (Printf.sprintf "Failed to parse query request: %s" (Printexc.to_string e))
 
+(* Parse a query request from JSON *)
+let parse_query_request (json_str: string) : query_request =
+  try query_request_of_json (Yojson.Basic.from_string json_str)
+  with Yojson.Json_error msg ->
+    failwith (Printf.sprintf "Failed to parse query request: %s" msg)
+
 (* Helper: Extract unique entities from facts *)
 let extract_entities_from_facts (facts: Ast.facts_db) : string list =
   List.fold_left (fun acc (_, args) ->
@@ -263,10 +273,17 @@ let extract_entities_from_facts (facts: Ast.facts_db) : string list =
   |> List.sort_uniq String.compare
 
 
-(* In handle_query_json *)
-let rec handle_query_json (json_str: string) (ast_env: Ast.type_environment) (policy_manager: Policy_loader.policy_manager) : string =
+(* Error response shared by every JSON entry point *)
+let error_to_json (e: exn) : Yojson.Basic.t =
+  `Assoc [
+    ("error", `String (Printexc.to_string e));
+    ("success", `Bool false)
+  ]
+
+(* Evaluate one decoded request; errors are reported per request *)
+let handle_query_value (json: Yojson.Basic.t) (ast_env: Ast.type_environment) (policy_manager: Policy_loader.policy_manager) : Yojson.Basic.t =
   try
-    let request = parse_query_request json_str in
+    let request = query_request_of_json json in
     
     (* Parse the formula string *)
     let formula = 
@@ -307,15 +324,21 @@ let rec handle_query_json (json_str: string) (ast_env: Ast.type_environment) (po
       policy_manager
     in
     
-    (* Return JSON response *)
-    query_response_to_json response |> Yojson.Basic.to_string
+    query_response_to_json response
     
-  with e ->
-    (* Return error as JSON *)
-    `Assoc [
-      ("error", `String (Printexc.to_string e));
-      ("success", `Bool false)
-    ] |> Yojson.Basic.to_string
+  with e -> error_to_json e
+
+(* A JSON array is a batch: every request shares the loaded type
+   environment and policy database, and the reply is an array in the
+   same order. A single object gets a single object back. *)
+let handle_query_json (json_str: string) (ast_env: Ast.type_environment) (policy_manager: Policy_loader.policy_manager) : string =
+  let response = match Yojson.Basic.from_string json_str with
+    | `List requests ->
+        `List (List.map (fun r -> handle_query_value r ast_env policy_manager) requests)
+    | json -> handle_query_value json ast_env policy_manager
+    | exception e -> error_to_json e
+  in
+  Yojson.Basic.to_string response
 
 (* ============================================ *)
 (* COMMAND-LINE INTERFACE                      *)
@@ -351,6 +374,35 @@ let run_stdio_mode (runtime_env: Environment_config.Config.runtime_environment)
       ] |> Yojson.Basic.to_string in
       print_endline error_json
 
+(* Framed serve mode: requests until EOF on one process, so a caller keeps
+   it alive instead of paying process startup per query. Each message is a
+   4-byte little-endian length followed by that many bytes of JSON, over
+   binary channels. No newline scanning, and payloads may contain any bytes. *)
+let run_framed_mode (runtime_env: Environment_config.Config.runtime_environment) : unit =
+  set_binary_mode_in stdin true;
+  set_binary_mode_out stdout true;
+  let write_frame payload =
+    let header = Bytes.create 4 in
+    Bytes.set_int32_le header 0 (Int32.of_int (String.length payload));
+    output_bytes stdout header;
+    output_string stdout payload;
+    flush stdout
+  in
+  let rec loop () =
+    match really_input_string stdin 4 with
+    | exception End_of_file -> ()
+    | header ->
+        let len = Int32.to_int (String.get_int32_le header 0) in
+        let request = really_input_string stdin len in
+        let output =
+          try handle_query_json request runtime_env.type_env runtime_env.policy_manager
+          with e -> Yojson.Basic.to_string (error_to_json e)
+        in
+        write_frame output;
+        loop ()
+  in
+  loop ()
+
 (* File-based mode: read JSON from file, write response to stdout *)
 let run_file_mode (filename: string) (runtime_env: Environment_config.Config.runtime_environment) : unit =
   try
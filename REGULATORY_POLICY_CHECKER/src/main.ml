@@ -69,6 +69,9 @@ let process_input input env domain facts funcs =
 let run_json_mode (runtime_env: Environment_config.Config.runtime_environment) : unit =
   Json_interface.run_stdio_mode runtime_env
 
+let run_framed_mode (runtime_env: Environment_config.Config.runtime_environment) : unit =
+  Json_interface.run_framed_mode runtime_env
+
 (* ============================================ *)
 (* FILE PROCESSING MODE                        *)
 (* ============================================ *)
@@ -211,6 +214,7 @@ let print_usage () =
   Printf.printf "Usage:\n";
   Printf.printf "  precis file <filename>              Process a policy file\n";
   Printf.printf "  precis json                         Run in JSON mode (for Python)\n";
+  Printf.printf "  precis serve-framed                 Serve length-prefixed JSON requests (for Python)\n";
   Printf.printf "  precis query \"<formula>\" [reg]      Query policies\n";
   Printf.printf "  precis list                         List all policies\n";
   Printf.printf "  precis reload [regulation]          Reload policies\n";
@@ -236,6 +240,11 @@ let () =
       let runtime_env = Environment_config.Config.initialize () in
       run_json_mode runtime_env
   
+  (* Persistent JSON mode: 4-byte little-endian length + JSON per message *)
+  | [_; "serve-framed"] ->
+      let runtime_env = Environment_config.Config.initialize () in
+      run_framed_mode runtime_env
+  
   (* Query mode *)
   | [_; "query"; query] ->
       run_query_mode query None
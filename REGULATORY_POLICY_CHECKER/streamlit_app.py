@@ -6,15 +6,13 @@ import re
 import time
 import pandas as pd
 import ast
-from anthropic import Anthropic
 from datetime import datetime
 from dotenv import load_dotenv
 import PyPDF2
 from io import BytesIO
-from utils.utils import EXPERIMENTS, display_simple_result,display_agent4_result,display_experiment_result, experiment_baseline, experiment_rag, experiment_agent4compliance,MultiRegulationPipeline
+from utils.utils import EXPERIMENTS, display_simple_result,display_agent4_result,display_experiment_result, MultiRegulationPipeline, run_all_sync, format_precis_output, display_json, get_anthropic_client, parse_status, SIMPLE_STATUS_METRICS
 # from utils.crewai_agent_system import ComplianceAgentSystem
 from utils.rag_csv_export import RAGPolicyExporter
-from utils.crewai_policy import multi_agent_compliance_system
 load_dotenv()
 
 st.set_page_config(
@@ -144,18 +142,17 @@ if page == "Compliance Checker":
         elif not ANTHROPIC_API_KEY:
             st.error("❌ Please set ANTHROPIC_API_KEY")
         else:
-            client = Anthropic(api_key=ANTHROPIC_API_KEY)
-            results = []
+            client = get_anthropic_client(ANTHROPIC_API_KEY)
+            selected = [
+                key for key, enabled in zip(
+                    ["baseline_no_context", "rag", "pipeline", "agentic"],
+                    [exp1, exp2, exp3, exp4]
+                ) if enabled
+            ]
         
             with st.spinner("Running experiments..."):
-                if exp1:
-                    results.append(experiment_baseline(query, client))
-                if exp2:
-                    results.append(experiment_rag(query, client))
-                if exp3:
-                    results.append(experiment_agent4compliance(query, client))
-                if exp4:
-                    results.append(multi_agent_compliance_system(query, client))
+                # All selected experiments run concurrently
+                results = list(run_all_sync(query, client, selected).values()) if selected else []
             # Display
             for r in results:
                 with st.expander(f"📌 {r['name']}", expanded=True):
@@ -166,13 +163,8 @@ if page == "Compliance Checker":
                     cols[1].metric("Method", r['method'])
                     if 'compliance_status' in r:
                         # Show explicit compliance status
-                        status = r['compliance_status']
-                        if "COMPLIANT" in status and "NOT" not in status:
-                            cols[2].metric("Status", "✅ COMPLIANT", delta="Verified")
-                        elif "NOT COMPLIANT" in status or "VIOLATION" in status:
-                            cols[2].metric("Status", "👎 VIOLATION ❌", delta="Failed")
-                        else:
-                            cols[2].metric("Status", "⚠️ UNKNOWN", delta="Inconclusive")
+                        label, delta = SIMPLE_STATUS_METRICS[parse_status(r['compliance_status'])]
+                        cols[2].metric("Status", label, delta=delta)
                     elif 'verified' in r:
                         cols[2].metric("Verified", "✅" if r['verified'] else "❌")
                     
@@ -186,7 +178,7 @@ if page == "Compliance Checker":
                     
                     if 'extracted_facts' in r:
                         with st.expander("📋 Facts"):
-                            st.json(r['extracted_facts'])
+                            display_json(r['extracted_facts'])
                     
                     if 'precis_result' in r and 'pipeline_steps' in r['precis_result']:
                         with st.expander("🔧 OCaml Pipeline (Lexer → Parser → Type Check → Evaluator)"):
@@ -201,7 +193,7 @@ if page == "Compliance Checker":
                                         st.markdown(f"- {step}")
                             
                             st.markdown("**Full Output:**")
-                            st.code(r['precis_result']['output'], language="text")
+                            st.code(format_precis_output(r['precis_result']), language="text")
                     
                     st.info(r['answer'])
            
@@ -326,7 +318,7 @@ elif page == "Document → FOTL":
             else:
                 if not show_cached:
                     # Process document
-                    client = Anthropic(api_key=ANTHROPIC_API_KEY)
+                    client = get_anthropic_client(ANTHROPIC_API_KEY)
                     pipeline = MultiRegulationPipeline(client, PRECIS_PATH)
                     
                     with st.spinner("Processing..."):
@@ -593,7 +585,7 @@ elif page == "System Status":
         else:
             with st.spinner("Testing API..."):
                 try:
-                    client = Anthropic(api_key=ANTHROPIC_API_KEY)
+                    client = get_anthropic_client(ANTHROPIC_API_KEY)
                     message = client.messages.create(
                         model="claude-sonnet-4-20250514",
                         max_tokens=100,
@@ -0,0 +1,57 @@
+"""
+Anthropic Message Batches helpers
+Submit many prompts at once, wait for the batch to end, collect the answers
+"""
+
+from __future__ import annotations
+
+import time
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from anthropic import Anthropic
+
+
+def submit_batch(client: Anthropic, items: list) -> str:
+    """
+    Submit a message batch
+
+    Args:
+        items: list of (custom_id, params) pairs, where params are the
+               keyword arguments normally passed to client.messages.create
+    Returns: the batch id
+    """
+    batch = client.messages.batches.create(
+        requests=[
+            {"custom_id": str(custom_id), "params": params}
+            for custom_id, params in items
+        ]
+    )
+    return batch.id
+
+
+def poll(client: Anthropic, batch_id: str, timeout: float = 3600, interval: float = 5):
+    """Wait until the batch has ended; raises TimeoutError after timeout seconds"""
+    deadline = time.time() + timeout
+
+    while True:
+        batch = client.messages.batches.retrieve(batch_id)
+        if batch.processing_status == "ended":
+            return batch
+        if time.time() >= deadline:
+            raise TimeoutError(f"Batch {batch_id} still {batch.processing_status} after {timeout}s")
+        time.sleep(interval)
+
+
+def collect(client: Anthropic, batch_id: str) -> dict:
+    """
+    Read the results of an ended batch
+
+    Returns: {custom_id: text} for succeeded requests; errored, canceled and
+             expired requests are left out
+    """
+    answers = {}
+    for entry in client.messages.batches.results(batch_id):
+        if entry.result.type == "succeeded":
+            answers[entry.custom_id] = entry.result.message.content[0].text
+    return answers
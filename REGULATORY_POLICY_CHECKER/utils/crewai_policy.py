@@ -6,9 +6,12 @@ Each agent is a specialized LLM call with specific tools and context.
 """
 
 import json
+import os
 import subprocess
 import re
+import threading
 import time
+from concurrent.futures import Future
 from typing import List, Dict, Optional, Tuple
 from anthropic import Anthropic
 
@@ -26,6 +29,12 @@ ARITY_MAP = {
     'permittedUseOrDisclosure': 4
 }
 
+PRECIS_DIR = "/Users/priscilladanso/Documents/STONYBROOK/RESEARCH/TOWARDDISSERTATION/WIP/REGULATORY_POLICY_CHECKER"
+PRECIS_PATH = os.path.join(PRECIS_DIR, "precis")
+
+# Compact separators for payloads piped to Précis (no whitespace to copy or parse)
+PRECIS_JSON_SEPARATORS = (",", ":")
+
 HIPAA_KNOWLEDGE = {
     "164.502": "Uses and disclosures of PHI: General rules. Covered entities must have authorization or meet specific conditions.",
     "164.506": "Uses and disclosures for treatment, payment, and healthcare operations.",
@@ -88,6 +97,67 @@ def query_hipaa_section(section: str) -> str:
     return f"Section {section} not in knowledge base"
 
 
+def find_json_object(text: str, required_key: Optional[str] = None) -> Optional[str]:
+    """Return the first balanced {...} object in text (containing required_key, if given)"""
+    depth = 0
+    start = -1
+    in_string = False
+    escaped = False
+    
+    for i, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = depth > 0
+        elif ch == '{':
+            if depth == 0:
+                start = i
+            depth += 1
+        elif ch == '}' and depth > 0:
+            depth -= 1
+            if depth == 0:
+                candidate = text[start:i + 1]
+                if required_key is None or f'"{required_key}"' in candidate:
+                    return candidate
+    
+    return None
+
+
+# In-flight LLM calls keyed by (agent step, inputs); concurrent callers with
+# the same key wait on the first call instead of issuing a duplicate request
+_inflight: Dict[tuple, Future] = {}
+_inflight_lock = threading.Lock()
+
+
+def single_flight(key: tuple, fn, *args):
+    """Run fn(*args) once per key at a time, sharing the outcome with concurrent callers"""
+    with _inflight_lock:
+        future = _inflight.get(key)
+        is_owner = future is None
+        if is_owner:
+            future = Future()
+            _inflight[key] = future
+    
+    if not is_owner:
+        return future.result()
+    
+    try:
+        result = fn(*args)
+        future.set_result(result)
+        return result
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+
 # ============================================
 # BASE AGENT CLASS
 # ============================================
@@ -102,8 +172,13 @@ class Agent:
         self.client = client
         self.memory = []  # Conversation history
     
-    def think(self, prompt: str, context: Optional[Dict] = None) -> str:
-        """Agent reasoning using LLM"""
+    def think(self, prompt: str, context: Optional[Dict] = None, stop_when=None) -> str:
+        """
+        Agent reasoning using LLM
+        
+        If stop_when is given, the response is streamed and the stream is closed
+        as soon as stop_when(text_so_far) returns True.
+        """
         
         # Build full prompt with role and tools
         system_prompt = f"""You are {self.name}, a {self.role}.
@@ -120,14 +195,27 @@ Then continue reasoning."""
             prompt = f"Context: {json.dumps(context, indent=2)}\n\n{prompt}"
         
         try:
-            message = self.client.messages.create(
-                model="claude-sonnet-4-20250514",
-                max_tokens=1500,
-                system=system_prompt,
-                messages=[{"role": "user", "content": prompt}]
-            )
+            if stop_when is None:
+                message = self.client.messages.create(
+                    model="claude-sonnet-4-20250514",
+                    max_tokens=1500,
+                    system=system_prompt,
+                    messages=[{"role": "user", "content": prompt}]
+                )
+                response = message.content[0].text
+            else:
+                response = ""
+                with self.client.messages.stream(
+                    model="claude-sonnet-4-20250514",
+                    max_tokens=1500,
+                    system=system_prompt,
+                    messages=[{"role": "user", "content": prompt}]
+                ) as stream:
+                    for text in stream.text_stream:
+                        response += text
+                        if stop_when(response):
+                            break
             
-            response = message.content[0].text
             self.memory.append({"prompt": prompt, "response": response})
             
             return response
@@ -160,7 +248,9 @@ class FactExtractorAgent(Agent):
     
     def extract(self, query: str) -> List[List[str]]:
         """Extract structured facts from natural language"""
-        
+        return single_flight(("extract", query), self._extract, query)
+    
+    def _extract(self, query: str) -> List[List[str]]:
         prompt = f"""Extract HIPAA compliance facts from this question:
 
 "{query}"
@@ -214,13 +304,17 @@ Output ONLY valid JSON:
     ]
 }}"""
         
-        response = self.think(prompt)
+        # Stop streaming once the facts object has closed; anything after it is commentary
+        response = self.think(
+            prompt,
+            stop_when=lambda text: "}" in text and find_json_object(text, "facts") is not None
+        )
         
         # Parse JSON from response
         try:
-            json_match = re.search(r'\{.*"facts".*\}', response, re.DOTALL)
-            if json_match:
-                facts_json = json.loads(json_match.group())
+            json_text = find_json_object(response, "facts")
+            if json_text:
+                facts_json = json.loads(json_text)
                 facts = facts_json.get("facts", [])
                 
                 # Validate each fact
@@ -341,89 +435,105 @@ class VerifierAgent(Agent):
     def verify(self, formula: str, facts: List[List[str]]) -> Dict:
         """Call OCaml Précis verification engine"""
         
-        PRECIS_PATH = "/Users/priscilladanso/Documents/STONYBROOK/RESEARCH/TOWARDDISSERTATION/WIP/REGULATORY_POLICY_CHECKER/precis"
-        
         try:
-            # Prepare facts for OCaml
-            facts_for_ocaml = [
-                {"predicate": f[0], "arguments": f[1:]}
-                for f in facts if len(f) >= 2
-            ]
+            request = self._build_request(formula, facts)
+            output, error, returncode = self._run_precis(json.dumps(request, separators=PRECIS_JSON_SEPARATORS))
             
-            # Wrap formula
-            wrapped = f"""regulation HIPAA version "1.0"
+            if returncode == 0 and output.strip():
+                return self._parse_result(json.loads(output), output)
+            else:
+                return self._failure(output, error)
+        
+        except Exception as e:
+            return self._failure("", str(e))
+    
+    @staticmethod
+    def _build_request(formula: str, facts: List[List[str]]) -> Dict:
+        """Build the Précis JSON request for one formula"""
+        
+        # Prepare facts for OCaml
+        facts_for_ocaml = [
+            {"predicate": f[0], "arguments": f[1:]}
+            for f in facts if len(f) >= 2
+        ]
+        
+        # Wrap formula
+        wrapped = f"""regulation HIPAA version "1.0"
 policy starts
 {formula}
 ;
 policy ends"""
-            
-            # Build request
-            request = {
-                "formula": wrapped,
-                "facts": {"facts": facts_for_ocaml},
-                "regulation": "HIPAA"
-            }
-            
-            # Call OCaml
-            proc = subprocess.Popen(
-                [PRECIS_PATH, "json"],
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                cwd="/Users/priscilladanso/Documents/STONYBROOK/RESEARCH/TOWARDDISSERTATION/WIP/REGULATORY_POLICY_CHECKER"
+        
+        return {
+            "formula": wrapped,
+            "facts": {"facts": facts_for_ocaml},
+            "regulation": "HIPAA"
+        }
+    
+    @staticmethod
+    def _run_precis(payload: str, timeout: int = 30) -> Tuple[str, str, int]:
+        """Run one Précis process over a JSON payload"""
+        
+        # Binary pipes: one bulk encode/decode instead of the text-mode wrappers
+        proc = subprocess.Popen(
+            [PRECIS_PATH, "json"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=PRECIS_DIR
+        )
+        
+        try:
+            output, error = proc.communicate(input=payload.encode(), timeout=timeout)
+        except subprocess.TimeoutExpired:
+            # Don't leave the child running past the timeout
+            proc.kill()
+            proc.communicate()
+            raise
+        return output.decode(), error.decode(errors="replace"), proc.returncode
+    
+    @staticmethod
+    def _parse_result(result: Dict, output: str) -> Dict:
+        """Turn a Précis JSON response into a verification result"""
+        
+        # Parse verification result correctly
+        overall_compliant = result.get("overall_compliant", None)
+        violations = result.get("violations", [])
+        evaluations = result.get("evaluations", [])
+        
+        # Determine verification status
+        if overall_compliant is not None:
+            # Use overall_compliant if present (most reliable)
+            verified = overall_compliant
+        elif evaluations:
+            # Fallback: check if all evaluations passed
+            verified = all(
+                e.get("evaluation", {}).get("result") == "true"
+                for e in evaluations
             )
-            
-            output, error = proc.communicate(input=json.dumps(request), timeout=30)
-            
-            if proc.returncode == 0 and output.strip():
-                result = json.loads(output)
-                
-                # Parse verification result correctly
-                overall_compliant = result.get("overall_compliant", None)
-                violations = result.get("violations", [])
-                evaluations = result.get("evaluations", [])
-                
-                # Determine verification status
-                if overall_compliant is not None:
-                    # Use overall_compliant if present (most reliable)
-                    verified = overall_compliant
-                elif evaluations:
-                    # Fallback: check if all evaluations passed
-                    verified = all(
-                        e.get("evaluation", {}).get("result") == "true"
-                        for e in evaluations
-                    )
-                else:
-                    # No evaluations found
-                    verified = False
-                
-                return {
-                    "success": True,
-                    "verified": verified,
-                    "result": result,
-                    "output": output,
-                    "error": "",
-                    "violations_count": len(violations),
-                    "compliant_count": len(evaluations) - len(violations) if evaluations else 0
-                }
-            else:
-                return {
-                    "success": False,
-                    "verified": False,
-                    "result": {},
-                    "output": output,
-                    "error": error
-                }
+        else:
+            # No evaluations found
+            verified = False
         
-        except Exception as e:
-            return {
-                "success": False,
-                "verified": False,
-                "result": {},
-                "output": "",
-                "error": str(e)
-            }
+        return {
+            "success": True,
+            "verified": verified,
+            "result": result,
+            "output": output,
+            "error": "",
+            "violations_count": len(violations),
+            "compliant_count": len(evaluations) - len(violations) if evaluations else 0
+        }
+    
+    @staticmethod
+    def _failure(output: str, error: str) -> Dict:
+        return {
+            "success": False,
+            "verified": False,
+            "result": {},
+            "output": output,
+            "error": error
+        }
 
 
 class ExplainerAgent(Agent):
@@ -437,7 +547,10 @@ class ExplainerAgent(Agent):
     
     def explain(self, query: str, verified: bool, facts: List, formula: str) -> str:
         """Generate human-readable explanation"""
-        
+        key = ("explain", query, verified, json.dumps(facts), formula)
+        return single_flight(key, self._explain, query, verified, facts, formula)
+    
+    def _explain(self, query: str, verified: bool, facts: List, formula: str) -> str:
         prompt = f"""Explain this HIPAA compliance verification result:
 
 Question: "{query}"
@@ -0,0 +1,15 @@
+"""
+PyPDF2 page-range extraction for worker processes
+Kept apart from utils.utils so spawned workers import only PyPDF2, not the app
+"""
+
+from io import BytesIO
+
+
+def page_texts(args) -> list:
+    """Text of pages [start, stop) of PDF bytes (runs in a worker process)"""
+    import PyPDF2
+
+    file_bytes, start, stop = args
+    reader = PyPDF2.PdfReader(BytesIO(file_bytes), strict=False)
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
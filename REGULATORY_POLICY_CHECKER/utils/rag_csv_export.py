@@ -10,6 +10,54 @@ from io import StringIO
 import streamlit as st
 import json
 import re
+import gzip
+import pickle
+import importlib.util
+import os
+
+# Arrow-backed string columns when pyarrow is installed, plain object dtype otherwise
+HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+TEXT_DTYPE = "string[pyarrow]" if HAS_PYARROW else object
+
+RAG_COLUMNS = [
+    'policy_id', 'regulation', 'section', 'title', 'description', 'fotl_formula',
+    'keywords', 'conditions', 'action', 'parent_id', 'created_at'
+]
+
+
+# Fields covered by the inverted index and the score a match in each is worth
+INDEX_FIELD_WEIGHTS = {'keywords': 2, 'title': 3, 'description': 1}
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+
+def postings_path_for(index_path: str) -> str:
+    """Sidecar path holding the postings for a parquet RAG index"""
+    return f"{index_path}.postings.pkl.gz"
+
+
+def index_path_for(csv_path: str) -> str:
+    """Parquet index written next to a RAG CSV (foo_rag.csv -> foo_rag.parquet)"""
+    return os.path.splitext(csv_path)[0] + ".parquet"
+
+
+def has_fresh_index(csv_path: str) -> bool:
+    """True when csv_path has a parquet index and postings at least as new as the CSV"""
+    index_path = index_path_for(csv_path)
+    try:
+        csv_mtime = os.path.getmtime(csv_path)
+        return min(os.path.getmtime(index_path),
+                   os.path.getmtime(postings_path_for(index_path))) >= csv_mtime
+    except OSError:
+        return False
+
+
+def read_rag_csv(csv_path) -> pd.DataFrame:
+    """Read a RAG CSV, using the pyarrow engine and string dtypes when available"""
+    if HAS_PYARROW:
+        return pd.read_csv(csv_path, engine="pyarrow", dtype_backend="pyarrow")
+    return pd.read_csv(csv_path)
+
 # class RAGPolicyExporter:
 #     """Export policies to RAG-friendly CSV format"""
     
@@ -141,9 +189,9 @@ class RAGPolicyExporter:
         return [word for word, _ in sorted_words[:10]]
     
     @staticmethod
-    def generate_rag_csv(results: dict) -> str:
+    def _build_rag_dataframe(results: dict) -> pd.DataFrame:
         """
-        Generate RAG CSV from processing results
+        Build the RAG DataFrame from processing results
         
         Args:
             results: Dict with keys: 'regulation', 'policies'
@@ -159,6 +207,7 @@ class RAGPolicyExporter:
         rows = []
         regulation = results.get('regulation', 'UNKNOWN')
         policies = results.get('policies', [])
+        created_at = pd.Timestamp.now().isoformat()  # one export, one timestamp
         
         for policy in policies:
             policy_id = RAGPolicyExporter.generate_policy_id(
@@ -182,19 +231,74 @@ class RAGPolicyExporter:
                 'conditions': ','.join(policy.get('conditions', [])),
                 'action': policy.get('action', ''),
                 'parent_id': '',
-                'created_at': pd.Timestamp.now().isoformat()
+                'created_at': created_at
             }
             
             rows.append(row)
         
-        # Create DataFrame
-        df = pd.DataFrame(rows)
+        return pd.DataFrame(rows, columns=RAG_COLUMNS).astype(TEXT_DTYPE)
+    
+    @staticmethod
+    def generate_rag_csv(results: dict, csv_path: str = None) -> str:
+        """
+        Generate RAG CSV from processing results (see _build_rag_dataframe).
+        With csv_path, also write the CSV there and its parquet index and
+        postings next to it, which RAGPolicySearch(csv_path) then loads.
+        """
+        df = RAGPolicyExporter._build_rag_dataframe(results)
         
         # Convert to CSV
         csv_buffer = StringIO()
         df.to_csv(csv_buffer, index=False, quoting=csv.QUOTE_ALL)
+        rag_csv = csv_buffer.getvalue()
+        
+        if csv_path:
+            with open(csv_path, 'w', encoding='utf-8', newline='') as f:
+                f.write(rag_csv)
+            # Index after the CSV so its mtime marks it fresh
+            RAGPolicyExporter._write_rag_index(df, index_path_for(csv_path))
+        
+        return rag_csv
+    
+    @staticmethod
+    def build_inverted_index(df: pd.DataFrame) -> dict:
+        """
+        Build postings {field: {token: [row positions]}} for the indexed fields.
+        Keywords are indexed whole; title/description by lowercase word tokens.
+        """
+        postings = {field: {} for field in INDEX_FIELD_WEIGHTS}
         
-        return csv_buffer.getvalue()
+        for field, index in postings.items():
+            for row, value in enumerate(df[field].fillna('')):
+                if field == 'keywords':
+                    tokens = {kw for kw in value.split(',') if kw}
+                else:
+                    tokens = set(TOKEN_PATTERN.findall(value.lower()))
+                for token in tokens:
+                    index.setdefault(token, []).append(row)
+        
+        return postings
+    
+    @staticmethod
+    def save_rag_index(results: dict, index_path: str) -> dict:
+        """
+        Write the RAG DataFrame as parquet at index_path plus a gzipped pickle
+        of its postings next to it, for RAGPolicySearch.from_index
+        """
+        df = RAGPolicyExporter._build_rag_dataframe(results)
+        return RAGPolicyExporter._write_rag_index(df, index_path)
+    
+    @staticmethod
+    def _write_rag_index(df: pd.DataFrame, index_path: str) -> dict:
+        """Write df as parquet at index_path and its gzipped postings beside it"""
+        postings = RAGPolicyExporter.build_inverted_index(df)
+        
+        df.to_parquet(index_path, index=False)
+        sidecar = postings_path_for(index_path)
+        with gzip.open(sidecar, 'wb') as f:
+            pickle.dump(postings, f, protocol=pickle.HIGHEST_PROTOCOL)
+        
+        return {'index': index_path, 'postings': sidecar}
 
 
 # ============================================
@@ -205,32 +309,77 @@ class RAGPolicySearch:
     """Search policies using RAG approach"""
     
     def __init__(self, csv_path: str):
-        self.df = pd.read_csv(csv_path)
+        # A CSV exported with its index (generate_rag_csv(..., csv_path)) is searched via the postings
+        if isinstance(csv_path, str) and has_fresh_index(csv_path):
+            self._load_index(index_path_for(csv_path))
+            return
+        self.df = read_rag_csv(csv_path)
+        self.postings = None
+    
+    @classmethod
+    def from_index(cls, index_path: str) -> "RAGPolicySearch":
+        """Load a parquet index and its postings written by RAGPolicyExporter.save_rag_index"""
+        searcher = cls.__new__(cls)
+        searcher._load_index(index_path)
+        return searcher
+    
+    def _load_index(self, index_path: str):
+        self.df = pd.read_parquet(index_path, memory_map=True)
+        with gzip.open(postings_path_for(index_path), 'rb') as f:
+            self.postings = pickle.load(f)
+    
+    @staticmethod
+    def _contains_any(column: pd.Series, words: list) -> pd.Series:
+        """True where the lowercased column contains any of the words"""
+        lowered = column.fillna('').str.lower()
+        hits = pd.Series(False, index=column.index)
+        for word in words:
+            hits |= lowered.str.contains(word, regex=False).astype(bool)
+        return hits
+    
+    def _search_postings(self, query: str, top_k: int) -> pd.DataFrame:
+        """Score rows from the postings lists of the query's tokens only"""
+        tokens = set(TOKEN_PATTERN.findall(query.lower()))
+        scores = {}
+        
+        for field, weight in INDEX_FIELD_WEIGHTS.items():
+            index = self.postings[field]
+            if field == 'keywords':
+                # Every matching keyword counts
+                for token in tokens:
+                    for row in index.get(token, ()):
+                        scores[row] = scores.get(row, 0) + weight
+            else:
+                # Any matching word counts once per field
+                rows = set()
+                for token in tokens:
+                    rows.update(index.get(token, ()))
+                for row in rows:
+                    scores[row] = scores.get(row, 0) + weight
+        
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:top_k]
+        result = self.df.iloc[[row for row, _ in ranked]].copy()
+        result['relevance_score'] = [score for _, score in ranked]
+        return result
     
     def search_by_keywords(self, query: str, top_k: int = 5) -> pd.DataFrame:
         """Keyword-based search"""
+        if self.postings is not None:
+            return self._search_postings(query, top_k)
+        
         query_lower = query.lower()
+        query_words = query_lower.split()
         
-        # Score each policy
-        scores = []
-        for idx, row in self.df.iterrows():
-            score = 0
-            
-            # Check keywords
-            keywords = row['keywords'].split(',')
-            for kw in keywords:
-                if kw in query_lower:
-                    score += 2
-            
-            # Check title
-            if any(word in row['title'].lower() for word in query_lower.split()):
-                score += 3
-            
-            # Check description
-            if any(word in row['description'].lower() for word in query_lower.split()):
-                score += 1
-            
-            scores.append(score)
+        # Check keywords
+        keyword_hits = [
+            sum(kw in query_lower for kw in keywords.split(','))
+            for keywords in self.df['keywords'].fillna('')
+        ]
+        scores = pd.Series(keyword_hits, index=self.df.index) * 2
+        
+        # Check title and description
+        scores += self._contains_any(self.df['title'], query_words) * 3
+        scores += self._contains_any(self.df['description'], query_words) * 1
         
         self.df['relevance_score'] = scores
         
@@ -238,7 +387,7 @@ class RAGPolicySearch:
     
     def search_by_section(self, section: str) -> pd.DataFrame:
         """Search by section number"""
-        return self.df[self.df['section'].str.contains(section, case=False)]
+        return self.df[self.df['section'].str.contains(section, case=False, na=False)]
     
     def search_by_regulation(self, regulation: str) -> pd.DataFrame:
         """Filter by regulation"""
@@ -303,7 +452,7 @@ def add_rag_export_to_results(results: dict):
     
     # Preview RAG CSV
     with st.expander("👁️ Preview RAG CSV"):
-        df = pd.read_csv(StringIO(rag_csv))
+        df = read_rag_csv(StringIO(rag_csv))
         st.dataframe(df[['policy_id', 'section', 'title', 'keywords']], use_container_width=True)
         
         st.markdown("**Sample Row:**")
@@ -355,6 +504,8 @@ all_policies.to_csv("multi_regulation_rag.csv", index=False)
 
 # 2. Use in RAG retrieval
 searcher = RAGPolicySearch("multi_regulation_rag.csv")
+# A CSV written by RAGPolicyExporter.generate_rag_csv(results, "hipaa_rag.csv")
+# carries hipaa_rag.parquet + postings, and RAGPolicySearch("hipaa_rag.csv") searches those
 
 # Search across all regulations
 results = searcher.search_by_keywords("data consent")
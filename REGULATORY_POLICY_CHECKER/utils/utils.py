@@ -1,19 +1,100 @@
+from __future__ import annotations
 
 import streamlit as st
 import subprocess
 import json
 import time
-from anthropic import Anthropic
 import os
-from pathlib import Path
 import re
 from datetime import datetime
+from typing import TYPE_CHECKING, Optional
+from dataclasses import dataclass
 from dotenv import load_dotenv
-import pandas as pd
-import ast
-import PyPDF2
-from io import BytesIO
-import re
+import heapq
+import hashlib
+import importlib.util
+import pickle
+import shelve
+import asyncio
+from functools import lru_cache
+import atexit
+import select
+import threading
+import multiprocessing
+import struct
+from collections import Counter, OrderedDict
+from operator import itemgetter
+from types import MappingProxyType
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from utils.batch import submit_batch, poll, collect
+from utils.pdf_pages import page_texts as _pypdf2_page_texts
+
+# Heavy modules (anthropic, pandas, PyPDF2) are imported where they are used,
+# so the Précis-only and warm-cache paths don't pay for them at import time
+if TYPE_CHECKING:
+    from anthropic import Anthropic, AsyncAnthropic
+
+# orjson when available: faster (de)serialization, and it works on bytes directly
+try:
+    import orjson
+    
+    def json_dumps_bytes(obj) -> bytes:
+        return orjson.dumps(obj)
+    
+    def json_dumps_pretty(obj) -> str:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode()
+    
+    json_loads = orjson.loads
+except ImportError:
+    def json_dumps_bytes(obj) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode()
+    
+    def json_dumps_pretty(obj) -> str:
+        return json.dumps(obj, indent=2)
+    
+    json_loads = json.loads
+
+# Linear-time RE2 for the formula scans when available; the patterns need no backtracking features
+try:
+    import re2 as _re
+except ImportError:
+    _re = re
+
+try:
+    import ahocorasick
+    HAS_AHOCORASICK = True
+except ImportError:
+    HAS_AHOCORASICK = False
+
+# sklearn and faiss both need numpy, so their flags imply HAS_NUMPY
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+try:
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    HAS_SKLEARN = True
+except ImportError:
+    HAS_SKLEARN = False
+
+try:
+    import faiss
+    from sentence_transformers import SentenceTransformer
+    HAS_SEMANTIC_CACHE = True
+except ImportError:
+    HAS_SEMANTIC_CACHE = False
+
+# httpx speaks HTTP/2 when h2 is installed
+HAS_HTTP2 = importlib.util.find_spec("h2") is not None
+
+# PDFium (C) extracts text far faster than PyPDF2's pure-Python parser
+try:
+    import pypdfium2 as pdfium
+    HAS_PDFIUM = True
+except ImportError:
+    HAS_PDFIUM = False
 ANTHROPIC_API_KEY = os.environ.get("ANTHROPIC_API_KEY")
 PRECIS_PATH = os.environ.get(
     "PRECIS_PATH",
@@ -26,25 +107,29 @@ EXPERIMENTS= {
         "exp_name": "Baseline",
         "description": "Direct LLM call with no external knowledge",
         "use_retrieval": False,
-        "use_precis": False
+        "use_precis": False,
+        "batch_eligible": True
     },
     "rag": {
         "exp_name": "RAG",
         "description": "Retrieve natural language policies from database and provide to LLM",
         "use_retrieval": True,
-        "use_precis": False
+        "use_precis": False,
+        "batch_eligible": True
     },
     "pipeline": {
         "exp_name": "Pipeline4Compliance ⭐",
         "description": "Complete pipeline: LLM1 (extract + translate) → OCaml Précis → LLM2 (explain)",
         "use_retrieval": False,
-        "use_precis": True
+        "use_precis": True,
+        "batch_eligible": False
     },
     "agentic": {
        "exp_name": "Agent4Compliance ⭐",
         "description": "Full Agent Reasoning, tool use, replanning using CrewAI",
         "use_retrieval": False,
-        "use_precis": True 
+        "use_precis": True,
+        "batch_eligible": False
     }
 }
 
@@ -67,30 +152,84 @@ ARITY_MAP = {
     # Comparison predicates (2 arguments)
     'purposeIsPurpose': 2,
 }
+
+# Formula clean-up: drop "and purpose = @Treatment" / "and purposeIsPurpose(...)" in one scan
+_CLEAN_RE = _re.compile(r'\s+and\s+(?:\w+\s*=\s*@\w+|purposeIsPurpose\([^)]+\))')
+_IDENT_RE = _re.compile(r'\b([a-z_][a-z0-9_]*)\b')
+_FORMULA_KEYWORDS = frozenset({'forall', 'exists', 'and', 'or', 'implies', 'not', 'iff', 'xor', 'true', 'false'})
+_PREDICATES_LC = frozenset(p.lower() for p in ARITY_MAP)
+
+# LLM response parsing: body of a ``` fenced block
+_CODEBLOCK_RE = re.compile(r'```.*?\n(.*?)\n```', re.DOTALL)
+_JSON_ARRAY_RE = re.compile(r'\[.*\]', re.DOTALL)
+_FENCED_FORMULA_RE = re.compile(r'```(?:ocaml|fotl)?\s*\n(.*?)\n```', re.DOTALL)
+_ARTICLE_RE = re.compile(r'article\s+\d+', re.IGNORECASE)
+
+# Type-system generation: predicate applications and @Constants in a formula
+# (the argument list is unrolled; a nested (?:\w+(?:,\s*)?)+ backtracks
+# exponentially when the closing parenthesis never comes)
+_PREDICATE_APP_RE = _re.compile(r'(\w+)\((\w+(?:,\s*\w+)*(?:,\s*)?)\)')
+_CONSTANT_RE = _re.compile(r'@(\w+)')
+# Operators that look like predicate applications, e.g. not(...)
+_PREDICATE_KEYWORDS = frozenset(('forall', 'exists', 'and', 'or', 'implies', 'not'))
+# Pipeline section extraction: any non-whitespace character
+_NONSPACE_RE = re.compile(r'\S')
     
-def load_policy_database(csv_path: str = "csv/hipaa_policies_all.csv") -> list:
+def _policy_signature(csv_path: str) -> str:
+    """Hash of a policy CSV's contents, stored with its parsed pickle"""
+    with open(csv_path, 'rb') as f:
+        return hashlib.blake2b(f.read(), digest_size=8).hexdigest()
+
+
+def _read_policy_cache(cache_path: str, sig: str):
+    """The parsed policies from the sidecar if it was built from this CSV content, else None"""
     try:
-        df = pd.read_csv(csv_path)
+        with open(cache_path, 'rb') as f:
+            cached_sig, policies = pickle.load(f)
+    except (OSError, EOFError, ValueError, TypeError, pickle.UnpicklingError):
+        return None
+    return policies if cached_sig == sig else None
 
-        policies = []
-        for _, row in df.iterrows():
 
-            text = str(row["natural_language"]).lower()
+@st.cache_resource
+def load_policy_database(csv_path: str = "csv/hipaa_policies_all.csv") -> list:
+    try:
+        # One sidecar per CSV, overwritten when the CSV changes
+        cache_path = f"{csv_path}.pkl"
+        sig = _policy_signature(csv_path)
+        policies = _read_policy_cache(cache_path, sig)
+        if policies is not None:
+            return policies
+        
+        import pandas as pd
+        df = pd.read_csv(csv_path)
 
-            # very simple keyword extraction (you can improve later)
-            auto_keywords = [w.strip(".,;:()") for w in text.split() if len(w) > 4]
+        # very simple keyword extraction (you can improve later)
+        df["keywords"] = [
+            [w.strip(".,;:()") for w in words if len(w) > 4]
+            for words in df["natural_language"].astype(str).str.lower().str.split()
+        ]
 
-            policy = {
-                "id": row['policy_id'],
-                "section": row['section_number'],
-                "title": row['category'],
-                "text": row['natural_language'],
-                "keywords": auto_keywords,  # <-- FIX
+        policies = df[["policy_id", "section_number", "category", "natural_language", "keywords"]].rename(
+            columns={
+                "policy_id": "id",
+                "section_number": "section",
+                "category": "title",
+                "natural_language": "text",
             }
-
-            policies.append(policy)
+        ).to_dict("records")
 
         print(f"Loaded {len(policies)} policies from CSV.")
+        
+        # Write the parsed list atomically so a concurrent reader never sees a partial pickle
+        try:
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                pickle.dump((sig, policies), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            print(f"Could not write policy cache {cache_path}: {e}")
+        
         return policies
     except FileNotFoundError:
         st.warning(f"CSV file not found: {csv_path}. Using fallback database.")
@@ -139,69 +278,328 @@ def get_fallback_database() -> list:
         }
     ]
 
+SECTION_NUMBER_PATTERN = re.compile(r'\d+(?:\.\d+)+')
+QUERY_TOKEN_PATTERN = re.compile(r'\w+')
+
+
+def build_policy_index(policies: list) -> dict:
+    """
+    Inverted indexes over the policy database, built once at load:
+    - keywords: single-word keyword -> [policy idx] (one entry per occurrence)
+    - phrases: [(multi-word keyword, policy idx)] matched as substrings
+    - sections: section number (e.g. "164.510") -> [policy idx]
+    - titles: lowercase title -> [policy idx]
+    """
+    index = {"keywords": {}, "phrases": [], "sections": {}, "titles": {}}
+    
+    for idx, policy in enumerate(policies):
+        for kw in policy['keywords']:
+            if ' ' in kw:
+                index["phrases"].append((kw, idx))
+            else:
+                index["keywords"].setdefault(kw, []).append(idx)
+        
+        for number in SECTION_NUMBER_PATTERN.findall(str(policy['section'])):
+            index["sections"].setdefault(number, []).append(idx)
+        
+        index["titles"].setdefault(str(policy['title']).lower(), []).append(idx)
+    
+    return index
+
+
 # Load the policy database
 RAG_POLICY_DATABASE = load_policy_database()
+RAG_POLICY_INDEX = build_policy_index(RAG_POLICY_DATABASE)
+
+
+def build_policy_tfidf(policies: list) -> tuple:
+    """Fit TF-IDF over policy texts; returns (vectorizer, CSR matrix) or (None, None)"""
+    if not HAS_SKLEARN or not policies:
+        return None, None
+    try:
+        vectorizer = TfidfVectorizer(lowercase=True, stop_words="english", sublinear_tf=True)
+        matrix = vectorizer.fit_transform([str(p['text']) for p in policies])
+        return vectorizer, matrix
+    except ValueError:
+        # e.g. empty vocabulary
+        return None, None
+
+
+VECTORIZER, POLICY_TFIDF = build_policy_tfidf(RAG_POLICY_DATABASE)
+
+
+def _boosted_policies(query_lower: str) -> set:
+    """Policy positions whose section number or title is mentioned in the query"""
+    boosted = set()
+    for number in SECTION_NUMBER_PATTERN.findall(query_lower):
+        boosted.update(RAG_POLICY_INDEX["sections"].get(number, ()))
+    for title, indices in RAG_POLICY_INDEX["titles"].items():
+        if title and title in query_lower:
+            boosted.update(indices)
+    return boosted
+
+
+def _retrieve_tfidf(query_lower: str, top_k: int) -> list:
+    """Score all policies with one sparse mat-vec against the query's TF-IDF vector"""
+    query_vec = VECTORIZER.transform([query_lower])
+    scores = (POLICY_TFIDF @ query_vec.T).toarray().ravel()
+    
+    boosted = list(_boosted_policies(query_lower))
+    if boosted:
+        scores[boosted] += 5
+    
+    if top_k < len(scores):
+        candidates = np.argpartition(-scores, top_k)[:top_k]
+    else:
+        candidates = np.arange(len(scores))
+    # Highest score first, database order among ties
+    ranked = sorted(candidates, key=lambda idx: (-scores[idx], idx))
+    return [RAG_POLICY_DATABASE[idx] for idx in ranked if scores[idx] > 0]
 
 def retrieve_relevant_policies(query: str, top_k: int = 3) -> list:
     """RAG retrieval from natural language policy database"""
     query_lower = query.lower()
     
-    scored = []
-    for policy in RAG_POLICY_DATABASE:
-        # Score based on keyword matches
-        score = sum(1 for kw in policy['keywords'] if kw in query_lower)
-        # Boost if section/title mentioned
-        if policy['section'].lower() in query_lower or policy['title'].lower() in query_lower:
-            score += 5
-        scored.append((score, policy))
+    if POLICY_TFIDF is not None:
+        return _retrieve_tfidf(query_lower, top_k)
+    
+    # Query words, both as \w+ runs and as whitespace words with edge punctuation stripped
+    tokens = set(QUERY_TOKEN_PATTERN.findall(query_lower))
+    tokens.update(w.strip(".,;:()?!\"") for w in query_lower.split())
     
-    scored.sort(reverse=True, key=lambda x: x[0])
-    return [p for s, p in scored[:top_k] if s > 0]
+    # Score based on keyword matches
+    scores = Counter()
+    keyword_index = RAG_POLICY_INDEX["keywords"]
+    for token in tokens:
+        scores.update(keyword_index.get(token, ()))
+    for phrase, idx in RAG_POLICY_INDEX["phrases"]:
+        if phrase in query_lower:
+            scores[idx] += 1
+    
+    # Boost if section/title mentioned
+    for idx in _boosted_policies(query_lower):
+        scores[idx] += 5
+    
+    # Highest score first, database order among ties
+    top = heapq.nlargest(top_k, scores.items(), key=lambda item: (item[1], -item[0]))
+    return [RAG_POLICY_DATABASE[idx] for idx, _ in top]
 
 # ============================================
-# PRÉCIS INTERFACE
+# ANTHROPIC CLIENT
 # ============================================
 
-def call_precis_json(formula: str, facts: list) -> dict:
+ANTHROPIC_MAX_KEEPALIVE = 20
+ANTHROPIC_KEEPALIVE_EXPIRY = 60.0
+
+
+def _anthropic_limits():
+    import httpx
+    return httpx.Limits(
+        max_keepalive_connections=ANTHROPIC_MAX_KEEPALIVE,
+        keepalive_expiry=ANTHROPIC_KEEPALIVE_EXPIRY
+    )
+
+
+@st.cache_resource
+def get_anthropic_client(api_key: str) -> Anthropic:
     """
-    Call OCaml Précis engine in JSON mode
-    
-    This is the bridge: Python → OCaml
+    One Anthropic client per API key, shared across Streamlit reruns, so its
+    connection pool (open TCP/TLS connections) is reused between queries
     """
+    from anthropic import Anthropic, DefaultHttpxClient
     
-    # Prepare JSON input for OCaml
-    request = {
+    return Anthropic(
+        api_key=api_key,
+        http_client=DefaultHttpxClient(http2=HAS_HTTP2, limits=_anthropic_limits())
+    )
+
+
+# Async clients are bound to the event loop they first run on, so UI queries
+# all run on one long-lived loop in a daemon thread and share one client per key
+_QUERY_LOOP = None
+_QUERY_LOOP_LOCK = threading.Lock()
+_ASYNC_CLIENTS = {}
+
+
+def _query_loop() -> asyncio.AbstractEventLoop:
+    """The background event loop for run_all_sync, started on first use"""
+    global _QUERY_LOOP
+    with _QUERY_LOOP_LOCK:
+        if _QUERY_LOOP is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="query-loop", daemon=True).start()
+            _QUERY_LOOP = loop
+        return _QUERY_LOOP
+
+
+def get_async_anthropic_client(api_key: str) -> AsyncAnthropic:
+    """
+    One AsyncAnthropic client per API key, pooled like get_anthropic_client.
+    Only for coroutines running on _query_loop().
+    """
+    client = _ASYNC_CLIENTS.get(api_key)
+    if client is None:
+        from anthropic import AsyncAnthropic, DefaultAsyncHttpxClient
+        
+        client = _ASYNC_CLIENTS[api_key] = AsyncAnthropic(
+            api_key=api_key,
+            http_client=DefaultAsyncHttpxClient(http2=HAS_HTTP2, limits=_anthropic_limits())
+        )
+    return client
+
+
+# ============================================
+# PRÉCIS INTERFACE
+# ============================================
+
+# One long-lived `precis serve-framed` process, shared by all callers. Each
+# message is a 4-byte little-endian length followed by that many bytes of
+# JSON, over binary pipes; the lock keeps each exchange atomic.
+_FRAME_HEADER = struct.Struct("<I")
+_PRECIS_PROC = None
+_PRECIS_LOCK = threading.Lock()
+PRECIS_TIMEOUT = 30
+# Précis runs from its own directory (as the pipeline always ran it)
+_PRECIS_CWD = os.path.dirname(PRECIS_PATH) or "."
+
+
+def _get_precis_proc() -> subprocess.Popen:
+    """Return the running Précis server, spawning it if needed (call with _PRECIS_LOCK held)"""
+    global _PRECIS_PROC
+    if _PRECIS_PROC is None or _PRECIS_PROC.poll() is not None:
+        _PRECIS_PROC = subprocess.Popen(
+            [PRECIS_PATH, "serve-framed"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=_PRECIS_CWD
+        )
+    return _PRECIS_PROC
+
+
+def _stop_precis_proc() -> str:
+    """Kill the Précis server (call with _PRECIS_LOCK held); returns whatever it wrote to stderr"""
+    global _PRECIS_PROC
+    proc, _PRECIS_PROC = _PRECIS_PROC, None
+    if proc is None:
+        return ""
+    proc.kill()
+    try:
+        _, stderr = proc.communicate(timeout=5)
+        return stderr.decode(errors="replace") if stderr else ""
+    except Exception:
+        return ""
+
+
+def _shutdown_precis():
+    with _PRECIS_LOCK:
+        _stop_precis_proc()
+
+
+atexit.register(_shutdown_precis)
+
+
+def _precis_facts(facts: list) -> list:
+    """Facts as {"predicate", "arguments"} objects, the form every Précis build's json_to_facts reads"""
+    return [
+        {"predicate": fact[0], "arguments": list(fact[1:])}
+        for fact in facts if len(fact) >= 2
+    ]
+
+
+def _precis_request(formula: str, facts: list) -> dict:
+    """JSON input for OCaml"""
+    return {
         "formula": formula,
         "facts": {
-            "facts": [[pred] + args for pred, *args in facts]
+            "facts": _precis_facts(facts)
         },
         "regulation": "HIPAA"
     }
+
+
+def _read_exact(stream, n: int) -> bytes:
+    """Read exactly n bytes, or fewer only if the stream hits EOF"""
+    buf = stream.read(n)
+    while buf is not None and len(buf) < n:
+        chunk = stream.read(n - len(buf))
+        if not chunk:
+            break
+        buf += chunk
+    return buf or b""
+
+
+def call_precis_json(formula: str, facts: list) -> dict:
+    """
+    Call OCaml Précis engine in JSON mode
     
+    This is the bridge: Python → OCaml
+    """
+    return _precis_exchange(json_dumps_bytes(_precis_request(formula, facts)))
+
+
+# Whether each Précis binary has serve-framed, probed once per path
+_PRECIS_FRAMED = {}
+
+
+def _precis_supports_framed() -> bool:
+    """
+    Probe `precis serve-framed` with empty input: a build that has the mode
+    exits without writing anything, older ones print their usage text
+    """
+    path = PRECIS_PATH
+    if path not in _PRECIS_FRAMED:
+        try:
+            probe = subprocess.run(
+                [path, "serve-framed"],
+                stdin=subprocess.DEVNULL,
+                capture_output=True,
+                timeout=PRECIS_TIMEOUT,
+                cwd=_PRECIS_CWD
+            )
+        except (OSError, subprocess.TimeoutExpired):
+            # Missing or wedged binary: probe again on the next call
+            return False
+        _PRECIS_FRAMED[path] = probe.returncode == 0 and not probe.stdout.strip()
+    return _PRECIS_FRAMED[path]
+
+
+# At most PRECIS_MAX_PROCS single-shot Précis processes alive at once. They
+# are started from worker threads (asyncio.to_thread on the query loop, the
+# batch pipeline's pool), never on an event loop, so the cap is a thread semaphore
+PRECIS_MAX_PROCS = os.cpu_count() or 4
+_PRECIS_SLOTS = threading.BoundedSemaphore(PRECIS_MAX_PROCS)
+
+
+def _precis_single_shot(payload: bytes) -> dict:
+    """One `precis json` process for one request (binaries without serve-framed)"""
     try:
-        # Call OCaml in JSON mode
-        proc = subprocess.Popen(
-            [PRECIS_PATH, "json"],
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-        
-        stdout, stderr = proc.communicate(input=json.dumps(request), timeout=30)
-        
-        if proc.returncode == 0:
-            return {
-                "success": True,
-                "output": stdout,
-                "response": json.loads(stdout) if stdout.strip() else {}
-            }
-        else:
+        with _PRECIS_SLOTS:
+            proc = subprocess.run(
+                [PRECIS_PATH, "json"],
+                input=payload,
+                capture_output=True,
+                timeout=PRECIS_TIMEOUT,
+                cwd=_PRECIS_CWD
+            )
+        if proc.returncode != 0:
             return {
                 "success": False,
-                "error": stderr or "Unknown error"
+                "error": proc.stderr.decode(errors="replace") or "Unknown error"
             }
+        stdout = proc.stdout.decode()
+        return {
+            "success": True,
+            "output": stdout,
+            "response": json_loads(stdout) if stdout.strip() else {}
+        }
     
+    except subprocess.TimeoutExpired:
+        # subprocess.run has already killed the child
+        return {
+            "success": False,
+            "error": f"Précis timed out after {PRECIS_TIMEOUT}s"
+        }
     except Exception as e:
         return {
             "success": False,
@@ -209,6 +607,160 @@ def call_precis_json(formula: str, facts: list) -> dict:
         }
 
 
+def _precis_exchange(payload: bytes) -> dict:
+    """
+    Send one serialised request to the long-lived Précis server and read its
+    reply; falls back to a single-shot process when the binary predates serve-framed
+    """
+    if not _precis_supports_framed():
+        return _precis_single_shot(payload)
+    
+    with _PRECIS_LOCK:
+        try:
+            proc = _get_precis_proc()
+            proc.stdin.write(_FRAME_HEADER.pack(len(payload)) + payload)
+            proc.stdin.flush()
+            
+            # Watchdog: don't block forever on a wedged server
+            ready, _, _ = select.select([proc.stdout], [], [], PRECIS_TIMEOUT)
+            if not ready:
+                _stop_precis_proc()
+                return {
+                    "success": False,
+                    "error": f"Précis timed out after {PRECIS_TIMEOUT}s"
+                }
+            
+            header = _read_exact(proc.stdout, _FRAME_HEADER.size)
+            if len(header) < _FRAME_HEADER.size:
+                # Server exited; it is respawned on the next call
+                stderr = _stop_precis_proc()
+                return {
+                    "success": False,
+                    "error": stderr or "Unknown error"
+                }
+            
+            (length,) = _FRAME_HEADER.unpack(header)
+            body = _read_exact(proc.stdout, length)
+            if len(body) < length:
+                stderr = _stop_precis_proc()
+                return {
+                    "success": False,
+                    "error": stderr or "Truncated response from Précis"
+                }
+            
+            return {
+                "success": True,
+                "output": body.decode(),
+                "response": json_loads(body) if body.strip() else {}
+            }
+        
+        except Exception as e:
+            # Broken pipe, bad output, ...: start from a fresh process next time
+            _stop_precis_proc()
+            return {
+                "success": False,
+                "error": str(e)
+            }
+
+
+async def call_precis_json_async(formula: str, facts: list) -> dict:
+    """call_precis_json without blocking the event loop (the exchange runs in a worker thread)"""
+    return await asyncio.to_thread(call_precis_json, formula, facts)
+
+
+def call_precis_batch(requests: list) -> list:
+    """Check a list of (formula, facts) pairs concurrently; results keep input order"""
+    async def run_all():
+        return await asyncio.gather(
+            *(call_precis_json_async(formula, facts) for formula, facts in requests)
+        )
+    return asyncio.run(run_all())
+
+
+# Trigger phrases for analyze_compliance_answer
+NEGATIVE_Q = (
+    'is consent required',
+    'is authorization required',
+    'must obtain consent',
+    'need consent',
+    'need authorization'
+)
+PERMISSION_Q = ('can', 'may', 'allowed to', 'permitted to')
+REQUIREMENT_Q = ('must', 'required to', 'shall', 'need to', 'have to')
+CONDITIONAL_WORDS = ('only if', 'provided that', 'must obtain', 'requires authorization')
+COMPLIANCE_WORDS = frozenset({'compliant', 'permitted', 'allowed', 'authorized'})
+VIOLATION_WORDS = frozenset({'violation', 'prohibited', 'not permitted', 'unauthorized'})
+
+QUESTION_PHRASES = {
+    'negative': NEGATIVE_Q,
+    'permission': PERMISSION_Q,
+    'requirement': REQUIREMENT_Q,
+}
+ANSWER_PHRASES = {
+    'conditional': CONDITIONAL_WORDS,
+    'compliance': COMPLIANCE_WORDS,
+    'violation': VIOLATION_WORDS,
+}
+
+
+def _build_phrase_automaton(phrase_sets: dict):
+    """One Aho-Corasick automaton over all phrase sets, each phrase mapped to its categories"""
+    if not HAS_AHOCORASICK:
+        return None
+    categories = {}
+    for category, phrases in phrase_sets.items():
+        for phrase in phrases:
+            categories.setdefault(phrase, set()).add(category)
+    automaton = ahocorasick.Automaton()
+    for phrase, cats in categories.items():
+        automaton.add_word(phrase, frozenset(cats))
+    automaton.make_automaton()
+    return automaton
+
+
+_QUESTION_AC = _build_phrase_automaton(QUESTION_PHRASES)
+_ANSWER_AC = _build_phrase_automaton(ANSWER_PHRASES)
+
+
+def _phrase_categories(text: str, automaton, phrase_sets: dict) -> set:
+    """Categories with at least one phrase occurring in text, in a single pass when possible"""
+    if automaton is None:
+        return {
+            category for category, phrases in phrase_sets.items()
+            if any(phrase in text for phrase in phrases)
+        }
+    found = set()
+    for _, cats in automaton.iter(text):
+        found |= cats
+    return found
+
+
+# Question type -> YES/NO readings to try, first match wins
+YN_PRECEDENCE = {
+    'negative': ('no', 'yes'),
+    'permission': ('yes', 'no'),
+    'requirement': ('yes', 'no'),
+}
+
+# (question type, YES/NO reading) -> (verdict, confidence, reasoning)
+DECISION_TABLE = {
+    # "Is consent required?" - asking if something restrictive is needed
+    # NO consent required = treatment is ALLOWED = COMPLIANT
+    ('negative', 'no'): ('compliant', 0.95, 'NO to negative question (consent NOT required) = compliant'),
+    # YES consent required = more restrictive = COMPLIANT (requirement exists)
+    ('negative', 'yes'): ('compliant', 0.9, 'YES to requirement question = requirement exists'),
+    
+    # "Can hospitals share...?"
+    ('permission', 'yes'): ('compliant', 0.9, 'YES to permission question = allowed'),
+    ('permission', 'yes_conditional'): ('conditional', 0.85, 'YES with conditions to permission question'),
+    ('permission', 'no'): ('violation', 0.9, 'NO to permission question = not allowed'),
+    
+    # "Must covered entities have X?"
+    ('requirement', 'yes'): ('compliant', 0.9, 'YES to requirement = requirement exists'),
+    ('requirement', 'no'): ('compliant', 0.85, 'NO to requirement = no requirement (compliant by default)'),
+}
+
+
 def analyze_compliance_answer(answer: str, question: str = "") -> dict:
     """
     Intelligently analyze an answer to determine compliance verdict
@@ -217,26 +769,23 @@ def analyze_compliance_answer(answer: str, question: str = "") -> dict:
         question: The original question (helps with context)
     Returns: {'verdict': 'compliant'|'violation'|'conditional', 'confidence': float, 'reasoning': str}
     """
-    
+    # The analysis is a pure function of (answer, question); callers get their own copy
+    return dict(_analyze_compliance_cached(answer, question))
+
+
+@lru_cache(maxsize=4096)
+def _analyze_compliance_cached(answer: str, question: str) -> dict:
     answer_lower = answer.lower()
     question_lower = question.lower() if question else ""
     
     # Detect question patterns
-    is_negative_question = any(word in question_lower for word in [
-        'is consent required',
-        'is authorization required',
-        'must obtain consent',
-        'need consent',
-        'need authorization'
-    ])
-    
-    is_permission_question = any(phrase in question_lower for phrase in [
-        'can', 'may', 'allowed to', 'permitted to'
-    ])
-    
-    is_requirement_question = any(phrase in question_lower for phrase in [
-        'must', 'required to', 'shall', 'need to', 'have to'
-    ]) and not is_negative_question
+    question_cats = _phrase_categories(question_lower, _QUESTION_AC, QUESTION_PHRASES)
+    is_negative_question = 'negative' in question_cats
+    is_permission_question = 'permission' in question_cats
+    is_requirement_question = 'requirement' in question_cats and not is_negative_question
+    
+    # Every answer phrase set in one scan
+    answer_cats = _phrase_categories(answer_lower, _ANSWER_AC, ANSWER_PHRASES)
     
     # Extract YES/NO
     answer_lines = answer_lower.split('\n')
@@ -250,106 +799,75 @@ def analyze_compliance_answer(answer: str, question: str = "") -> dict:
     has_yes = 'yes' in first_words or starts_with_yes
     has_no = 'no' in first_words or starts_with_no
     
-    # Decision logic
+    # Question type, in priority order
     if is_negative_question:
-        # "Is consent required?" - asking if something restrictive is needed
-        if has_no:
-            # NO consent required = treatment is ALLOWED = COMPLIANT
-            return {
-                'verdict': 'compliant',
-                'confidence': 0.95,
-                'reasoning': 'NO to negative question (consent NOT required) = compliant'
-            }
-        elif has_yes:
-            # YES consent required = more restrictive = COMPLIANT (requirement exists)
-            return {
-                'verdict': 'compliant',
-                'confidence': 0.9,
-                'reasoning': 'YES to requirement question = requirement exists'
-            }
-    
+        qtype = 'negative'
     elif is_permission_question:
-        # "Can hospitals share...?"
-        if has_yes:
-            # Check for conditions
-            conditional_words = ['only if', 'provided that', 'must obtain', 'requires authorization']
-            has_conditions = any(phrase in answer_lower for phrase in conditional_words)
-            
-            if has_conditions:
-                return {
-                    'verdict': 'conditional',
-                    'confidence': 0.85,
-                    'reasoning': 'YES with conditions to permission question'
-                }
-            else:
-                return {
-                    'verdict': 'compliant',
-                    'confidence': 0.9,
-                    'reasoning': 'YES to permission question = allowed'
-                }
-        elif has_no:
-            return {
-                'verdict': 'violation',
-                'confidence': 0.9,
-                'reasoning': 'NO to permission question = not allowed'
-            }
-    
+        qtype = 'permission'
     elif is_requirement_question:
-        # "Must covered entities have X?"
-        if has_yes:
-            return {
-                'verdict': 'compliant',
-                'confidence': 0.9,
-                'reasoning': 'YES to requirement = requirement exists'
-            }
-        elif has_no:
-            return {
-                'verdict': 'compliant',
-                'confidence': 0.85,
-                'reasoning': 'NO to requirement = no requirement (compliant by default)'
-            }
+        qtype = 'requirement'
+    else:
+        qtype = None
     
-    # Fallback: Look for explicit compliance language
-    if any(word in answer_lower for word in ['compliant', 'permitted', 'allowed', 'authorized']):
-        return {
-            'verdict': 'compliant',
-            'confidence': 0.7,
-            'reasoning': 'Answer indicates compliance/permission'
-        }
+    # The YES/NO reading; which one wins when both appear depends on the question type
+    yn = None
+    for candidate in YN_PRECEDENCE.get(qtype, ()):
+        if (has_no if candidate == 'no' else has_yes):
+            yn = candidate
+            break
+    if qtype == 'permission' and yn == 'yes' and 'conditional' in answer_cats:
+        yn = 'yes_conditional'
     
-    if any(word in answer_lower for word in ['violation', 'prohibited', 'not permitted', 'unauthorized']):
-        return {
-            'verdict': 'violation',
-            'confidence': 0.7,
-            'reasoning': 'Answer indicates violation/prohibition'
-        }
+    decision = DECISION_TABLE.get((qtype, yn))
+    if decision is None:
+        decision = _fallback_decision(answer_cats)
     
-    # Unknown
+    verdict, confidence, reasoning = decision
     return {
-        'verdict': 'unknown',
-        'confidence': 0.3,
-        'reasoning': 'Unable to determine clear verdict from answer'
+        'verdict': verdict,
+        'confidence': confidence,
+        'reasoning': reasoning
     }
 
 
-def experiment_baseline(query: str, client: Anthropic) -> dict:
-    """
-    Enhanced Baseline with verdict analysis
-    """
-    import time
-    
-    start = time.time()
-    steps = ["📝 Direct LLM call without external knowledge"]
-    
-    try:
-        message = client.messages.create(
-            model="claude-sonnet-4-20250514",
-            max_tokens=1000,
-            messages=[{
-                "role": "user",
-                "content": f"""You are a HIPAA compliance expert. Answer this question:
+def _fallback_decision(answer_cats: set) -> tuple:
+    """No clear YES/NO for the question type: look for explicit compliance language"""
+    if 'compliance' in answer_cats:
+        return ('compliant', 0.7, 'Answer indicates compliance/permission')
+    if 'violation' in answer_cats:
+        return ('violation', 0.7, 'Answer indicates violation/prohibition')
+    return ('unknown', 0.3, 'Unable to determine clear verdict from answer')
+
+
+# Verdict -> (compliance_status, verified) for each kind of LLM-only answer
+BASELINE_STATUS = {
+    'compliant': ("✅ COMPLIANT (based on answer)", True),
+    'violation': ("❌ VIOLATION (based on answer)", False),
+    'conditional': ("⚠️ CONDITIONAL COMPLIANCE", True),  # Technically compliant if conditions are met
+    'default': ("⚠️ UNKNOWN", False),
+}
+
+RAG_STATUS = {
+    'compliant': ("✅ COMPLIANT (with policy citations)", True),
+    'violation': ("❌ VIOLATION (with policy citations)", False),
+    'default': ("⚠️ INCONCLUSIVE", False),
+}
+
+# Since no policies were retrieved, mark as lower confidence
+RAG_NO_POLICY_STATUS = {
+    'compliant': ("⚠️ LIKELY COMPLIANT (no policy verification)", False),
+    'violation': ("⚠️ LIKELY VIOLATION (no policy verification)", False),
+    'default': ("⚠️ UNKNOWN (no policies retrieved)", False),
+}
+
+# Queries at or above this count go through the Batches API in "auto" mode
+BATCH_MIN_QUERIES = 10
 
-{query}
+# Stable instruction prefixes, sent as system blocks marked for prompt caching.
+# The API only caches a prefix of at least 1024 tokens; these are a few dozen,
+# so they are billed as ordinary input and the marker costs nothing until the
+# prefix grows past the minimum.
+HIPAA_SYSTEM_PROMPT = """You are a HIPAA compliance expert. Answer the user's question.
 
 Provide a clear, direct answer with:
 1. YES or NO at the start
@@ -357,60 +875,204 @@ Provide a clear, direct answer with:
 3. Key HIPAA requirements if applicable
 
 Be concise but complete."""
-            }]
-        )
-        
-        answer = message.content[0].text
-        steps.append("✅ LLM response generated")
-        
-        # Analyze the answer WITH the question for context
-        analysis = analyze_compliance_answer(answer, query)
-        steps.append(f"✅ Answer analyzed: {analysis['reasoning']}")
-        
-        # Determine compliance status
-        if analysis['verdict'] == 'compliant':
-            compliance_status = "✅ COMPLIANT (based on answer)"
-            verified = True
-        elif analysis['verdict'] == 'violation':
-            compliance_status = "❌ VIOLATION (based on answer)"
-            verified = False
-        elif analysis['verdict'] == 'conditional':
-            compliance_status = "⚠️ CONDITIONAL COMPLIANCE"
-            verified = True  # Technically compliant if conditions are met
-        else:
-            compliance_status = "⚠️ UNKNOWN"
-            verified = False
-        
-        return {
-            "name": "Baseline",
-            "answer": answer,
-            "duration": time.time() - start,
-            "steps": steps,
-            "method": "Direct LLM (No external knowledge)",
-            "compliance_status": compliance_status,
-            "verified": verified,
-            "analysis": analysis
-        }
-    
-    except Exception as e:
-        return {
-            "name": "Baseline",
-            "answer": f"Error: {str(e)}",
-            "duration": time.time() - start,
-            "steps": steps + [f"❌ Error: {str(e)}"],
-            "method": "Direct LLM (Failed)",
-            "compliance_status": "❌ ERROR",
-            "verified": False
-        }
 
+RAG_SYSTEM_PROMPT = """Answer the user's HIPAA question based on the HIPAA policies below.
 
-def experiment_rag(query: str, client: Anthropic) -> dict:
+Cite specific policy sections."""
+
+RAG_NO_POLICY_SYSTEM_PROMPT = """No specific HIPAA policies were retrieved from the database for the user's question.
+
+Provide a general answer based on your knowledge of HIPAA, but clearly note that specific policy citations are not available."""
+
+
+def _cached_system(prefix: str, *per_request: str) -> list:
     """
-    Enhanced RAG with verdict analysis
+    System text blocks with the prompt-cache breakpoint on the static prefix;
+    per_request blocks (retrieved policies, facts) follow it uncached
+    """
+    blocks = [{"type": "text", "text": prefix, "cache_control": {"type": "ephemeral"}}]
+    blocks.extend({"type": "text", "text": text} for text in per_request)
+    return blocks
+
+
+# ============================================
+# SEMANTIC CACHE
+# ============================================
+
+SEMANTIC_CACHE_MODEL = "all-MiniLM-L6-v2"
+SEMANTIC_CACHE_THRESHOLD = 0.95
+SEMANTIC_CACHE_DIR = os.environ.get("SEMANTIC_CACHE_DIR", os.path.expanduser("~/.cache/policy_semantic"))
+# Off by default: near-identical embeddings can belong to questions with
+# opposite answers ("with" vs "without authorization", a different purpose)
+SEMANTIC_CACHE_ENABLED = os.environ.get("SEMANTIC_CACHE", "0") == "1"
+
+_EMBEDDER = None
+_EMBEDDER_LOCK = threading.Lock()
+
+
+def _get_embedder():
+    """Load the sentence embedding model on first use"""
+    global _EMBEDDER
+    with _EMBEDDER_LOCK:
+        if _EMBEDDER is None:
+            _EMBEDDER = SentenceTransformer(SEMANTIC_CACHE_MODEL)
+        return _EMBEDDER
+
+
+class SemanticCache:
+    """
+    Experiment results keyed by query embedding; a new query whose cosine
+    similarity to a cached one exceeds the threshold reuses that result.
+    Persisted under SEMANTIC_CACHE_DIR as an append-only log of
+    (embedding, result) records; the FAISS index is rebuilt from it on load.
     """
-    import time
     
-    start = time.time()
+    def __init__(self, name: str, threshold: float = SEMANTIC_CACHE_THRESHOLD):
+        self.threshold = threshold
+        self.log_path = os.path.join(SEMANTIC_CACHE_DIR, f"{name}.log")
+        self.lock = threading.Lock()
+        self.index = None
+        self.results = []
+        
+        embeddings = []
+        if os.path.exists(self.log_path):
+            try:
+                with open(self.log_path, 'rb') as f:
+                    while True:
+                        try:
+                            embedding, result = pickle.load(f)
+                        except EOFError:
+                            break
+                        embeddings.append(embedding)
+                        self.results.append(result)
+            except Exception as e:
+                # A torn last record (crash mid-write) only loses that record
+                print(f"Stopped reading semantic cache {self.log_path}: {e}")
+        if embeddings:
+            self.index = faiss.IndexFlatIP(embeddings[0].shape[1])
+            self.index.add(np.concatenate(embeddings))
+    
+    def _embed(self, query: str):
+        # Normalized, so inner product == cosine similarity
+        return np.asarray(
+            _get_embedder().encode([query], normalize_embeddings=True), dtype="float32"
+        )
+    
+    def lookup(self, query: str):
+        """Return (result, similarity) for the closest cached query above threshold, else None"""
+        q_emb = self._embed(query)
+        with self.lock:
+            if self.index is None or self.index.ntotal == 0:
+                return None
+            D, I = self.index.search(q_emb, 1)
+            if D[0, 0] > self.threshold:
+                return self.results[I[0, 0]], float(D[0, 0])
+        return None
+    
+    def insert(self, query: str, result: dict):
+        q_emb = self._embed(query)
+        with self.lock:
+            if self.index is None:
+                self.index = faiss.IndexFlatIP(q_emb.shape[1])
+            self.index.add(q_emb)
+            self.results.append(result)
+            try:
+                os.makedirs(SEMANTIC_CACHE_DIR, exist_ok=True)
+                with open(self.log_path, 'ab') as f:
+                    pickle.dump((q_emb, result), f, protocol=pickle.HIGHEST_PROTOCOL)
+            except OSError as e:
+                print(f"Could not persist semantic cache {self.log_path}: {e}")
+
+
+SEMANTIC_CACHES = {}
+_SEMANTIC_CACHES_LOCK = threading.Lock()
+
+
+def _semantic_cache(name: str):
+    """Per-experiment cache, or None when it is disabled or the embedding/FAISS packages are missing"""
+    if not (SEMANTIC_CACHE_ENABLED and HAS_SEMANTIC_CACHE):
+        return None
+    with _SEMANTIC_CACHES_LOCK:
+        if name not in SEMANTIC_CACHES:
+            SEMANTIC_CACHES[name] = SemanticCache(name)
+        return SEMANTIC_CACHES[name]
+
+
+def _cached_result(name: str, query: str, start: float):
+    """A copy of a cached result for a semantically equivalent query, or None"""
+    cache = _semantic_cache(name)
+    hit = cache.lookup(query) if cache is not None else None
+    if hit is None:
+        return None
+    result, similarity = hit
+    return {
+        **result,
+        "duration": time.time() - start,
+        "steps": result["steps"] + [f"💾 Semantic cache hit (similarity {similarity:.3f})"],
+        "cache_hit": True
+    }
+
+
+def _cache_result(name: str, query: str, result: dict) -> dict:
+    """Remember a successful result for later equivalent queries; returns it unchanged"""
+    cache = _semantic_cache(name)
+    if cache is not None and result["compliance_status"] != "❌ ERROR":
+        cache.insert(query, result)
+    return result
+
+
+def _build_result(answer: str, query: str, start: float, steps: list, name: str,
+                  method: str, status_map: dict, **extra) -> dict:
+    """Analyze an LLM answer and build the experiment result (shared by realtime and batch runs)"""
+    # Analyze the answer WITH the question for context
+    analysis = analyze_compliance_answer(answer, query)
+    steps.append(f"✅ Answer analyzed: {analysis['reasoning']}")
+    
+    compliance_status, verified = status_map.get(analysis['verdict'], status_map['default'])
+    
+    return {
+        "name": name,
+        "answer": answer,
+        "duration": time.time() - start,
+        "steps": steps,
+        "method": method,
+        "compliance_status": compliance_status,
+        "verified": verified,
+        **extra,
+        "analysis": analysis
+    }
+
+
+def _build_error_result(error: str, start: float, steps: list, name: str,
+                        method: str, **extra) -> dict:
+    """Experiment result for a failed LLM call"""
+    return {
+        "name": name,
+        "answer": f"Error: {error}",
+        "duration": time.time() - start,
+        "steps": steps + [f"❌ Error: {error}"],
+        "method": method,
+        "compliance_status": "❌ ERROR",
+        "verified": False,
+        **extra
+    }
+
+
+def _baseline_params(query: str) -> dict:
+    """messages.create parameters for the baseline experiment"""
+    return {
+        "model": "claude-sonnet-4-20250514",
+        "max_tokens": 1000,
+        "system": _cached_system(HIPAA_SYSTEM_PROMPT),
+        "messages": [{"role": "user", "content": query}]
+    }
+
+
+def _rag_prepare(query: str) -> tuple:
+    """
+    Retrieve policies and build the RAG request
+    Returns: (steps, retrieved_count, params, status_map)
+    """
     steps = ["🔍 Retrieving HIPAA policies from database"]
     
     retrieved_policies = retrieve_relevant_policies(query, top_k=3)
@@ -427,143 +1089,382 @@ def experiment_rag(query: str, client: Anthropic) -> dict:
             f"Text: {p['text'][:200]}..."  # first 200 chars
         )
 
-    try:
-        if retrieved_count == 0:
-            # No policies retrieved - answer based on general knowledge
-            steps.append("⚠️ No relevant policies found, using general knowledge")
-            
-            message = client.messages.create(
-                model="claude-sonnet-4-20250514",
-                max_tokens=1000,
-                messages=[{
-                    "role": "user",
-                    "content": f"""No specific HIPAA policies were retrieved from the database for this question:
+    if retrieved_count == 0:
+        # No policies retrieved - answer based on general knowledge
+        steps.append("⚠️ No relevant policies found, using general knowledge")
+        system = _cached_system(RAG_NO_POLICY_SYSTEM_PROMPT)
+        status_map = RAG_NO_POLICY_STATUS
+    else:
+        # Policies retrieved - generate answer with citations; only the fields the
+        # model needs, not the repr of every dict (keywords included)
+        policy_block = "\n\n".join(
+            f"[{p['id']} {p['section']}] {p['title']}\n{p['text']}" for p in retrieved_policies
+        )
+        # Only the instructions are a cacheable prefix; the policies change per query
+        system = _cached_system(RAG_SYSTEM_PROMPT, f"HIPAA policies:\n\n{policy_block}")
+        status_map = RAG_STATUS
+    
+    params = {
+        "model": "claude-sonnet-4-20250514",
+        "max_tokens": 1000,
+        "system": system,
+        "messages": [{"role": "user", "content": query}]
+    }
+    return steps, retrieved_count, params, status_map
 
-{query}
 
-Provide a general answer based on your knowledge of HIPAA, but clearly note that specific policy citations are not available."""
-                }]
-            )
-            
-            answer = message.content[0].text
-            analysis = analyze_compliance_answer(answer, query)
-            
-            # Since no policies were retrieved, mark as lower confidence
-            if analysis['verdict'] == 'compliant':
-                compliance_status = "⚠️ LIKELY COMPLIANT (no policy verification)"
-                verified = False
-            elif analysis['verdict'] == 'violation':
-                compliance_status = "⚠️ LIKELY VIOLATION (no policy verification)"
-                verified = False
-            else:
-                compliance_status = "⚠️ UNKNOWN (no policies retrieved)"
-                verified = False
+def _stream_answer(client: Anthropic, params: dict, query: str, start: float, steps: list) -> tuple:
+    """
+    Stream the LLM answer, analyzing it as soon as the first line is complete
+    (the YES/NO verdict keys off the first line)
+    Returns: (answer, early_analysis) - early_analysis is None if the answer has a single line
+    """
+    chunks = []
+    early_analysis = None
+    
+    with client.messages.stream(**params) as stream:
+        for text in stream.text_stream:
+            chunks.append(text)
+            if early_analysis is None and "\n" in text:
+                early_analysis = analyze_compliance_answer("".join(chunks), query)
+                steps.append(
+                    f"⚡ Early verdict after {time.time() - start:.1f}s: {early_analysis['verdict']}"
+                )
+    
+    return "".join(chunks), early_analysis
+
+
+def experiment_baseline(query: str, client: Anthropic) -> dict:
+    """
+    Enhanced Baseline with verdict analysis
+    """
+    start = time.time()
+    cached = _cached_result("baseline", query, start)
+    if cached is not None:
+        return cached
+    
+    steps = ["📝 Direct LLM call without external knowledge"]
+    
+    try:
+        answer, early_analysis = _stream_answer(client, _baseline_params(query), query, start, steps)
+        steps.append("✅ LLM response generated")
         
-        else:
-            # Policies retrieved - generate answer with citations
-            message = client.messages.create(
-                model="claude-sonnet-4-20250514",
-                max_tokens=1000,
-                messages=[{
-                    "role": "user",
-                    "content": f"""Based on these HIPAA policies:
+        # Final pass over the full answer for fidelity
+        return _cache_result("baseline", query, _build_result(
+            answer, query, start, steps, "Baseline",
+            "Direct LLM (No external knowledge)", BASELINE_STATUS,
+            early_analysis=early_analysis
+        ))
+    
+    except Exception as e:
+        return _build_error_result(str(e), start, steps, "Baseline", "Direct LLM (Failed)")
 
-{retrieved_policies}
 
-Answer this question: {query}
+def experiment_rag(query: str, client: Anthropic) -> dict:
+    """
+    Enhanced RAG with verdict analysis
+    """
+    start = time.time()
+    cached = _cached_result("rag", query, start)
+    if cached is not None:
+        return cached
+    
+    steps, retrieved_count, params, status_map = _rag_prepare(query)
 
-Cite specific policy sections."""
-                }]
-            )
-            
-            answer = message.content[0].text
-            analysis = analyze_compliance_answer(answer, query)
-            
-            if analysis['verdict'] == 'compliant':
-                compliance_status = "✅ COMPLIANT (with policy citations)"
-                verified = True
-            elif analysis['verdict'] == 'violation':
-                compliance_status = "❌ VIOLATION (with policy citations)"
-                verified = False
-            else:
-                compliance_status = "⚠️ INCONCLUSIVE"
-                verified = False
-        
+    try:
+        answer, early_analysis = _stream_answer(client, params, query, start, steps)
         steps.append("✅ LLM response with policy context generated")
         
-        return {
-            "name": "RAG",
-            "answer": answer,
-            "duration": time.time() - start,
-            "steps": steps,
-            "method": "Retrieval + LLM",
-            "compliance_status": compliance_status,
-            "verified": verified,
-            "retrieved_policies": retrieved_count,
-            # "retrieved_policies": retrieved_policies,  # <--- add this
-            "analysis": analysis
-        }
+        # Final pass over the full answer for fidelity
+        return _cache_result("rag", query, _build_result(
+            answer, query, start, steps, "RAG", "Retrieval + LLM",
+            status_map, retrieved_policies=retrieved_count,
+            early_analysis=early_analysis
+        ))
     
     except Exception as e:
-        return {
-            "name": "RAG",
-            "answer": f"Error: {str(e)}",
-            "duration": time.time() - start,
-            "steps": steps + [f"❌ Error: {str(e)}"],
-            "method": "Retrieval + LLM (Failed)",
-            "compliance_status": "❌ ERROR",
-            "verified": False,
-            "retrieved_policies": 0
-        }
+        return _build_error_result(str(e), start, steps, "RAG", "Retrieval + LLM (Failed)",
+                                   retrieved_policies=0)
 
 
-def validate_facts(extracted_facts: list) -> tuple:
-    """Validate fact structure and return (valid_facts, warnings)"""
+async def _stream_answer_async(client: AsyncAnthropic, params: dict, query: str,
+                               start: float, steps: list) -> tuple:
+    """Async counterpart of _stream_answer"""
+    chunks = []
+    early_analysis = None
     
-    validated_facts = []
-    warnings = []
+    async with client.messages.stream(**params) as stream:
+        async for text in stream.text_stream:
+            chunks.append(text)
+            if early_analysis is None and "\n" in text:
+                early_analysis = analyze_compliance_answer("".join(chunks), query)
+                steps.append(
+                    f"⚡ Early verdict after {time.time() - start:.1f}s: {early_analysis['verdict']}"
+                )
     
-    for fact in extracted_facts:
-        if not isinstance(fact, list) or len(fact) < 2:
-            warnings.append(f"⚠️ Invalid fact structure: {fact}, skipping")
-            continue
+    return "".join(chunks), early_analysis
+
+
+async def experiment_baseline_async(query: str, client: AsyncAnthropic) -> dict:
+    """experiment_baseline on an AsyncAnthropic client, so it can overlap with other experiments"""
+    start = time.time()
+    cached = await asyncio.to_thread(_cached_result, "baseline", query, start)
+    if cached is not None:
+        return cached
+    
+    steps = ["📝 Direct LLM call without external knowledge"]
+    
+    try:
+        answer, early_analysis = await _stream_answer_async(
+            client, _baseline_params(query), query, start, steps
+        )
+        steps.append("✅ LLM response generated")
         
-        pred = fact[0]
-        args = fact[1:]
+        result = _build_result(answer, query, start, steps, "Baseline",
+                               "Direct LLM (No external knowledge)", BASELINE_STATUS,
+                               early_analysis=early_analysis)
+        return await asyncio.to_thread(_cache_result, "baseline", query, result)
+    
+    except Exception as e:
+        return _build_error_result(str(e), start, steps, "Baseline", "Direct LLM (Failed)")
+
+
+async def experiment_rag_async(query: str, client: AsyncAnthropic) -> dict:
+    """experiment_rag on an AsyncAnthropic client, so it can overlap with other experiments"""
+    start = time.time()
+    cached = await asyncio.to_thread(_cached_result, "rag", query, start)
+    if cached is not None:
+        return cached
+    
+    steps, retrieved_count, params, status_map = _rag_prepare(query)
+
+    try:
+        answer, early_analysis = await _stream_answer_async(client, params, query, start, steps)
+        steps.append("✅ LLM response with policy context generated")
         
-        # Check if predicate exists
-        if pred not in ARITY_MAP:
-            warnings.append(f"⚠️ Unknown predicate: {pred}, skipping")
+        result = _build_result(answer, query, start, steps, "RAG", "Retrieval + LLM",
+                               status_map, retrieved_policies=retrieved_count,
+                               early_analysis=early_analysis)
+        return await asyncio.to_thread(_cache_result, "rag", query, result)
+    
+    except Exception as e:
+        return _build_error_result(str(e), start, steps, "RAG", "Retrieval + LLM (Failed)",
+                                   retrieved_policies=0)
+
+
+def render_kind(result: dict) -> str:
+    """Which details panel a result gets: 'pipeline', 'rag' or 'plain'"""
+    if 'precis_result' in result:
+        return 'pipeline'
+    if 'retrieved_policies' in result:
+        return 'rag'
+    return 'plain'
+
+
+async def run_all(query: str, client: Anthropic, experiments: list = None) -> dict:
+    """
+    Run the selected EXPERIMENTS for one query concurrently
+    
+    Baseline, RAG and the pipeline use the shared AsyncAnthropic client, so
+    this must run on _query_loop() (see run_all_sync); the agentic
+    experiment is blocking and runs in a worker thread.
+    Returns: {experiment key: result}, in the order of `experiments`
+    """
+    from utils.crewai_policy import multi_agent_compliance_system
+    
+    experiments = experiments or list(EXPERIMENTS)
+    async_client = get_async_anthropic_client(client.api_key)
+    
+    runners = {
+        "baseline_no_context": lambda: experiment_baseline_async(query, async_client),
+        "rag": lambda: experiment_rag_async(query, async_client),
+        "pipeline": lambda: experiment_agent4compliance_async(query, async_client),
+        "agentic": lambda: asyncio.to_thread(multi_agent_compliance_system, query, client),
+    }
+    results = await asyncio.gather(*(runners[key]() for key in experiments))
+    
+    # Decided once here so the display does not re-probe the result on every rerun
+    for result in results:
+        result['_render'] = render_kind(result)
+    
+    return dict(zip(experiments, results))
+
+
+def run_all_sync(query: str, client: Anthropic, experiments: list = None) -> dict:
+    """Blocking wrapper around run_all, on the shared query loop"""
+    return asyncio.run_coroutine_threadsafe(run_all(query, client, experiments), _query_loop()).result()
+
+
+def experiment_baseline_batch(queries: list, client: Anthropic) -> list:
+    """Baseline experiment for many queries via the Message Batches API"""
+    start = time.time()
+    items = [(f"q{i}", _baseline_params(query)) for i, query in enumerate(queries)]
+    
+    try:
+        answers = _run_batch(client, items)
+    except Exception as e:
+        return [_build_error_result(str(e), start, ["📦 Batch submission"], "Baseline",
+                                    "Direct LLM (Failed)") for _ in queries]
+    
+    results = []
+    for (custom_id, _), query in zip(items, queries):
+        steps = ["📝 Direct LLM call without external knowledge (batch)"]
+        if custom_id not in answers:
+            results.append(_build_error_result("Batch request did not succeed", start, steps,
+                                               "Baseline", "Direct LLM (Failed)"))
             continue
-        
-        # Validate arity
-        expected_arity = ARITY_MAP[pred]
-        if len(args) != expected_arity:
-            warnings.append(f"⚠️ {pred} expects {expected_arity} args, got {len(args)}, skipping")
+        steps.append("✅ LLM response generated")
+        results.append(_build_result(answers[custom_id], query, start, steps, "Baseline",
+                                     "Direct LLM (No external knowledge)", BASELINE_STATUS))
+    return results
+
+
+def experiment_rag_batch(queries: list, client: Anthropic) -> list:
+    """RAG experiment for many queries via the Message Batches API"""
+    start = time.time()
+    prepared = [_rag_prepare(query) for query in queries]
+    items = [(f"q{i}", params) for i, (_, _, params, _) in enumerate(prepared)]
+    
+    try:
+        answers = _run_batch(client, items)
+    except Exception as e:
+        return [_build_error_result(str(e), start, steps, "RAG", "Retrieval + LLM (Failed)",
+                                    retrieved_policies=0) for steps, *_ in prepared]
+    
+    results = []
+    for (custom_id, _), query, (steps, retrieved_count, _, status_map) in zip(items, queries, prepared):
+        if custom_id not in answers:
+            results.append(_build_error_result("Batch request did not succeed", start, steps,
+                                               "RAG", "Retrieval + LLM (Failed)",
+                                               retrieved_policies=0))
             continue
-        
-        # Validate constants have @ prefix in purpose positions
-        if pred in ['disclose', 'permittedUseOrDisclosure'] and len(args) == 4:
-            purpose = args[3]
-            if not purpose.startswith('@'):
-                warnings.append(f"⚠️ Purpose '{purpose}' missing @, converting to @{purpose}")
-                args[3] = f"@{purpose}"
-        
-        if pred == 'requiredByLaw' and len(args) == 1:
-            purpose = args[0]
-            if not purpose.startswith('@'):
-                warnings.append(f"⚠️ Purpose '{purpose}' missing @, converting to @{purpose}")
-                args[0] = f"@{purpose}"
-        
-        validated_facts.append([pred] + args)
+        steps.append("✅ LLM response with policy context generated")
+        results.append(_build_result(answers[custom_id], query, start, steps, "RAG",
+                                     "Retrieval + LLM", status_map,
+                                     retrieved_policies=retrieved_count))
+    return results
+
+
+def _run_batch(client: Anthropic, items: list) -> dict:
+    """Submit items, wait for the batch to end and return {custom_id: text}"""
+    batch_id = submit_batch(client, items)
+    poll(client, batch_id)
+    return collect(client, batch_id)
+
+
+def run_experiment_queries(exp_key: str, queries: list, client: Anthropic,
+                           execution_mode: str = "auto") -> list:
+    """
+    Run a batch-eligible experiment over many queries
+    
+    execution_mode: "realtime" (one call per query), "batch" (Message Batches API,
+    half price, results arrive asynchronously) or "auto" (batch for
+    BATCH_MIN_QUERIES or more queries)
+    """
+    if not EXPERIMENTS[exp_key].get("batch_eligible"):
+        raise ValueError(f"Experiment {exp_key} does not support batch execution")
+    
+    realtime, batched = {
+        "baseline_no_context": (experiment_baseline, experiment_baseline_batch),
+        "rag": (experiment_rag, experiment_rag_batch),
+    }[exp_key]
+    
+    if execution_mode == "auto":
+        execution_mode = "batch" if len(queries) >= BATCH_MIN_QUERIES else "realtime"
+    
+    if execution_mode == "batch":
+        return batched(queries, client)
+    return [realtime(query, client) for query in queries]
+
+
+async def run_experiments_parallel(queries: list, client: Anthropic) -> list:
+    """
+    Run the baseline and RAG experiments for every query concurrently.
+    The experiments are blocking SDK calls, so each runs in a worker thread.
+    Returns: one [baseline_result, rag_result] pair per query, in query order
+    """
+    tasks = []
+    for query in queries:
+        tasks.append(asyncio.to_thread(experiment_baseline, query, client))
+        tasks.append(asyncio.to_thread(experiment_rag, query, client))
+    
+    results = await asyncio.gather(*tasks)
+    return [list(results[i:i + 2]) for i in range(0, len(results), 2)]
+
+
+# Predicate -> argument position that must hold an @-prefixed purpose constant
+PURPOSE_ARG_POSITION = {
+    'disclose': 3,
+    'permittedUseOrDisclosure': 3,
+    'requiredByLaw': 0,
+}
+
+
+# Minimal facts used when extraction fails or yields nothing valid. Handed
+# out as lists via _fallback_facts(), like every other facts list, so their
+# repr in prompts and cache keys doesn't depend on which path produced them
+_FALLBACK_FACTS = (
+    ("coveredEntity", "Entity1"),
+    ("protectedHealthInfo", "PHI1"),
+)
+
+
+def _fallback_facts() -> list:
+    return [list(fact) for fact in _FALLBACK_FACTS]
+
+
+def _prefix_purpose(pred: str, args: list, warnings: list) -> list:
+    """Add the missing @ to the purpose argument of pred, recording a warning"""
+    pos = PURPOSE_ARG_POSITION[pred]
+    purpose = args[pos]
+    if purpose.startswith('@'):
+        return args
+    warnings.append(f"⚠️ Purpose '{purpose}' missing @, converting to @{purpose}")
+    return args[:pos] + [f"@{purpose}"] + args[pos + 1:]
+
+
+def validate_facts(extracted_facts: list) -> tuple:
+    """Validate fact structure and return (valid_facts, warnings)"""
+    
+    import pandas as pd
+    
+    structured = [isinstance(f, list) and len(f) >= 2 for f in extracted_facts]
+    args = [f[1:] if ok else [] for f, ok in zip(extracted_facts, structured)]
+    facts_df = pd.DataFrame({
+        "pred": pd.Series([f[0] if ok else None for f, ok in zip(extracted_facts, structured)], dtype=object),
+        "n_args": pd.Series([len(a) for a in args], dtype="int64"),
+        "structured": pd.Series(structured, dtype=bool),
+    })
+    
+    # Predicate existence and arity, checked column-wise
+    facts_df["expected"] = facts_df["pred"].map(ARITY_MAP)
+    known = facts_df["structured"] & facts_df["expected"].notna()
+    arity_ok = known & (facts_df["expected"] == facts_df["n_args"])
+    
+    # Rejection warnings, reported in input order
+    row_warnings = {}
+    for i in facts_df.index[~facts_df["structured"]]:
+        row_warnings[i] = [f"⚠️ Invalid fact structure: {extracted_facts[i]}, skipping"]
+    for i in facts_df.index[facts_df["structured"] & ~known]:
+        row_warnings[i] = [f"⚠️ Unknown predicate: {facts_df.at[i, 'pred']}, skipping"]
+    for i in facts_df.index[known & ~arity_ok]:
+        row_warnings[i] = [
+            f"⚠️ {facts_df.at[i, 'pred']} expects {int(facts_df.at[i, 'expected'])} args, "
+            f"got {facts_df.at[i, 'n_args']}, skipping"
+        ]
+    
+    # Validate constants have @ prefix in purpose positions (only the purpose-bearing slice)
+    needs_purpose = arity_ok & facts_df["pred"].isin(list(PURPOSE_ARG_POSITION))
+    for i in facts_df.index[needs_purpose]:
+        args[i] = _prefix_purpose(facts_df.at[i, "pred"], args[i], row_warnings.setdefault(i, []))
+    
+    warnings = [w for i in sorted(row_warnings) for w in row_warnings[i]]
+    validated_facts = [[facts_df.at[i, "pred"]] + args[i] for i in facts_df.index[arity_ok]]
     
     # Ensure minimum facts
     if not validated_facts:
         warnings.append("⚠️ No valid facts extracted, using minimal fallback")
-        validated_facts = [
-            ["coveredEntity", "Entity1"],
-            ["protectedHealthInfo", "PHI1"]
-        ]
+        validated_facts = _fallback_facts()
     
     return validated_facts, warnings
 
@@ -577,8 +1478,7 @@ def validate_and_fix_formula(formula: str) -> tuple:
     if ' = @' in formula or '= @' in formula or 'purposeIsPurpose' in formula:
         warnings.append("⚠️ Formula contains purpose comparison, removing it...")
         # Remove "and purpose = @Treatment" or "and purposeIsPurpose(...)"
-        formula = re.sub(r'\s+and\s+\w+\s*=\s*@\w+', '', formula)
-        formula = re.sub(r'\s+and\s+purposeIsPurpose\([^)]+\)', '', formula)
+        formula = _CLEAN_RE.sub('', formula)
     
     # Check for unbound variables
     declared_vars = set()
@@ -591,12 +1491,10 @@ def validate_and_fix_formula(formula: str) -> tuple:
             warnings.append("⚠️ Could not parse forall clause")
     
     # Find all variables in formula body
-    all_vars_in_body = set(re.findall(r'\b([a-z_][a-z0-9_]*)\b', formula))
+    all_vars_in_body = set(_IDENT_RE.findall(formula))
     
     # Remove keywords and predicates
-    keywords = {'forall', 'exists', 'and', 'or', 'implies', 'not', 'iff', 'xor', 'true', 'false'}
-    predicates = {p.lower() for p in ARITY_MAP.keys()}
-    used_vars = all_vars_in_body - keywords - predicates
+    used_vars = all_vars_in_body - _FORMULA_KEYWORDS - _PREDICATES_LC
     
     # Check for unbound variables
     unbound = used_vars - declared_vars
@@ -610,21 +1508,39 @@ def validate_and_fix_formula(formula: str) -> tuple:
 # MAIN EXPERIMENT FUNCTION
 # ============================================
 
-def experiment_agent4compliance(query: str, client: Anthropic) -> dict:
-    """
-    Complete pipeline with proper validation and error handling
-    """
-    start = time.time()
-    steps = []
-    
-    # =====================================
-    # STEP 1: LLM1 - Fact Extraction
-    # =====================================
-    steps.append("🔍 LLM1: Extracting facts from query...")
-    
-    extract_prompt = f"""You are a HIPAA compliance expert. Extract ALL relevant entities and facts from this question.
+# The translation prompt pins every question to this one formula, so the
+# pipeline uses it directly and only asks the LLM when the facts fall
+# outside the predicates it covers
+CANONICAL_HIPAA_FORMULA = (
+    "forall ce, recipient, phi, purpose. "
+    "(coveredEntity(ce) and protectedHealthInfo(phi) and disclose(ce, recipient, phi, purpose)) "
+    "implies (permittedUseOrDisclosure(ce, recipient, phi, purpose) "
+    "or hasAuthorization(ce, recipient, phi) or requiredByLaw(purpose))"
+)
+CANONICAL_FORMULA_PREDICATES = frozenset({
+    'coveredEntity', 'protectedHealthInfo', 'publicHealthAuthority',
+    'disclose', 'permittedUseOrDisclosure', 'hasAuthorization', 'requiredByLaw',
+})
 
-Question: {query}
+
+def needs_custom_formula(validated_facts: list) -> bool:
+    """True if any fact uses a predicate the canonical formula doesn't account for"""
+    return any(fact[0] not in CANONICAL_FORMULA_PREDICATES for fact in validated_facts)
+
+
+# Models and output caps per pipeline step. Extraction and the formula fix
+# emit short, tightly specified text, so they run on the faster model; caps
+# sit a little above typical output (extraction also stops at the end of its JSON)
+AGENT4_MODEL = "claude-sonnet-4-20250514"
+AGENT4_FAST_MODEL = "claude-haiku-4-5-20251001"
+AGENT4_EXTRACT_TOKENS = 300
+AGENT4_TRANSLATE_TOKENS = 200
+AGENT4_FIX_TOKENS = 150
+AGENT4_EXPLAIN_TOKENS = 300
+
+# Static instructions for the pipeline's LLM calls, sent as cacheable system
+# blocks; only the query-specific parts go in the user turn
+AGENT4_EXTRACT_SYSTEM = """You are a HIPAA compliance expert. Extract ALL relevant entities and facts from the user's question.
 
 CRITICAL: Extract facts that describe the ACTUAL SCENARIO, not hypothetical rules.
 
@@ -696,57 +1612,16 @@ Facts:
     ["disclose", "Provider1", "FamilyMember1", "XRay1", "@Research"]
 ]
 
-Now extract from: {query}
-
 Output ONLY valid JSON:
-{{
+{
     "entities": ["entity1", "entity2", ...],
     "facts": [
         ["predicate", "arg1", "arg2", ...],
         ...
     ]
-}}
-"""
-    
-    try:
-        message = client.messages.create(
-            model="claude-sonnet-4-20250514",
-            max_tokens=500,
-            messages=[{"role": "user", "content": extract_prompt}]
-        )
-        
-        facts_text = message.content[0].text
-        
-        # Parse JSON
-        json_match = re.search(r'\{.*\}', facts_text, re.DOTALL)
-        if not json_match:
-            raise ValueError("No JSON found in LLM response")
-        
-        facts_json = json.loads(json_match.group())
-        extracted_facts = facts_json.get("facts", [])
-        
-        # Validate facts
-        validated_facts, fact_warnings = validate_facts(extracted_facts)
-        steps.extend(fact_warnings)
-        
-        steps.append(f"✅ Extracted and validated {len(validated_facts)} facts")
-        
-    except Exception as e:
-        steps.append(f"❌ Fact extraction failed: {e}")
-        validated_facts = [
-            ["coveredEntity", "Entity1"],
-            ["protectedHealthInfo", "PHI1"]
-        ]
-    
-    # =====================================
-    # STEP 2: LLM1 - Formula Translation
-    # =====================================
-    steps.append("📐 LLM1: Translating to formal logic...")
-    
-    translate_prompt = f"""You are translating a compliance question into first-order logic.
+}"""
 
-Question: {query}
-Extracted Facts: {validated_facts}
+AGENT4_TRANSLATE_SYSTEM = """You are translating a compliance question into first-order logic.
 
 CRITICAL RULES:
 1. Start with "forall" listing ALL variables used in formula
@@ -788,235 +1663,854 @@ Q: "Can hospital report to public health?"
 Formula:
 forall ce, recipient, phi, purpose. (coveredEntity(ce) and protectedHealthInfo(phi) and disclose(ce, recipient, phi, purpose)) implies (permittedUseOrDisclosure(ce, recipient, phi, purpose) or hasAuthorization(ce, recipient, phi) or requiredByLaw(purpose))
 
-Now translate: {query}
+CRITICAL: 
+- Use the EXACT template above
+- DO NOT add "purpose = @Something" anywhere
+- DO NOT use purposeIsPurpose
+- The purpose checking happens in the FACTS, not the formula
+
+Output ONLY the formula, no explanation:"""
+
+AGENT4_FIX_TMPL = """This formula has unbound variables: {unbound_vars}
+
+Formula: {formula}
+
+Add ALL missing variables to the forall clause at the start.
+
+RULE: Every variable used in the formula body MUST appear in the forall clause.
+
+Example:
+BAD:  forall x. ... someVar ...
+GOOD: forall x, someVar. ... someVar ...
+
+Output ONLY the corrected formula:"""
+
+AGENT4_EXPLAIN_SYSTEM = """Explain a compliance verification result to a non-technical user. You are given the question, the facts extracted from it, the formula checked and the verification result.
+
+Provide:
+1. Direct YES/NO answer to user's question
+2. Brief explanation (2-3 sentences) of why
+3. Cite specific HIPAA section: §164.502(a)(1)(i)
+4. Actionable guidance if needed
+
+Keep it simple and clear."""
+
+# Batched variants: same instructions, but the user turn holds numbered items
+# and the answer is one {"results": [...]} object keyed by item number
+AGENT4_BATCH_EXTRACT_SYSTEM = AGENT4_EXTRACT_SYSTEM.rpartition("Output ONLY valid JSON:")[0] + """The user sends several numbered questions. Extract the facts for EACH question separately, as above.
+
+Output ONLY valid JSON, one entry per question:
+{
+    "results": [
+        {"id": 1, "facts": [["predicate", "arg1", "arg2", ...], ...]},
+        ...
+    ]
+}"""
+
+AGENT4_BATCH_EXPLAIN_SYSTEM = AGENT4_EXPLAIN_SYSTEM + """
+
+The user sends several numbered verification results. Explain EACH one separately, as above.
+
+Output ONLY valid JSON, one entry per result:
+{"results": [{"id": 1, "explanation": "..."}, ...]}"""
+
+
+class _StepLog(list):
+    """
+    Progress messages for the UI, formatted lazily: append(msg, *args) only
+    runs msg.format(*args) when the log is enabled; a disabled log stays empty
+    """
+    
+    def __init__(self, enabled: bool = True):
+        super().__init__()
+        self.enabled = enabled
+    
+    def append(self, msg: str, *args):
+        if self.enabled:
+            super().append(msg.format(*args) if args else msg)
+    
+    def extend(self, msgs):
+        if self.enabled:
+            super().extend(msgs)
+
+
+def _agent4_extract_params(query: str) -> dict:
+    """messages.create arguments for the fact extraction call"""
+    return {
+        "model": AGENT4_FAST_MODEL,
+        "max_tokens": AGENT4_EXTRACT_TOKENS,
+        "system": _cached_system(AGENT4_EXTRACT_SYSTEM),
+        "messages": [{"role": "user", "content": f"Now extract from: {query}"}],
+    }
+
+
+class _JsonObjectEnd:
+    """Feed text chunks; reports the offset just past the first top-level {...} object"""
+    
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+    
+    def feed(self, text: str):
+        for i, ch in enumerate(text):
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == '\\':
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = self.depth > 0
+            elif ch == '{':
+                self.depth += 1
+            elif ch == '}' and self.depth > 0:
+                self.depth -= 1
+                if self.depth == 0:
+                    return i + 1
+        return None
+
+
+def _stream_json_object(client: Anthropic, params: dict) -> str:
+    """Stream a response, closing the stream once its first JSON object is complete"""
+    chunks = []
+    scanner = _JsonObjectEnd()
+    
+    with client.messages.stream(**params) as stream:
+        for text in stream.text_stream:
+            end = scanner.feed(text)
+            if end is not None:
+                chunks.append(text[:end])
+                break
+            chunks.append(text)
+    
+    return "".join(chunks)
+
+
+def _first_json_object(text: str):
+    """The first balanced {...} object in text, in one pass; None if there is none"""
+    end = _JsonObjectEnd().feed(text)
+    if end is None:
+        return None
+    return text[text.find('{'):end]
+
+
+async def _stream_json_object_async(client: AsyncAnthropic, params: dict) -> str:
+    """Async counterpart of _stream_json_object"""
+    chunks = []
+    scanner = _JsonObjectEnd()
+    
+    async with client.messages.stream(**params) as stream:
+        async for text in stream.text_stream:
+            end = scanner.feed(text)
+            if end is not None:
+                chunks.append(text[:end])
+                break
+            chunks.append(text)
+    
+    return "".join(chunks)
+
+
+def _agent4_parse_facts(facts_text: str, steps: list) -> list:
+    """Parse and validate the extracted facts; raises if the response has no JSON"""
+    json_text = _first_json_object(facts_text)
+    if json_text is None:
+        raise ValueError("No JSON found in LLM response")
+    
+    facts_json = json_loads(json_text)
+    extracted_facts = facts_json.get("facts", [])
+    
+    # Validate facts
+    validated_facts, fact_warnings = validate_facts(extracted_facts)
+    steps.extend(fact_warnings)
+    
+    steps.append("✅ Extracted and validated {} facts", len(validated_facts))
+    return validated_facts
+
+
+def _agent4_fallback_facts(error: Exception, steps: list) -> list:
+    steps.append("❌ Fact extraction failed: {}", error)
+    return _fallback_facts()
+
+
+def _agent4_translate_params(query: str, validated_facts: list) -> dict:
+    """messages.create arguments for the formula translation call"""
+    return {
+        "model": AGENT4_MODEL,
+        "max_tokens": AGENT4_TRANSLATE_TOKENS,
+        "system": _cached_system(AGENT4_TRANSLATE_SYSTEM),
+        "messages": [{
+            "role": "user",
+            "content": f"Question: {query}\nExtracted Facts: {validated_facts}\n\nNow translate: {query}"
+        }],
+    }
+
+
+def _agent4_clean_formula(formula: str, steps: list) -> tuple:
+    """Strip code fences, validate and fix; returns (formula, unbound_vars)"""
+    formula = formula.strip()
+    
+    if "```" in formula:
+        match = _CODEBLOCK_RE.search(formula)
+        if match:
+            formula = match.group(1).strip()
+    
+    formula = formula.split('\n')[0].strip()
+    
+    fixed_formula, formula_warnings, unbound_vars = validate_and_fix_formula(formula)
+    steps.extend(formula_warnings)
+    return fixed_formula, unbound_vars
+
+
+def _agent4_fix_params(formula: str, unbound_vars: list) -> dict:
+    """messages.create arguments for the unbound-variable fix call"""
+    return {
+        "model": AGENT4_FAST_MODEL,
+        "max_tokens": AGENT4_FIX_TOKENS,
+        "messages": [{
+            "role": "user",
+            "content": AGENT4_FIX_TMPL.format(unbound_vars=unbound_vars, formula=formula)
+        }],
+    }
+
+
+def _agent4_fallback_formula(error: Exception, steps: list) -> str:
+    steps.append("❌ Formula translation failed: {}", error)
+    return CANONICAL_HIPAA_FORMULA
+
+
+def _wrap_hipaa_policy(formula: str) -> str:
+    return f"""regulation HIPAA version "1.0"
+policy starts
+{formula}
+;
+policy ends"""
+
+
+# The canonical request serialised once; only the facts differ between calls
+_FACTS_SENTINEL = b'"__FACTS__"'
+_CANONICAL_PRECIS_TEMPLATE = json_dumps_bytes({
+    "formula": _wrap_hipaa_policy(CANONICAL_HIPAA_FORMULA),
+    "facts": {
+        "facts": "__FACTS__"
+    },
+    "regulation": "HIPAA"
+})
+
+
+def _agent4_precis_payload(formula: str, validated_facts: list) -> bytes:
+    """Serialised Précis input: the formula wrapped in a HIPAA policy block"""
+    
+    facts_for_ocaml = _precis_facts(validated_facts)
+    
+    if formula == CANONICAL_HIPAA_FORMULA:
+        return _CANONICAL_PRECIS_TEMPLATE.replace(_FACTS_SENTINEL, json_dumps_bytes(facts_for_ocaml))
+    
+    return json_dumps_bytes({
+        "formula": _wrap_hipaa_policy(formula),
+        "facts": {
+            "facts": facts_for_ocaml
+        },
+        "regulation": "HIPAA"
+    })
+
+
+def _agent4_precis_result(returncode: int, precis_output: str, precis_error: str,
+                          precis_json: dict = None) -> tuple:
+    """Interpret a finished Précis run (precis_json: output already parsed); returns (verified, precis_result)"""
+    if returncode != 0 or not precis_output.strip():
+        return False, {
+            "success": False,
+            "output": precis_output,
+            "error": precis_error,
+            "pipeline_steps": ["❌ Précis execution failed"]
+        }
+    
+    try:
+        if precis_json is None:
+            precis_json = json_loads(precis_output)
+    except json.JSONDecodeError:
+        return False, {
+            "success": False,
+            "output": precis_output,
+            "error": f"JSON parse failed: {precis_output[:200]}",
+            "pipeline_steps": ["❌ JSON parsing failed"]
+        }
+    
+    # Check evaluation result
+    verified = False
+    if "evaluations" in precis_json and len(precis_json["evaluations"]) > 0:
+        eval_result = precis_json["evaluations"][0].get("evaluation", {})
+        verified = eval_result.get("result") == "true"
+    
+    pipeline_steps = [
+        "✅ Step 1: Parsing (Lexer → Parser → AST)",
+        "✅ Step 2: Type Checking",
+        "✅ Step 3: Evaluation Engine",
+        "✅ Step 4: Results Generated",
+    ]
+    
+    if verified:
+        pipeline_steps.append("✅ Verification: PASSED")
+    else:
+        pipeline_steps.append("❌ Verification: FAILED")
+    
+    # Raw engine output; the display layer pretty-prints it on demand
+    return verified, {
+        "success": True,
+        "output": precis_output,
+        "error": "",
+        "pipeline_steps": pipeline_steps,
+        "json_response": precis_json
+    }
+
+
+def _agent4_explain_system(validated_facts: list, formula: str) -> list:
+    """
+    System blocks for the explanation call: the fixed instructions (cache prefix),
+    then this query's facts/formula; the verdict goes in the user turn
+    """
+    return _cached_system(
+        AGENT4_EXPLAIN_SYSTEM, f"Facts Extracted: {validated_facts}\nFormula Checked: {formula}"
+    )
+
+
+def _agent4_explain_params(query: str, explain_system: list, verified: bool) -> dict:
+    """messages.create arguments for the explanation call"""
+    return {
+        "model": AGENT4_MODEL,
+        "max_tokens": AGENT4_EXPLAIN_TOKENS,
+        "system": explain_system,
+        "messages": [{
+            "role": "user",
+            "content": f"Question: {query}\n"
+                       f"Verification Result: {'PASSED (Compliant)' if verified else 'FAILED (Violation)'}"
+        }],
+    }
+
+
+def _agent4_result(explanation: str, start: float, steps: list, validated_facts: list,
+                   formula: str, precis_result: dict, verified: bool) -> dict:
+    return {
+        "name": "Pipeline4Compliance ⭐",
+        "answer": explanation,
+        "duration": time.time() - start,
+        "steps": steps,
+        "extracted_facts": validated_facts,
+        "formula": formula,
+        "precis_result": precis_result,
+        "verified": verified,
+        "method": "LLM1 (Extract+Translate) → OCaml Précis → LLM2 (Explain)",
+        "compliance_status": "✅ COMPLIANT" if verified else "❌ VIOLATION"
+    }
+
+
+# Précis results and explanations for inputs already seen, keyed by a hash of
+# the request; least recently used entries are dropped past AGENT4_CACHE_SIZE
+AGENT4_CACHE_SIZE = 1024
+_PRECIS_RESULT_CACHE = OrderedDict()
+_EXPLAIN_CACHE = OrderedDict()
+_AGENT4_CACHE_LOCK = threading.Lock()
+
+
+def _payload_key(payload: bytes) -> bytes:
+    return hashlib.blake2b(payload, digest_size=16).digest()
+
+
+def _cache_key(*parts) -> bytes:
+    return _payload_key(json_dumps_bytes(parts))
+
+
+def _lru_get(cache: OrderedDict, key: bytes):
+    with _AGENT4_CACHE_LOCK:
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+        return value
+
+
+def _lru_put(cache: OrderedDict, key: bytes, value):
+    with _AGENT4_CACHE_LOCK:
+        cache[key] = value
+        cache.move_to_end(key)
+        if len(cache) > AGENT4_CACHE_SIZE:
+            cache.popitem(last=False)
+
+
+def _agent4_translate(query: str, validated_facts: list, client: Anthropic, steps: list) -> str:
+    """STEP 2 for one query, with the unbound-variable fix retry"""
+    try:
+        message = client.messages.create(**_agent4_translate_params(query, validated_facts))
+        formula, unbound_vars = _agent4_clean_formula(message.content[0].text, steps)
+        
+        if unbound_vars:
+            steps.append("🔧 Fixing unbound variables: {}", unbound_vars)
+            fix_message = client.messages.create(**_agent4_fix_params(formula, unbound_vars))
+            formula = fix_message.content[0].text.strip()
+            steps.append("✅ Formula fixed")
+        
+        steps.append("✅ Formula: {:.100}...", formula)
+        return formula
+    
+    except Exception as e:
+        return _agent4_fallback_formula(e, steps)
+
+
+def _agent4_formula(query: str, validated_facts: list, client: Anthropic, steps: list) -> str:
+    """STEP 2: the canonical formula, or an LLM translation when the facts need one"""
+    if not needs_custom_formula(validated_facts):
+        steps.append("📐 Using canonical HIPAA formula")
+        return CANONICAL_HIPAA_FORMULA
+    
+    steps.append("📐 LLM1: Translating to formal logic...")
+    return _agent4_translate(query, validated_facts, client, steps)
+
+
+def _agent4_run_precis(formula: str, validated_facts: list) -> tuple:
+    """STEP 3: check the wrapped formula on the shared Précis server; returns (verified, precis_result)"""
+    payload = _agent4_precis_payload(formula, validated_facts)
+    key = _payload_key(payload)
+    cached = _lru_get(_PRECIS_RESULT_CACHE, key)
+    if cached is not None:
+        return cached[0], dict(cached[1])
+    
+    reply = _precis_exchange(payload)
+    if not reply["success"]:
+        return _agent4_precis_result(1, "", reply["error"])
+    
+    verified, precis_result = _agent4_precis_result(0, reply["output"], "", reply["response"])
+    if precis_result["success"]:
+        _lru_put(_PRECIS_RESULT_CACHE, key, (verified, precis_result))
+    return verified, dict(precis_result)
+
+
+def _agent4_explain(query: str, validated_facts: list, formula: str, verified: bool,
+                    client: Anthropic) -> str:
+    """STEP 4, reusing the explanation of an identical earlier check"""
+    key = _cache_key(query, validated_facts, formula, verified)
+    cached = _lru_get(_EXPLAIN_CACHE, key)
+    if cached is not None:
+        return cached
+    
+    try:
+        message = client.messages.create(**_agent4_explain_params(
+            query, _agent4_explain_system(validated_facts, formula), verified
+        ))
+    except Exception as e:
+        return f"Unable to generate explanation: {e}"
+    
+    explanation = message.content[0].text
+    _lru_put(_EXPLAIN_CACHE, key, explanation)
+    return explanation
+
+
+def experiment_agent4compliance(query: str, client: Anthropic, verbose: bool = True) -> dict:
+    """
+    Complete pipeline with proper validation and error handling
+    
+    verbose=False skips building the step log (headless evaluation runs)
+    """
+    start = time.time()
+    steps = _StepLog(verbose)
+    
+    # =====================================
+    # STEP 1: LLM1 - Fact Extraction
+    # =====================================
+    steps.append("🔍 LLM1: Extracting facts from query...")
+    
+    try:
+        facts_text = _stream_json_object(client, _agent4_extract_params(query))
+        validated_facts = _agent4_parse_facts(facts_text, steps)
+    except Exception as e:
+        validated_facts = _agent4_fallback_facts(e, steps)
+    
+    # =====================================
+    # STEP 2: LLM1 - Formula Translation
+    # =====================================
+    formula = _agent4_formula(query, validated_facts, client, steps)
+    
+    # =====================================
+    # STEP 3: Call OCaml Précis
+    # =====================================
+    steps.append("⚙️ Calling OCaml Précis engine...")
+    
+    verified, precis_result = _agent4_run_precis(formula, validated_facts)
+    
+    steps.append("✅ OCaml processing complete")
+    
+    # =====================================
+    # STEP 4: LLM2 - Generate Explanation
+    # =====================================
+    steps.append("💬 LLM2: Generating explanation...")
+    
+    explanation = _agent4_explain(query, validated_facts, formula, verified, client)
+    
+    return _agent4_result(explanation, start, steps, validated_facts, formula,
+                          precis_result, verified)
+
+
+
+# Per-query output budgets for the batched pipeline calls, and the most
+# queries sent in one call (keeps max_tokens well inside the non-streaming limit)
+AGENT4_BATCH_EXTRACT_TOKENS = AGENT4_EXTRACT_TOKENS
+AGENT4_BATCH_EXPLAIN_TOKENS = AGENT4_EXPLAIN_TOKENS
+AGENT4_BATCH_SIZE = 10
+
+
+def _numbered(items: list) -> str:
+    return "\n\n".join(f"{i}. {item}" for i, item in enumerate(items, 1))
+
+
+def _parse_batch_results(text: str, field: str, n: int) -> list:
+    """
+    Split a {"results": [{"id": i, field: ...}, ...]} response back per item
+    Returns: list of length n, None where the model skipped an id
+    """
+    json_text = _first_json_object(text)
+    if json_text is None:
+        raise ValueError("No JSON found in LLM response")
+    
+    out = [None] * n
+    for entry in json_loads(json_text).get("results", []):
+        idx = entry.get("id")
+        if isinstance(idx, int) and 1 <= idx <= n:
+            out[idx - 1] = entry.get(field)
+    return out
+
+
+def _agent4_extract_batch(queries: list, client: Anthropic) -> list:
+    """One extraction call for up to AGENT4_BATCH_SIZE queries; the exception per item on failure"""
+    try:
+        facts_text = _stream_json_object(client, dict(
+            model=AGENT4_FAST_MODEL,
+            max_tokens=AGENT4_BATCH_EXTRACT_TOKENS * len(queries),
+            system=_cached_system(AGENT4_BATCH_EXTRACT_SYSTEM),
+            messages=[{
+                "role": "user",
+                "content": f"Now extract from each question:\n\n{_numbered(queries)}"
+            }]
+        ))
+        return _parse_batch_results(facts_text, "facts", len(queries))
+    except Exception as e:
+        return [e] * len(queries)
 
-CRITICAL: 
-- Use the EXACT template above
-- DO NOT add "purpose = @Something" anywhere
-- DO NOT use purposeIsPurpose
-- The purpose checking happens in the FACTS, not the formula
 
-Output ONLY the formula, no explanation:"""
-    
+def _agent4_explain_batch(items: list, client: Anthropic) -> list:
+    """One explanation call for up to AGENT4_BATCH_SIZE results; the exception per item on failure"""
     try:
         message = client.messages.create(
-            model="claude-sonnet-4-20250514",
-            max_tokens=300,
-            messages=[{"role": "user", "content": translate_prompt}]
+            model=AGENT4_MODEL,
+            max_tokens=AGENT4_BATCH_EXPLAIN_TOKENS * len(items),
+            system=_cached_system(AGENT4_BATCH_EXPLAIN_SYSTEM),
+            messages=[{
+                "role": "user",
+                "content": f"Explain each verification result:\n\n{_numbered(items)}"
+            }]
         )
+        return _parse_batch_results(message.content[0].text, "explanation", len(items))
+    except Exception as e:
+        return [e] * len(items)
+
+
+def _agent4_batched(call, items: list, client: Anthropic, pool: ThreadPoolExecutor) -> list:
+    """Run call over AGENT4_BATCH_SIZE chunks of items concurrently; results in item order"""
+    chunks = [items[i:i + AGENT4_BATCH_SIZE] for i in range(0, len(items), AGENT4_BATCH_SIZE)]
+    return [out for chunk_out in pool.map(call, chunks, [client] * len(chunks)) for out in chunk_out]
+
+
+def experiment_agent4compliance_batch(queries: list, client: Anthropic, verbose: bool = True) -> list:
+    """
+    experiment_agent4compliance for many queries at once
+    
+    Fact extraction and explanation are one LLM call per AGENT4_BATCH_SIZE
+    queries; translation and Précis run per query in a thread pool.
+    Returns: one result per query, in query order
+    """
+    start = time.time()
+    n = len(queries)
+    if not n:
+        return []
+    all_steps = [_StepLog(verbose) for _ in queries]
+    for steps in all_steps:
+        steps.append("🔍 LLM1: Extracting facts from query (batched)...")
+    
+    with ThreadPoolExecutor(max_workers=min(n, 8)) as pool:
+        # STEP 1: one extraction call per batch of queries
+        batch_facts = _agent4_batched(_agent4_extract_batch, queries, client, pool)
         
-        formula = message.content[0].text.strip()
+        all_facts = []
+        for facts, steps in zip(batch_facts, all_steps):
+            if isinstance(facts, Exception):
+                all_facts.append(_agent4_fallback_facts(facts, steps))
+            elif facts is None:
+                all_facts.append(_agent4_fallback_facts(ValueError("missing from batch response"), steps))
+            else:
+                validated_facts, fact_warnings = validate_facts(facts)
+                steps.extend(fact_warnings)
+                steps.append("✅ Extracted and validated {} facts", len(validated_facts))
+                all_facts.append(validated_facts)
         
-        # Clean up formula
-        if "```" in formula:
-            match = re.search(r'```.*?\n(.*?)\n```', formula, re.DOTALL)
-            if match:
-                formula = match.group(1).strip()
+        # STEPS 2-3: translation and Précis are independent per query
+        def translate_and_verify(i):
+            steps = all_steps[i]
+            formula = _agent4_formula(queries[i], all_facts[i], client, steps)
+            steps.append("⚙️ Calling OCaml Précis engine...")
+            verified, precis_result = _agent4_run_precis(formula, all_facts[i])
+            steps.append("✅ OCaml processing complete")
+            return formula, verified, precis_result
         
-        formula = formula.split('\n')[0].strip()
+        checked = list(pool.map(translate_and_verify, range(n)))
         
-        # Validate and fix formula
-        fixed_formula, formula_warnings, unbound_vars = validate_and_fix_formula(formula)
-        steps.extend(formula_warnings)
+        # STEP 4: one explanation call per batch of queries
+        for steps in all_steps:
+            steps.append("💬 LLM2: Generating explanation (batched)...")
         
-        # If unbound variables detected, ask LLM to fix
-        if unbound_vars:
-            steps.append(f"🔧 Fixing unbound variables: {unbound_vars}")
-            
-            fix_prompt = f"""This formula has unbound variables: {unbound_vars}
-
-Formula: {fixed_formula}
-
-Add ALL missing variables to the forall clause at the start.
-
-RULE: Every variable used in the formula body MUST appear in the forall clause.
+        items = [
+            f"Question: {query}\nFacts Extracted: {facts}\nFormula Checked: {formula}\n"
+            f"Verification Result: {'PASSED (Compliant)' if verified else 'FAILED (Violation)'}"
+            for query, facts, (formula, verified, _) in zip(queries, all_facts, checked)
+        ]
+        explanations = _agent4_batched(_agent4_explain_batch, items, client, pool)
+    
+    results = []
+    for i, (formula, verified, precis_result) in enumerate(checked):
+        explanation = explanations[i]
+        if isinstance(explanation, Exception) or explanation is None:
+            explanation = f"Unable to generate explanation: {explanation or 'missing from batch response'}"
+        results.append(_agent4_result(explanation, start, all_steps[i], all_facts[i], formula,
+                                      precis_result, verified))
+    return results
 
-Example:
-BAD:  forall x. ... someVar ...
-GOOD: forall x, someVar. ... someVar ...
 
-Output ONLY the corrected formula:"""
-            
-            fix_message = client.messages.create(
-                model="claude-sonnet-4-20250514",
-                max_tokens=200,
-                messages=[{"role": "user", "content": fix_prompt}]
-            )
-            fixed_formula = fix_message.content[0].text.strip()
-            steps.append("✅ Formula fixed")
+async def _agent4_translate_async(query: str, validated_facts: list, client: AsyncAnthropic,
+                                  steps: list) -> str:
+    """Async counterpart of _agent4_translate"""
+    try:
+        message = await client.messages.create(**_agent4_translate_params(query, validated_facts))
+        formula, unbound_vars = _agent4_clean_formula(message.content[0].text, steps)
         
-        formula = fixed_formula
-        steps.append(f"✅ Formula: {formula[:100]}...")
+        if unbound_vars:
+            steps.append("🔧 Fixing unbound variables: {}", unbound_vars)
+            fix_message = await client.messages.create(**_agent4_fix_params(formula, unbound_vars))
+            formula = fix_message.content[0].text.strip()
+            steps.append("✅ Formula fixed")
         
+        steps.append("✅ Formula: {:.100}...", formula)
+        return formula
+    
     except Exception as e:
-        steps.append(f"❌ Formula translation failed: {e}")
-        # Fallback to basic template
-        formula = "forall ce, recipient, phi, purpose. (coveredEntity(ce) and protectedHealthInfo(phi) and disclose(ce, recipient, phi, purpose)) implies (permittedUseOrDisclosure(ce, recipient, phi, purpose) or hasAuthorization(ce, recipient, phi) or requiredByLaw(purpose))"
+        return _agent4_fallback_formula(e, steps)
+
+
+async def experiment_agent4compliance_async(query: str, client: AsyncAnthropic,
+                                            verbose: bool = True) -> dict:
+    """
+    experiment_agent4compliance on an AsyncAnthropic client
     
-    # =====================================
-    # STEP 3: Call OCaml Précis
-    # =====================================
-    steps.append("⚙️ Calling OCaml Précis engine...")
+    Précis runs on the same shared server as the blocking pipeline
+    (_agent4_run_precis), in a worker thread.
+    """
+    start = time.time()
+    steps = _StepLog(verbose)
     
-    verified = False
-    precis_result = {
-        "success": False,
-        "output": "",
-        "error": "Not executed",
-        "pipeline_steps": []
-    }
+    # STEP 1: LLM1 - Fact Extraction
+    steps.append("🔍 LLM1: Extracting facts from query...")
     
-    # Prepare facts for OCaml
-    facts_for_ocaml = []
-    for fact in validated_facts:
-        if len(fact) >= 2:
-            facts_for_ocaml.append({
-                "predicate": fact[0],
-                "arguments": fact[1:]
-            })
-    
-    # Wrap formula in policy structure
-    wrapped_formula = f"""regulation HIPAA version "1.0"
-policy starts
-{formula}
-;
-policy ends"""
+    try:
+        facts_text = await _stream_json_object_async(client, _agent4_extract_params(query))
+        validated_facts = _agent4_parse_facts(facts_text, steps)
+    except Exception as e:
+        validated_facts = _agent4_fallback_facts(e, steps)
     
-    # Build request
-    precis_request = {
-        "formula": wrapped_formula,
-        "facts": {
-            "facts": facts_for_ocaml
-        },
-        "regulation": "HIPAA"
-    }
+    # STEP 2: LLM1 - Formula Translation (only for non-canonical facts)
+    if not needs_custom_formula(validated_facts):
+        steps.append("📐 Using canonical HIPAA formula")
+        formula = CANONICAL_HIPAA_FORMULA
+    else:
+        steps.append("📐 LLM1: Translating to formal logic...")
+        formula = await _agent4_translate_async(query, validated_facts, client, steps)
     
-    try:
-        proc = subprocess.Popen(
-            [PRECIS_PATH, "json"],
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            cwd=os.path.dirname(PRECIS_PATH) if os.path.dirname(PRECIS_PATH) else "."
-        )
-        
-        precis_output, precis_error = proc.communicate(
-            input=json.dumps(precis_request),
-            timeout=30
-        )
-        
-        if proc.returncode == 0 and precis_output.strip():
-            try:
-                precis_json = json.loads(precis_output)
-                
-                # Check evaluation result
-                if "evaluations" in precis_json and len(precis_json["evaluations"]) > 0:
-                    eval_result = precis_json["evaluations"][0].get("evaluation", {})
-                    if eval_result.get("result") == "true":
-                        verified = True
-                    else:
-                        verified = False
-                
-                pipeline_steps = [
-                    "✅ Step 1: Parsing (Lexer → Parser → AST)",
-                    "✅ Step 2: Type Checking",
-                    "✅ Step 3: Evaluation Engine",
-                    "✅ Step 4: Results Generated",
-                ]
-                
-                if verified:
-                    pipeline_steps.append("✅ Verification: PASSED")
-                else:
-                    pipeline_steps.append("❌ Verification: FAILED")
-                
-                precis_result = {
-                    "success": True,
-                    "output": json.dumps(precis_json, indent=2),
-                    "error": "",
-                    "pipeline_steps": pipeline_steps,
-                    "json_response": precis_json
-                }
-                
-            except json.JSONDecodeError:
-                precis_result = {
-                    "success": False,
-                    "output": precis_output,
-                    "error": f"JSON parse failed: {precis_output[:200]}",
-                    "pipeline_steps": ["❌ JSON parsing failed"]
-                }
-        else:
-            precis_result = {
-                "success": False,
-                "output": precis_output,
-                "error": precis_error,
-                "pipeline_steps": ["❌ Précis execution failed"]
-            }
+    # STEP 3: Call OCaml Précis
+    steps.append("⚙️ Calling OCaml Précis engine...")
     
-    except subprocess.TimeoutExpired:
-        precis_result = {
-            "success": False,
-            "output": "",
-            "error": "Timeout (30s)",
-            "pipeline_steps": ["❌ Timeout"]
-        }
-    except Exception as e:
-        precis_result = {
-            "success": False,
-            "output": "",
-            "error": str(e),
-            "pipeline_steps": [f"❌ Error: {str(e)}"]
-        }
+    verified, precis_result = await asyncio.to_thread(_agent4_run_precis, formula, validated_facts)
     
-    steps.append(f"✅ OCaml processing complete")
+    steps.append("✅ OCaml processing complete")
     
-    # =====================================
     # STEP 4: LLM2 - Generate Explanation
-    # =====================================
     steps.append("💬 LLM2: Generating explanation...")
     
-    explain_prompt = f"""Explain this compliance verification result to a non-technical user.
-
-Question: {query}
-Facts Extracted: {validated_facts}
-Formula Checked: {formula}
-Verification Result: {"PASSED (Compliant)" if verified else "FAILED (Violation)"}
-
-Provide:
-1. Direct YES/NO answer to user's question
-2. Brief explanation (2-3 sentences) of why
-3. Cite specific HIPAA section: §164.502(a)(1)(i)
-4. Actionable guidance if needed
-
-Keep it simple and clear."""
-    
-    try:
-        message = client.messages.create(
-            model="claude-sonnet-4-20250514",
-            max_tokens=500,
-            messages=[{"role": "user", "content": explain_prompt}]
-        )
-        explanation = message.content[0].text
-    except Exception as e:
-        explanation = f"Unable to generate explanation: {e}"
+    explain_key = _cache_key(query, validated_facts, formula, verified)
+    explanation = _lru_get(_EXPLAIN_CACHE, explain_key)
+    if explanation is None:
+        try:
+            message = await client.messages.create(**_agent4_explain_params(
+                query, _agent4_explain_system(validated_facts, formula), verified
+            ))
+            explanation = message.content[0].text
+            _lru_put(_EXPLAIN_CACHE, explain_key, explanation)
+        except Exception as e:
+            explanation = f"Unable to generate explanation: {e}"
     
-    return {
-        "name": "Pipeline4Compliance ⭐",
-        "answer": explanation,
-        "duration": time.time() - start,
-        "steps": steps,
-        "extracted_facts": validated_facts,
-        "formula": formula,
-        "precis_result": precis_result,
-        "verified": verified,
-        "method": "LLM1 (Extract+Translate) → OCaml Précis → LLM2 (Explain)",
-        "compliance_status": "✅ COMPLIANT" if verified else "❌ VIOLATION"
-    }
+    return _agent4_result(explanation, start, steps, validated_facts, formula,
+                          precis_result, verified)
+
 
 # ============================================
 # UNIFIED DISPLAY FOR ALL EXPERIMENTS
 # ============================================
 
+def format_precis_output(precis: dict) -> str:
+    """Pretty-printed Précis output for display (falls back to the raw text)"""
+    if precis.get('json_response'):
+        return json_dumps_pretty(precis['json_response'])
+    return precis.get('output', '')
+
+# Streamlit reruns the whole script on every widget change, so the same
+# result dict is rendered over and over; its verdict and evaluation counts
+# are kept here, keyed by the result's identity plus a cheap fingerprint
+RESULT_VIEW_CACHE_SIZE = 256
+_RESULT_VIEW_CACHE = OrderedDict()
+_RESULT_VIEW_LOCK = threading.Lock()
+
+
+def _result_fingerprint(result: dict) -> tuple:
+    return (
+        id(result),
+        result.get('compliance_status'),
+        result.get('verified'),
+        id(result.get('precis_result')),
+        len(result.get('answer', '')),
+    )
+
+
+def _split_evaluations(evaluations: list) -> tuple:
+    """(violations, compliant) in a single pass; undecided evaluations go in neither"""
+    violations = []
+    compliant = []
+    for e in evaluations:
+        outcome = e.get('evaluation', {}).get('result')
+        if outcome == 'false':
+            violations.append(e)
+        elif outcome == 'true':
+            compliant.append(e)
+    return violations, compliant
+
+
+# Précis' JSON interface writes relevance_score on every matched policy
+_relevance = itemgetter('relevance_score')
+
+
+def _top3_policies(matched_policies: list) -> list:
+    """Three most relevant matched policies, same order as a full descending sort"""
+    if len(matched_policies) < 2:
+        # Nothing to rank: skip the key calls and heap setup
+        return list(matched_policies)
+    return heapq.nlargest(3, matched_policies, key=_relevance)
+
+
+@dataclass(slots=True)
+class PrecisView:
+    """One Précis response read once for display"""
+    success: bool
+    overall_compliant: Optional[bool]   # None when Précis did not report it
+    evaluations: list
+    violations: list                    # evaluations whose result is 'false'
+    compliant: list                     # evaluations whose result is 'true'
+    reported_violations: list           # Précis' own 'violations' list
+    matched_policies: list
+    top_policies: list
+
+
+def precis_view(precis: dict) -> PrecisView:
+    """Build the display view of a precis_result dict"""
+    precis_json = precis.get('json_response') or {}
+    evaluations = precis_json.get('evaluations', [])
+    violations, compliant = _split_evaluations(evaluations)
+    matched_policies = precis_json.get('matched_policies', [])
+
+    return PrecisView(
+        success=bool(precis.get('success', False)),
+        overall_compliant=bool(precis_json['overall_compliant']) if 'overall_compliant' in precis_json else None,
+        evaluations=evaluations,
+        violations=violations,
+        compliant=compliant,
+        reported_violations=precis_json.get('violations', []),
+        matched_policies=matched_policies,
+        top_policies=_top3_policies(matched_policies),
+    )
+
+
+def result_view(result: dict) -> tuple:
+    """(verdict, PrecisView) for a result, computed once per result"""
+    key = _result_fingerprint(result)
+    with _RESULT_VIEW_LOCK:
+        cached = _RESULT_VIEW_CACHE.get(key)
+        # The result itself is kept alongside so a recycled id() never matches
+        if cached is not None and cached[0] is result:
+            _RESULT_VIEW_CACHE.move_to_end(key)
+            return cached[1]
+
+    pv = precis_view(result.get('precis_result', {}))
+    view = (determine_verdict(result, pv), pv)
+
+    with _RESULT_VIEW_LOCK:
+        _RESULT_VIEW_CACHE[key] = (result, view)
+        _RESULT_VIEW_CACHE.move_to_end(key)
+        if len(_RESULT_VIEW_CACHE) > RESULT_VIEW_CACHE_SIZE:
+            _RESULT_VIEW_CACHE.popitem(last=False)
+    return view
+
+
+# Past this many characters JSON is shown as a plain code block; the
+# interactive st.json tree is one of the heaviest widgets to render
+JSON_WIDGET_MAX_CHARS = 4096
+
+
+# How each verdict status is shown:
+# (banner, banner icon, status metric value, metric delta, delta colour)
+_VERDICT_STYLES = {
+    'compliant': (st.success, "✅", "✅ COMPLIANT", "Verified", "normal"),
+    'violation': (st.error, "❌", "❌ VIOLATION", "Failed", "inverse"),
+    'unknown': (st.warning, "⚠️", "⚠️ UNKNOWN", "No verification", "normal"),
+}
+
+# Relevance score badges, highest threshold first; anything lower gets the fallback
+_SCORE_STYLES = ((0.5, st.success, "🎯"), (0.3, st.warning, "📊"))
+_SCORE_FALLBACK = (st.info, "📉")
+
+
+def _score_style(score: float) -> tuple:
+    """(element, icon) for a policy relevance score"""
+    return next(((show, icon) for threshold, show, icon in _SCORE_STYLES if score > threshold), _SCORE_FALLBACK)
+
+
+def _markdown_list(items, heading: str = None) -> str:
+    """Bullet list (under an optional heading) as one markdown string, sent as a single element"""
+    lines = [heading] if heading else []
+    lines.extend(f"- {item}" for item in items)
+    return "\n".join(lines)
+
+
+def _violations_markdown(violations: list) -> str:
+    """All violation cards as one markdown block, separated by rules"""
+    return "\n\n---\n\n".join(
+        f"**{v['section']}**: {v['description']}  \n{v['explanation']}"
+        for v in violations
+    )
+
+
+def display_json(obj):
+    """st.json for small payloads, a read-only code block for large ones"""
+    payload = json_dumps_pretty(obj)
+    if len(payload) > JSON_WIDGET_MAX_CHARS:
+        st.code(payload, language="json")
+    else:
+        st.json(obj)
+
+
+@st.fragment
 def display_experiment_result(result: dict):
     """
     Universal display function for ALL experiments (Baseline, RAG, Pipeline, Agentic)
@@ -1024,73 +2518,89 @@ def display_experiment_result(result: dict):
     """
     
     # 1. DETERMINE VERDICT (works for all experiment types)
-    verdict = determine_verdict(result)
+    verdict, pv = result_view(result)
     
     # 2. BIG VERDICT with colored background
-    if verdict['status'] == 'compliant':
-        st.success(f"## ✅ {verdict['text']}")
-    elif verdict['status'] == 'violation':
-        st.error(f"## ❌ {verdict['text']}")
-    else:
-        st.warning(f"## ⚠️ {verdict['text']}")
+    show, icon = _VERDICT_STYLES[verdict['status']][:2]
+    show(f"## {icon} {verdict['text']}")
     
     # 3. METRICS ROW
-    display_metrics(result, verdict)
+    display_metrics(result, verdict, pv)
     
     # 4. MAIN ANSWER
     st.markdown("### 💬 Answer")
     st.info(result['answer'])
     
     # 5. TYPE-SPECIFIC DETAILS (only for Pipeline/Agentic)
-    if 'precis_result' in result:
-        display_pipeline_details(result)
-    elif 'retrieved_policies' in result:
+    kind = result.get('_render') or render_kind(result)
+    if kind == 'pipeline':
+        display_pipeline_details(result, pv)
+    elif kind == 'rag':
         display_rag_details(result)
     
     # 6. TECHNICAL DETAILS (collapsible for all)
     display_technical_details(result)
 
-def determine_verdict(result: dict) -> dict:
+# Answer keywords for the Baseline/RAG verdict, matched against the answer's
+# words; the few multi-word phrases are still looked up as substrings
+_ANSWER_WORD_RE = re.compile(r"[a-z]+")
+_POS = frozenset({'yes', 'permitted', 'allowed', 'compliant'})
+_POS_PHRASES = ('can share',)
+_COND = frozenset({'but', 'must', 'require', 'requires', 'required', 'requirement', 'requirements',
+                   'authorization', 'authorizations'})
+_COND_PHRASES = ('only if',)
+_NEG = frozenset({'no', 'cannot', 'prohibited', 'violation', 'violations'})
+
+
+def parse_status(status: str) -> str:
+    """'compliant', 'violation' or 'unknown' for a result's compliance_status string"""
+    if "COMPLIANT" in status and "NOT" not in status:
+        return 'compliant'
+    if "NOT COMPLIANT" in status or "VIOLATION" in status:
+        return 'violation'
+    return 'unknown'
+
+
+_STATUS_VERDICTS = {
+    'compliant': {'status': 'compliant', 'text': 'COMPLIANT'},
+    'violation': {'status': 'violation', 'text': 'VIOLATION DETECTED'},
+    'unknown': {'status': 'unknown', 'text': 'INCONCLUSIVE'},
+}
+
+
+def determine_verdict(result: dict, pv: PrecisView = None) -> dict:
     """Extract verdict from any experiment type"""
     
     # Check explicit compliance_status first
     if 'compliance_status' in result:
-        status_str = result['compliance_status']
-        if "COMPLIANT" in status_str and "NOT" not in status_str:
-            return {'status': 'compliant', 'text': 'COMPLIANT'}
-        elif "VIOLATION" in status_str or "NOT COMPLIANT" in status_str:
-            return {'status': 'violation', 'text': 'VIOLATION DETECTED'}
-        else:
-            return {'status': 'unknown', 'text': 'INCONCLUSIVE'}
+        return dict(_STATUS_VERDICTS[parse_status(result['compliance_status'])])
     
     # Check precis_result evaluations (Pipeline/Agentic)
     if 'precis_result' in result:
-        precis = result.get('precis_result', {})
-        precis_json = precis.get('json_response', {})
+        if pv is None:
+            pv = precis_view(result['precis_result'])
         
         # Check if OCaml succeeded
-        if not precis.get('success', False):
+        if not pv.success:
             return {'status': 'unknown', 'text': 'VERIFICATION FAILED (OCaml Error)'}
         
         # Check overall_compliant flag (most reliable)
-        if 'overall_compliant' in precis_json:
-            if precis_json['overall_compliant']:
+        if pv.overall_compliant is not None:
+            if pv.overall_compliant:
                 return {'status': 'compliant', 'text': 'COMPLIANT'}
             else:
-                violation_count = len(precis_json.get('violations', []))
+                violation_count = len(pv.reported_violations)
                 return {
                     'status': 'violation', 
                     'text': f'VIOLATION DETECTED ({violation_count} policies violated)'
                 }
         
         # Fallback: check evaluations
-        evaluations = precis_json.get('evaluations', [])
-        if evaluations:
-            violations = [e for e in evaluations if e.get('evaluation', {}).get('result') == 'false']
-            if violations:
+        if pv.evaluations:
+            if pv.violations:
                 return {
                     'status': 'violation',
-                    'text': f'VIOLATION DETECTED ({len(violations)}/{len(evaluations)} policies)'
+                    'text': f'VIOLATION DETECTED ({len(pv.violations)}/{len(pv.evaluations)} policies)'
                 }
             else:
                 return {'status': 'compliant', 'text': 'COMPLIANT'}
@@ -1104,43 +2614,42 @@ def determine_verdict(result: dict) -> dict:
     
     # For Baseline/RAG: Analyze the answer text
     answer = result.get('answer', '').lower()
+    words = set(_ANSWER_WORD_RE.findall(answer))
     
     # Look for positive indicators
-    if any(word in answer for word in ['yes', 'can share', 'permitted', 'allowed', 'compliant']):
-        if any(word in answer for word in ['but', 'only if', 'must', 'require', 'authorization']):
+    if not _POS.isdisjoint(words) or any(p in answer for p in _POS_PHRASES):
+        if not _COND.isdisjoint(words) or any(p in answer for p in _COND_PHRASES):
             return {'status': 'compliant', 'text': 'CONDITIONAL YES (with requirements)'}
         return {'status': 'compliant', 'text': 'YES'}
     
-    # Look for negative indicators
-    if any(word in answer for word in ['no', 'cannot', 'prohibited', 'violation', 'not permitted']):
+    # Look for negative indicators ("not permitted" is already caught by "permitted" above)
+    if not _NEG.isdisjoint(words):
         return {'status': 'violation', 'text': 'NO (Violation)'}
     
     # Default: unknown
     return {'status': 'unknown', 'text': 'NO VERIFICATION PERFORMED'}
 
-def display_metrics(result: dict, verdict: dict):
+def display_metrics(result: dict, verdict: dict, pv: PrecisView = None):
     """Display metrics row with verdict badge"""
     
+    steps = result.get('steps') or ()
     cols = st.columns(4)
     
     # Time
     cols[0].metric("⏱️ Time", f"{result['duration']:.1f}s")
     
     # Status with color
-    if verdict['status'] == 'compliant':
-        cols[1].metric("Status", "✅ COMPLIANT", delta="Verified")
-    elif verdict['status'] == 'violation':
-        cols[1].metric("Status", "❌ VIOLATION", delta="Failed", delta_color="inverse")
-    else:
-        cols[1].metric("Status", "⚠️ UNKNOWN", delta="No verification")
+    label, delta, delta_color = _VERDICT_STYLES[verdict['status']][2:]
+    cols[1].metric("Status", label, delta=delta, delta_color=delta_color)
     
     # Policies or analysis
     if 'precis_result' in result:
-        precis_json = result.get('precis_result', {}).get('json_response', {})
+        if pv is None:
+            pv = precis_view(result['precis_result'])
         
         # Show compliant vs violations
-        violations = precis_json.get('violations', [])
-        evaluations = precis_json.get('evaluations', [])
+        violations = pv.reported_violations
+        evaluations = pv.evaluations
         
         if evaluations:
             compliant_count = len(evaluations) - len(violations)
@@ -1152,7 +2661,7 @@ def display_metrics(result: dict, verdict: dict):
                           delta_color="inverse" if violation_count > 0 else "off")
         else:
             cols[2].metric("📋 Policies", "0")
-            cols[3].metric("🔄 Steps", len(result.get('steps', [])))
+            cols[3].metric("🔄 Steps", len(steps))
     else:
         # For Baseline/RAG - show confidence
         if 'analysis' in result:
@@ -1161,26 +2670,32 @@ def display_metrics(result: dict, verdict: dict):
             
             # Show reasoning
             reasoning = result['analysis'].get('reasoning', 'N/A')
-            cols[3].metric("📊 Analysis", reasoning[:20] + "..." if len(reasoning) > 20 else reasoning)
+            short = reasoning if len(reasoning) <= 20 else reasoning[:20] + "..."
+            cols[3].metric("📊 Analysis", short)
         else:
             cols[2].metric("📚 Source", "Internal knowledge" if result['name'] == 'Baseline' else 'Policy DB')
             if 'retrieved_policies' in result:
                 cols[3].metric("📄 Retrieved", result['retrieved_policies'])
             else:
-                cols[3].metric("🔄 Steps", len(result.get('steps', [])))
+                cols[3].metric("🔄 Steps", len(steps))
 
-def display_pipeline_details(result: dict):
+def display_pipeline_details(result: dict, pv: PrecisView = None):
     """Display details specific to Pipeline/Agentic experiments"""
     
-    precis_json = result.get('precis_result', {}).get('json_response', {})
+    if pv is None:
+        # Nothing to show (e.g. Précis failed): skip building the view
+        precis_json = result.get('precis_result', {}).get('json_response') or {}
+        if not precis_json.get('matched_policies') and not precis_json.get('evaluations'):
+            return
+        pv = result_view(result)[1]
+    violations, top_policies = pv.violations, pv.top_policies
+    if not top_policies and not violations:
+        return
     
     # Top Relevant Policies
-    matched_policies = precis_json.get('matched_policies', [])
-    if matched_policies:
+    if top_policies:
         st.markdown("### 📚 Most Relevant Policies")
         
-        top_policies = sorted(matched_policies, key=lambda x: x.get('relevance_score', 0), reverse=True)[:3]
-        
         for i, policy in enumerate(top_policies, 1):
             col_a, col_b = st.columns([3, 1])
             with col_a:
@@ -1188,24 +2703,13 @@ def display_pipeline_details(result: dict):
                 st.markdown(f"_{policy['description']}_")
             with col_b:
                 score = policy['relevance_score']
-                if score > 0.5:
-                    st.success(f"🎯 {score:.0%}")
-                elif score > 0.3:
-                    st.warning(f"📊 {score:.0%}")
-                else:
-                    st.info(f"📉 {score:.0%}")
+                show, icon = _score_style(score)
+                show(f"{icon} {score:.0%}")
     
     # Violation Details
-    evaluations = precis_json.get('evaluations', [])
-    violations = [e for e in evaluations if e.get('evaluation', {}).get('result') == 'false']
-    
     if violations:
         st.markdown("### ⚠️ Violations Found")
-        for v in violations:
-            st.error(f"""
-**{v['section']}**: {v['description']}  
-{v['explanation']}
-            """)
+        st.error(_violations_markdown(violations))
 
 def display_rag_details(result: dict):
     """Display details specific to RAG experiments"""
@@ -1216,18 +2720,17 @@ def display_rag_details(result: dict):
 def display_technical_details(result: dict):
     """Collapsible technical details for all experiments"""
     
+    steps = result.get('steps') or ()
     with st.expander("🔬 Technical Details", expanded=False):
         
         # Pipeline steps
-        if result.get('steps'):
-            st.markdown("#### 🔄 Processing Steps")
-            for step in result['steps']:
-                st.markdown(f"- {step}")
+        if steps:
+            st.markdown(_markdown_list(steps, "#### 🔄 Processing Steps"))
         
         # Extracted facts (Pipeline/Agentic)
         if 'extracted_facts' in result:
             st.markdown("#### 🧩 Extracted Facts")
-            st.json(result['extracted_facts'])
+            display_json(result['extracted_facts'])
         
         # Formula (Pipeline/Agentic)
         if 'formula' in result:
@@ -1236,21 +2739,26 @@ def display_technical_details(result: dict):
         
         # OCaml Pipeline (Pipeline/Agentic)
         if 'precis_result' in result:
-            st.markdown("#### ⚙️ OCaml Précis Pipeline")
             precis = result['precis_result']
-            
-            if 'pipeline_steps' in precis:
-                for step in precis['pipeline_steps']:
-                    st.markdown(f"- {step}")
+            st.markdown(_markdown_list(precis.get('pipeline_steps', ()), "#### ⚙️ OCaml Précis Pipeline"))
             
             if precis.get('success'):
                 st.markdown("**Full OCaml Output:**")
-                st.code(precis.get('output', ''), language="json")
+                st.code(format_precis_output(precis), language="json")
             else:
                 st.error(f"OCaml Error: {precis.get('error', 'Unknown')}")
 
 
 
+# Status metric (value, delta) in the compact Baseline/RAG layout
+SIMPLE_STATUS_METRICS = {
+    'compliant': ("✅ COMPLIANT", "Verified"),
+    'violation': ("👎 VIOLATION ❌", "Failed"),
+    'unknown': ("⚠️ UNKNOWN", "Inconclusive"),
+}
+
+
+@st.fragment
 def display_simple_result(r: dict):
     """Simple display for Baseline and RAG experiments"""
     
@@ -1261,20 +2769,14 @@ def display_simple_result(r: dict):
     
     # Status (if available)
     if 'compliance_status' in r:
-        status = r['compliance_status']
-        if "COMPLIANT" in status and "NOT" not in status:
-            cols[2].metric("Status", "✅ COMPLIANT", delta="Verified")
-        elif "NOT COMPLIANT" in status or "VIOLATION" in status:
-            cols[2].metric("Status", "👎 VIOLATION ❌", delta="Failed")
-        else:
-            cols[2].metric("Status", "⚠️ UNKNOWN", delta="Inconclusive")
+        label, delta = SIMPLE_STATUS_METRICS[parse_status(r['compliance_status'])]
+        cols[2].metric("Status", label, delta=delta)
     elif 'verified' in r:
         cols[2].metric("Verified", "✅" if r['verified'] else "❌")
     
     # Pipeline steps (compact)
     with st.expander("🔄 Pipeline Steps", expanded=False):
-        for step in r['steps']:
-            st.markdown(f"- {step}")
+        st.markdown(_markdown_list(r['steps']))
     
     # Main answer
     st.markdown("### 💬 Answer")
@@ -1285,14 +2787,12 @@ def display_simple_result(r: dict):
         st.warning("⚠️ No policies were retrieved from the database")
 
 
-def format_agent4_result_simple(result: dict) -> dict:
+def format_agent4_result_simple(result: dict, pv: PrecisView = None) -> dict:
     """Transform overwhelming output into user-friendly format"""
     
-    precis_json = result.get('precis_result', {}).get('json_response', {})
-    evaluations = precis_json.get('evaluations', [])
-
-    violations = [e for e in evaluations if e.get('evaluation', {}).get('result') == 'false']
-    compliant = [e for e in evaluations if e.get('evaluation', {}).get('result') == 'true']
+    if pv is None:
+        pv = result_view(result)[1]
+    violations, compliant, evaluations, top_policies = pv.violations, pv.compliant, pv.evaluations, pv.top_policies
     
     if len(violations) > 0:
         verdict = "❌ VIOLATION DETECTED"
@@ -1301,9 +2801,6 @@ def format_agent4_result_simple(result: dict) -> dict:
         verdict = "✅ COMPLIANT"
         verdict_color = "green"
     
-    matched_policies = precis_json.get('matched_policies', [])
-    top_policies = sorted(matched_policies, key=lambda x: x.get('relevance_score', 0), reverse=True)[:3]
-    
     return {
         "verdict": verdict,
         "verdict_color": verdict_color,
@@ -1333,16 +2830,16 @@ def format_agent4_result_simple(result: dict) -> dict:
     }
 
 
+@st.fragment
 def display_agent4_result(result: dict):
     """Display Pipeline4Compliance and Agentic with clean UI but keep technical details available"""
     
     simplified = format_agent4_result_simple(result)
+    steps = result.get('steps') or ()
     
     # 1. BIG VERDICT
-    if simplified['verdict_color'] == 'green':
-        st.success(f"## {simplified['verdict']}")
-    else:
-        st.error(f"## {simplified['verdict']}")
+    show = _VERDICT_STYLES['compliant' if simplified['verdict_color'] == 'green' else 'violation'][0]
+    show(f"## {simplified['verdict']}")
     
     # 2. Summary Metrics
     col1, col2, col3, col4 = st.columns(4)
@@ -1360,77 +2857,99 @@ def display_agent4_result(result: dict):
         st.markdown("### 📚 Most Relevant HIPAA Sections")
         st.caption("These policies were matched based on semantic similarity to your query")
         
+        # One table rather than a pair of columns per policy
+        rows = ["| # | Section | Description | Match |", "|---|---|---|---|"]
         for i, policy in enumerate(simplified['top_relevant_policies'], 1):
-            with st.container():
-                col_a, col_b = st.columns([3, 1])
-                with col_a:
-                    st.markdown(f"**{i}. {policy['regulation']} {policy['section']}**")
-                    st.markdown(f"_{policy['description']}_")
-                with col_b:
-                    # Explain relevance score
-                    score = policy['relevance_score']
-                    if score > 0.5:
-                        st.success(f"🎯 {score:.0%} match")
-                    elif score > 0.3:
-                        st.warning(f"📊 {score:.0%} match")
-                    else:
-                        st.info(f"📉 {score:.0%} match")
+            score = policy['relevance_score']
+            icon = _score_style(score)[1]
+            description = str(policy['description']).replace("|", "\\|")
+            rows.append(f"| {i} | **{policy['regulation']} {policy['section']}** | _{description}_ | {icon} {score:.0%} |")
+        st.markdown("\n".join(rows))
         
         st.caption("💡 **Relevance Score** = Formula similarity (shared predicates), NOT compliance score")
     
     # 5. Violation Details (if any)
     if simplified['violations_detail']:
         st.markdown("### ⚠️ Violations Found")
-        for v in simplified['violations_detail']:
-            st.error(f"""
-**{v['section']}**: {v['description']}  
-{v['explanation']}
-            """)
+        st.error(_violations_markdown(simplified['violations_detail']))
     
     # 6. Pipeline Steps (visible but compact)
     with st.expander("🔄 Processing Pipeline", expanded=False):
-        for step in result['steps']:
-            st.markdown(f"- {step}")
+        st.markdown(_markdown_list(steps))
     
     # 7. Technical Details (collapsed by default - KEEP FOR YOU!)
     with st.expander("🔬 Under The Hood (Technical Details)", expanded=False):
         
         st.markdown("#### 🧩 Extracted Facts")
-        st.json(result.get('extracted_facts', []))
+        display_json(result.get('extracted_facts', []))
         
         st.markdown("#### 📐 Formal Logic Formula")
         st.code(result.get('formula', 'N/A'), language="text")
         
-        st.markdown("#### ⚙️ OCaml Précis Pipeline")
         precis = result.get('precis_result', {})
-        
-        if 'pipeline_steps' in precis:
-            for step in precis['pipeline_steps']:
-                st.markdown(f"- {step}")
+        st.markdown(_markdown_list(precis.get('pipeline_steps', ()), "#### ⚙️ OCaml Précis Pipeline"))
         
         if precis.get('success'):
             st.markdown("#### 📊 Full OCaml Output")
-            st.code(precis.get('output', ''), language="json")
+            st.code(format_precis_output(precis), language="json")
         else:
             st.error(f"❌ OCaml Error: {precis.get('error', 'Unknown')}")
         
         # Show validation warnings
-        validation_warnings = [s for s in result['steps'] if "⚠️" in s]
+        validation_warnings = [s for s in steps if "⚠️" in s]
         if validation_warnings:
             st.markdown("#### ⚠️ Validation Issues")
             for warning in validation_warnings:
                 st.warning(warning)
 
 class DocumentExtractor:
+    @staticmethod
+    def iter_pdf_pages(file_bytes):
+        """Yield the text of each page of PDF bytes; stopping early skips the rest"""
+        if HAS_PDFIUM:
+            pdf = pdfium.PdfDocument(file_bytes)
+            try:
+                for page in pdf:
+                    textpage = page.get_textpage()
+                    text = textpage.get_text_range()
+                    textpage.close()
+                    page.close()
+                    yield text
+            finally:
+                pdf.close()
+            return
+        
+        from io import BytesIO
+        import PyPDF2
+        
+        # Lenient parsing
+        reader = PyPDF2.PdfReader(BytesIO(file_bytes), strict=False)
+        yield from DocumentExtractor._iter_reader_pages(reader)
+    
+    @staticmethod
+    def _iter_reader_pages(reader):
+        """Page texts of a PyPDF2 reader; each page's content stream is dropped
+        once its text is out, so the parsed document is not held whole until the end"""
+        for page in reader.pages:
+            text = page.extract_text() or ""
+            page.pop('/Contents', None)
+            yield text
+    
     @staticmethod
     def extract_from_pdf(file_bytes) -> str:
         """Extract text from PDF bytes"""
-        pdf_file = BytesIO(file_bytes)
-        reader = PyPDF2.PdfReader(pdf_file)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() + "\n\n"
-        return text
+        if HAS_PDFIUM:
+            return "\n\n".join(DocumentExtractor.iter_pdf_pages(file_bytes))
+        
+        from io import BytesIO
+        import PyPDF2
+        
+        # One reader gives the page count and, when the pool is not used, the text
+        reader = PyPDF2.PdfReader(BytesIO(file_bytes), strict=False)
+        pages = _pypdf2_pages_parallel(file_bytes, len(reader.pages))
+        if pages is None:
+            pages = DocumentExtractor._iter_reader_pages(reader)
+        return "\n\n".join(pages)
     
     @staticmethod
     def extract_from_txt(file_bytes) -> str:
@@ -1440,27 +2959,52 @@ class DocumentExtractor:
     @staticmethod
     def extract(uploaded_file) -> str:
         """Auto-detect and extract"""
-        file_bytes = uploaded_file.read()
-        
-        if uploaded_file.name.endswith('.pdf'):
-            return DocumentExtractor.extract_from_pdf(file_bytes)
-        else:
-            return DocumentExtractor.extract_from_txt(file_bytes)
+        # getvalue() rather than read(): the whole buffer, whatever the
+        # stream position, and the same bytes hash to the same cache entry
+        return _extract_cached(uploaded_file.name, uploaded_file.getvalue())
+
+
+# PyPDF2 is pure Python and holds the GIL, so long PDFs are split into
+# page ranges across processes; below this many pages the pool costs more
+PDF_POOL_MIN_PAGES = 20
+
+
+def _pypdf2_pages_parallel(file_bytes, n_pages: int) -> Optional[list]:
+    """Page texts of an n_pages PDF extracted by a process pool, or None to extract in-process"""
+    workers = min(os.cpu_count() or 1, n_pages // PDF_POOL_MIN_PAGES + 1)
+    if n_pages < PDF_POOL_MIN_PAGES or workers < 2:
+        return None
+    
+    # One contiguous page range per worker, so each parses the file once
+    step = -(-n_pages // workers)
+    ranges = [(file_bytes, start, min(start + step, n_pages)) for start in range(0, n_pages, step)]
+    try:
+        # Spawned, not forked: Streamlit's process has live threads (and their
+        # locks) that a fork would copy mid-state; workers import only utils.pdf_pages
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            return [text for chunk in pool.map(_pypdf2_page_texts, ranges) for text in chunk]
+    except Exception as e:
+        print(f"Parallel PDF extraction failed, extracting in-process: {e}")
+        return None
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _extract_cached(name: str, blob: bytes) -> str:
+    """Extracted text of an uploaded file, reused across Streamlit reruns"""
+    if name.endswith('.pdf'):
+        return DocumentExtractor.extract_from_pdf(blob)
+    return DocumentExtractor.extract_from_txt(blob)
+
+_SECTION_RE = re.compile(r'§\s*(\d+\.\d+(?:\([a-z0-9]+\))*)')
+
 
 class SectionChunker:
     @staticmethod
     def chunk_by_section_numbers(text: str) -> list:
         """Extract sections based on §XXX.XXX pattern"""
-        section_pattern = r'§\s*(\d+\.\d+(?:\([a-z0-9]+\))*)'
-        
         sections = []
-        matches = list(re.finditer(section_pattern, text))
         
-        for i, match in enumerate(matches):
-            section_num = match.group(1)
-            start = match.start()
-            end = matches[i+1].start() if i+1 < len(matches) else len(text)
-            
+        def flush(section_num, start, end):
             section_text = text[start:end].strip()
             
             # Only include sections with substantial text (>100 chars)
@@ -1470,22 +3014,122 @@ class SectionChunker:
                     'text': section_text[:1000]  # Limit to 1000 chars for LLM
                 })
         
+        # Single pass: each match closes the section opened by the previous one
+        prev = None
+        for match in _SECTION_RE.finditer(text):
+            if prev is not None:
+                flush(prev.group(1), prev.start(), match.start())
+            prev = match
+        if prev is not None:
+            flush(prev.group(1), prev.start(), len(text))
+        
         return sections
 
+# ============================================
+# LLM RESPONSE CACHE
+# ============================================
+
+LLM_CACHE_DIR = os.environ.get("LLM_CACHE_DIR", os.path.expanduser("~/.cache/policy_llm"))
+LLM_CACHE_TTL = 7 * 86400
+# Bump when a policy-pipeline prompt changes so old answers are not reused
+PROMPT_VERSION = "v1"
+
+
+class LLMCache:
+    """
+    Exact-match cache of LLM response texts for the document pipeline, keyed
+    by a SHA-256 of the full request parameters and PROMPT_VERSION.
+    Persisted with shelve under LLM_CACHE_DIR; entries expire after LLM_CACHE_TTL.
+    """
+    
+    def __init__(self, path: str = None, ttl: float = LLM_CACHE_TTL):
+        self.path = path or os.path.join(LLM_CACHE_DIR, "responses")
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.db = None
+    
+    def _open(self):
+        if self.db is None:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self.db = shelve.open(self.path)
+            except Exception as e:
+                print(f"LLM cache unavailable at {self.path}, keeping it in memory: {e}")
+                self.db = {}
+        return self.db
+    
+    @staticmethod
+    def key_for(params: dict) -> str:
+        return hashlib.sha256(
+            json.dumps({**params, "prompt_version": PROMPT_VERSION}, sort_keys=True).encode()
+        ).hexdigest()
+    
+    def get(self, key: str):
+        try:
+            with self.lock:
+                entry = self._open().get(key)
+        except Exception as e:
+            print(f"Ignoring unreadable LLM cache entry {key}: {e}")
+            return None
+        if entry is None or entry["expiresAt"] < time.time():
+            return None
+        return entry["text"]
+    
+    def set(self, key: str, params: dict, text: str):
+        now = time.time()
+        entry = {
+            "inputHash": key,
+            "promptVersion": PROMPT_VERSION,
+            "modelId": params.get("model"),
+            "createdAt": now,
+            "expiresAt": now + self.ttl,
+            "text": text,
+        }
+        try:
+            with self.lock:
+                db = self._open()
+                db[key] = entry
+                if hasattr(db, "sync"):
+                    db.sync()
+        except Exception as e:
+            print(f"Could not persist LLM cache entry {key}: {e}")
+
+
+LLM_CACHE = LLMCache()
+
+
+def cached_llm_text(client: Anthropic, **params) -> str:
+    """Text of client.messages.create(**params), answered from LLM_CACHE when seen before"""
+    key = LLMCache.key_for(params)
+    text = LLM_CACHE.get(key)
+    if text is None:
+        text = client.messages.create(**params).content[0].text
+        LLM_CACHE.set(key, params, text)
+    return text
+
+
+async def cached_llm_text_async(client: AsyncAnthropic, **params) -> str:
+    """Async cached_llm_text; the shelve reads/writes run in a worker thread, off the event loop"""
+    key = LLMCache.key_for(params)
+    text = await asyncio.to_thread(LLM_CACHE.get, key)
+    if text is None:
+        text = (await client.messages.create(**params)).content[0].text
+        await asyncio.to_thread(LLM_CACHE.set, key, params, text)
+    return text
+
 # ============================================
 # POLICY PIPELINE
 # ============================================
 
-class PolicyIdentifier:
-    def __init__(self, client: Anthropic):
-        self.client = client
-    
-    def identify_policies(self, section: dict) -> list:
-        """Use LLM to identify policy statements"""
-        prompt = f"""Analyze this regulatory text and identify POLICY STATEMENTS.
+# Identification needs the stronger model; translation emits one formula
+# line, so it runs on the faster one with a cap a little above that
+POLICY_IDENTIFY_MODEL = AGENT4_MODEL
+FOTL_TRANSLATE_MODEL = AGENT4_FAST_MODEL
+FOTL_TRANSLATE_TOKENS = 200
 
-Text:
-{section['text']}
+# Static instructions go in cached system blocks; the user message carries
+# only the section or policy being processed
+POLICY_IDENTIFY_SYSTEM = """Analyze the regulatory text you are given and identify POLICY STATEMENTS.
 
 A policy statement specifies:
 1. Conditions (IF/WHEN)
@@ -1494,46 +3138,19 @@ A policy statement specifies:
 
 Output JSON array:
 [
-  {{
+  {
     "statement": "exact text",
-    "section": "{section['section']}",
+    "section": "the section given with the text",
     "title": "brief title",
     "conditions": ["cond1", "cond2"],
     "action": "what is permitted/required"
-  }}
+  }
 ]
 
 If no policies, return [].
-Output ONLY JSON:"""
-        
-        try:
-            message = self.client.messages.create(
-                model="claude-sonnet-4-20250514",
-                max_tokens=2000,
-                messages=[{"role": "user", "content": prompt}]
-            )
-            
-            response_text = message.content[0].text
-            json_match = re.search(r'\[.*\]', response_text, re.DOTALL)
-            
-            if json_match:
-                return json.loads(json_match.group())
-            return []
-        except Exception as e:
-            st.error(f"Error identifying policies: {e}")
-            return []
-
-class FOTLTranslator:
-    def __init__(self, client: Anthropic):
-        self.client = client
-    
-    def translate_policy(self, policy: dict) -> dict:
-        """Convert policy to FOTL formula"""
-        prompt = f"""Convert this policy to first-order temporal logic (FOTL).
+Output ONLY JSON."""
 
-Policy: {policy['statement']}
-Section: {policy['section']}
-Title: {policy['title']}
+FOTL_TRANSLATE_SYSTEM = """Convert the policy you are given to first-order temporal logic (FOTL).
 
 FOTL SYNTAX:
 - Predicates: coveredEntity(X), protectedHealthInfo(X), disclose(W,X,Y,Z)
@@ -1556,19 +3173,53 @@ forall ce, researcher, phi, purpose.
   (coveredEntity(ce) and protectedHealthInfo(phi) and purposeIsPurpose(purpose, @Research))
   implies requiresAuthorization(ce, researcher, phi)
 
-Output ONLY the FOTL formula:"""
-        
+Output ONLY the FOTL formula."""
+
+
+class PolicyIdentifier:
+    def __init__(self, client: Anthropic):
+        self.client = client
+    
+    def identify_policies(self, section: dict) -> list:
+        """Use LLM to identify policy statements"""
         try:
-            message = self.client.messages.create(
-                model="claude-sonnet-4-20250514",
-                max_tokens=500,
-                messages=[{"role": "user", "content": prompt}]
+            response_text = cached_llm_text(
+                self.client,
+                model=POLICY_IDENTIFY_MODEL,
+                max_tokens=2000,
+                system=_cached_system(POLICY_IDENTIFY_SYSTEM),
+                messages=[{"role": "user", "content": f"Section: {section['section']}\n\nText:\n{section['text']}"}]
             )
+            json_match = _JSON_ARRAY_RE.search(response_text)
             
-            formula = message.content[0].text.strip()
+            if json_match:
+                return json_loads(json_match.group())
+            return []
+        except Exception as e:
+            st.error(f"Error identifying policies: {e}")
+            return []
+
+class FOTLTranslator:
+    def __init__(self, client: Anthropic, model: str = FOTL_TRANSLATE_MODEL):
+        self.client = client
+        self.model = model
+    
+    def translate_policy(self, policy: dict) -> dict:
+        """Convert policy to FOTL formula"""
+        try:
+            formula = cached_llm_text(
+                self.client,
+                model=self.model,
+                max_tokens=FOTL_TRANSLATE_TOKENS,
+                system=_cached_system(FOTL_TRANSLATE_SYSTEM),
+                messages=[{"role": "user", "content": f"Policy: {policy['statement']}\n"
+                                                      f"Section: {policy['section']}\n"
+                                                      f"Title: {policy['title']}\n\n"
+                                                      "Output ONLY the FOTL formula:"}]
+            ).strip()
             
             if "```" in formula:
-                match = re.search(r'```.*?\n(.*?)\n```', formula, re.DOTALL)
+                match = _CODEBLOCK_RE.search(formula)
                 if match:
                     formula = match.group(1).strip()
             
@@ -1601,30 +3252,96 @@ policy ends"""
             "regulation": "TEST"
         }
         
+        # The configured binary already runs as the shared framed server
+        if self.precis_path == PRECIS_PATH:
+            result = _precis_exchange(json_dumps_bytes(request))
+            if not result["success"]:
+                return False, result["error"]
+            response = result["response"]
+            if 'error' in response:
+                return False, response['error']
+            return True, "Valid"
+        
         try:
             proc = subprocess.Popen(
                 [self.precis_path, "json"],
                 stdin=subprocess.PIPE,
                 stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                timeout=10
+                stderr=subprocess.PIPE
             )
             
-            stdout, stderr = proc.communicate(input=json.dumps(request))
+            stdout, stderr = proc.communicate(input=json_dumps_bytes(request), timeout=10)
             
             if proc.returncode == 0:
-                response = json.loads(stdout)
+                response = json_loads(stdout)
                 if 'error' in response:
                     return False, response['error']
                 return True, "Valid"
             else:
-                return False, stderr
+                return False, stderr.decode(errors="replace")
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.communicate()
+            return False, "Précis timed out after 10s"
         except Exception as e:
             return False, str(e)
 
 ##====MULTI-POLICY IMPLEMENTATION========##
 
+# (regulation, points, phrases): the points are added once if any phrase
+# occurs in the lowercased start of a document
+REGULATION_INDICATORS = (
+    ('HIPAA', 10, ('health insurance portability',)),
+    ('HIPAA', 5, ('covered entity',)),
+    ('HIPAA', 5, ('protected health information',)),
+    ('GDPR', 10, ('general data protection regulation',)),
+    ('GDPR', 5, ('data controller', 'data subject')),
+    ('CCPA', 10, ('california consumer privacy',)),
+    ('CCPA', 5, ('section 1798',)),
+    ('GLBA', 10, ('gramm-leach-bliley', 'financial institutions')),
+    ('GLBA', 5, ('nonpublic personal information',)),
+    ('GLBA', 5, ('privacy notice',)),
+    ('SOX', 10, ('sarbanes-oxley', 'public company accounting')),
+    ('SOX', 5, ('financial report',)),
+    ('SOX', 5, ('internal controls',)),
+    ('COPPA', 10, ("children's online privacy", 'section 1303')),
+    ('COPPA', 5, ('parental consent',)),
+    ('COPPA', 5, ('personal information of children',)),
+)
+# Also scored when '§164' appears in the (original case) first 5000 characters
+_HIPAA_TITLE_INDICATOR = 0
+# detect_regulation only ever looks at this much of the start of a document
+REGULATION_SAMPLE_CHARS = 10000
+
+# GDPR article numbering in the first 5000 characters
+_GDPR_ARTICLE_POINTS = 5
+
+_REGULATION_PHRASES = {i: phrases for i, (_, _, phrases) in enumerate(REGULATION_INDICATORS)}
+_REGULATION_AC = _build_phrase_automaton(_REGULATION_PHRASES)
+
+# Most points each regulation can score
+_REGULATION_MAX_POINTS = Counter({'GDPR': _GDPR_ARTICLE_POINTS})
+for _regulation, _points, _ in REGULATION_INDICATORS:
+    _REGULATION_MAX_POINTS[_regulation] += _points
+del _regulation, _points
+
+
+def _regulation_decided(scores: dict, remaining: dict) -> bool:
+    """
+    True once no regulation can overtake the current leader, whatever else
+    the document contains (ties go to the earlier regulation, as with max())
+    """
+    order = list(scores)
+    leader = max(scores, key=scores.get)
+    lead = scores[leader]
+    for position, regulation in enumerate(order):
+        if regulation == leader:
+            continue
+        best = scores[regulation] + remaining[regulation]
+        if best > lead or (best == lead and position < order.index(leader)):
+            return False
+    return True
+
 class RegulationConfig:
     """Configuration for each regulation"""
     
@@ -1652,11 +3369,11 @@ class RegulationConfig:
             'disclose': 4,
             'permittedUseOrDisclosure': 4,
         },
-        'constants': {
+        'constants': frozenset({
             'Treatment', 'Payment', 'HealthcareOperations',
             'Research', 'PublicHealth', 'Emergency'
-        },
-        'sorts': {'Entity', 'PHI', 'Purpose'},
+        }),
+        'sorts': frozenset({'Entity', 'PHI', 'Purpose'}),
         'example_formula': """forall ce, patient, phi, purpose.
   (coveredEntity(ce) and protectedHealthInfo(phi) and purposeIsPurpose(purpose, @Treatment))
   implies permittedUseOrDisclosure(ce, patient, phi, purpose)"""
@@ -1688,11 +3405,11 @@ class RegulationConfig:
             'adequacyDecision': 1,
             'appropriateSafeguards': 1,
         },
-        'constants': {
+        'constants': frozenset({
             'Consent', 'Contract', 'LegalObligation', 'VitalInterest',
             'PublicInterest', 'LegitimateInterest'
-        },
-        'sorts': {'Entity', 'PersonalData', 'Purpose', 'LegalBasis'},
+        }),
+        'sorts': frozenset({'Entity', 'PersonalData', 'Purpose', 'LegalBasis'}),
         'example_formula': """forall dc, ds, data, purpose.
   (dataController(dc) and dataSubject(ds) and personalData(data) and purposeIsPurpose(purpose, @Consent))
   implies requiresConsent(dc, ds, data)"""
@@ -1712,8 +3429,8 @@ class RegulationConfig:
             'sellsData': 3,
             'disclosesData': 3,
         },
-        'constants': {'Sale', 'Disclosure', 'BusinessPurpose'},
-        'sorts': {'Entity', 'PersonalInfo', 'Purpose'},
+        'constants': frozenset({'Sale', 'Disclosure', 'BusinessPurpose'}),
+        'sorts': frozenset({'Entity', 'PersonalInfo', 'Purpose'}),
         'example_formula': """forall b, c, data.
   (business(b) and consumer(c) and personalInformation(data) and sellsData(b, c, data))
   implies hasOptOutRight(c, b)"""
@@ -1732,8 +3449,8 @@ class RegulationConfig:
             'sharesData': 3,
             'optOutProvided': 2,
         },
-        'constants': {'Marketing', 'ServiceProvision', 'LegalCompliance'},
-        'sorts': {'Entity', 'NonpublicInfo', 'Purpose'},
+        'constants': frozenset({'Marketing', 'ServiceProvision', 'LegalCompliance'}),
+        'sorts': frozenset({'Entity', 'NonpublicInfo', 'Purpose'}),
         'example_formula': """forall fi, cust, info.
   (financialInstitution(fi) and customer(cust) and nonpublicPersonalInformation(info) and sharesData(fi, cust, info))
   implies optOutProvided(cust, fi)"""
@@ -1751,8 +3468,8 @@ class RegulationConfig:
             'hasInternalControls': 2,
             'certifiesReport': 2,
         },
-        'constants': {'Accuracy', 'Timeliness', 'Compliance'},
-        'sorts': {'Entity', 'Report', 'Purpose'},
+        'constants': frozenset({'Accuracy', 'Timeliness', 'Compliance'}),
+        'sorts': frozenset({'Entity', 'Report', 'Purpose'}),
         'example_formula': """forall pc, off, report.
   (publicCompany(pc) and officer(off) and financialReport(report) and certifiesReport(off, report))
   implies hasInternalControls(pc, report)"""
@@ -1770,32 +3487,36 @@ class RegulationConfig:
             'hasParentalConsent': 2,
             'collectsData': 3,
         },
-        'constants': {'ParentalConsent', 'ServiceProvision', 'LegalCompliance'},
-        'sorts': {'Entity', 'PersonalInfo', 'Purpose'},
+        'constants': frozenset({'ParentalConsent', 'ServiceProvision', 'LegalCompliance'}),
+        'sorts': frozenset({'Entity', 'PersonalInfo', 'Purpose'}),
         'example_formula': """forall op, ch, info.
   (operator(op) and child(ch) and personalInformation(info) and collectsData(op, ch, info))
   implies hasParentalConsent(ch, op)"""
     }
     
-    
+    # Read-only views shared by every caller, each with its section_pattern
+    # compiled once as 'section_re'
+    _CONFIGS = {
+        name: MappingProxyType({**config, 'section_re': re.compile(config['section_pattern'], re.IGNORECASE)})
+        for name, config in (
+            ('HIPAA', HIPAA),
+            ('GDPR', GDPR),
+            ('CCPA', CCPA),
+            ('GLBA', GLBA),
+            ('SOX', SOX),
+            ('COPPA', COPPA)
+        )
+    }
     
     @classmethod
     def get_config(cls, regulation: str):
         """Get configuration for regulation"""
-        configs = {
-            'HIPAA': cls.HIPAA,
-            'GDPR': cls.GDPR,
-            'CCPA': cls.CCPA,
-            'GLBA': cls.GLBA,
-            'SOX': cls.SOX,
-            'COPPA': cls.COPPA
-        }
-        return configs.get(regulation.upper(), cls.HIPAA)
+        return cls._CONFIGS.get(regulation.upper(), cls._CONFIGS['HIPAA'])
     
     @classmethod
     def detect_regulation(cls, text: str) -> str:
         """Auto-detect regulation from document"""
-        text_sample = text[:10000].lower()
+        text_sample = text[:REGULATION_SAMPLE_CHARS].lower()
         
         scores = {
             'HIPAA': 0,
@@ -1806,51 +3527,37 @@ class RegulationConfig:
             'COPPA': 0
         }
         
-        # HIPAA indicators
-        if 'health insurance portability' in text_sample or '§164' in text[:5000]:
-            scores['HIPAA'] += 10
-        if 'covered entity' in text_sample:
-            scores['HIPAA'] += 5
-        if 'protected health information' in text_sample:
-            scores['HIPAA'] += 5
-            
-        # GDPR indicators
-        if 'general data protection regulation' in text_sample:
-            scores['GDPR'] += 10
-        if re.search(r'article\s+\d+', text[:5000], re.IGNORECASE):
-            scores['GDPR'] += 5
-        if 'data controller' in text_sample or 'data subject' in text_sample:
-            scores['GDPR'] += 5
-            
-        # CCPA indicators
-        if 'california consumer privacy' in text_sample:
-            scores['CCPA'] += 10
-        if 'section 1798' in text_sample:
-            scores['CCPA'] += 5
-        
-        # GLBA indicators
-        if 'gramm-leach-bliley' in text_sample or 'financial institutions' in text_sample:
-            scores['GLBA'] += 10
-        if 'nonpublic personal information' in text_sample:
-            scores['GLBA'] += 5 
-        if 'privacy notice' in text_sample:
-            scores['GLBA'] += 5
-
-        # SOX indicators
-        if 'sarbanes-oxley' in text_sample or 'public company accounting' in text_sample:
-            scores['SOX'] += 10
-        if 'financial report' in text_sample:
-            scores['SOX'] += 5
-        if 'internal controls' in text_sample:
-            scores['SOX'] += 5  
-
-        # COPPA indicators
-        if "children's online privacy" in text_sample or 'section 1303' in text_sample:
-            scores['COPPA'] += 10
-        if 'parental consent' in text_sample:
-            scores['COPPA'] += 5
-        if 'personal information of children' in text_sample:
-            scores['COPPA'] += 5  
+        # Points each regulation could still gain
+        remaining = {regulation: _REGULATION_MAX_POINTS[regulation] for regulation in scores}
+        found = set()
+        
+        def score(indicators):
+            for i in indicators - found:
+                found.add(i)
+                regulation, points, _ = REGULATION_INDICATORS[i]
+                scores[regulation] += points
+                remaining[regulation] -= points
+        
+        # The cheap out-of-band checks first: they settle some documents early
+        if '§164' in text[:5000]:
+            score({_HIPAA_TITLE_INDICATOR})
+        
+        # GDPR article numbering
+        if _ARTICLE_RE.search(text, 0, 5000):
+            scores['GDPR'] += _GDPR_ARTICLE_POINTS
+        remaining['GDPR'] -= _GDPR_ARTICLE_POINTS
+        
+        # Every keyword indicator in one pass; each counts once however often
+        # it occurs, and the scan stops once the outcome can no longer change
+        if _REGULATION_AC is None:
+            score(_phrase_categories(text_sample, None, _REGULATION_PHRASES))
+        else:
+            for _, indicators in _REGULATION_AC.iter(text_sample):
+                if indicators <= found:
+                    continue
+                score(indicators)
+                if _regulation_decided(scores, remaining):
+                    break
         
         # Determine highest score
         detected = max(scores, key=scores.get)
@@ -1859,37 +3566,32 @@ class RegulationConfig:
 class TypeSystemGenerator:
     """Auto-generate type system in YOUR format"""
     
+    # Both extractors are memoized on the formula string, so their results
+    # are immutable: (name, arity) pairs and a frozenset of constants
     @staticmethod
-    def extract_predicates_from_formula(formula: str) -> dict:
-        """Extract predicates and their arities from a formula"""
+    @lru_cache(maxsize=4096)
+    def extract_predicates_from_formula(formula: str) -> tuple:
+        """Extract predicates and their arities from a formula, as (name, arity) pairs"""
         predicates = {}
         
         # Pattern: predicate_name(arg1, arg2, ...)
-        pattern = r'(\w+)\(((?:\w+(?:,\s*)?)+)\)'
-        
-        for match in re.finditer(pattern, formula):
-            pred_name = match.group(1)
-            args = [a.strip() for a in match.group(2).split(',')]
-            arity = len(args)
+        for match in _PREDICATE_APP_RE.finditer(formula):
+            pred_name, args = match.groups()
             
             # Skip logical operators and keywords
-            if pred_name.lower() in ['forall', 'exists', 'and', 'or', 'implies', 'not']:
+            if pred_name.lower() in _PREDICATE_KEYWORDS:
                 continue
-                
-            predicates[pred_name] = arity
+            
+            # One more argument than there are commas
+            predicates[pred_name] = args.count(',') + 1
         
-        return predicates
+        return tuple(predicates.items())
     
     @staticmethod
-    def extract_constants_from_formula(formula: str) -> set:
+    @lru_cache(maxsize=4096)
+    def extract_constants_from_formula(formula: str) -> frozenset:
         """Extract constants (@Constant) from formula"""
-        constants = set()
-        pattern = r'@(\w+)'
-        
-        for match in re.finditer(pattern, formula):
-            constants.add(match.group(1))
-        
-        return constants
+        return frozenset(match.group(1) for match in _CONSTANT_RE.finditer(formula))
     
     @staticmethod
     def generate_type_system(
@@ -1964,39 +3666,47 @@ class PolicyFileGenerator:
     """Generate regulation-specific .policy files"""
     
     @staticmethod
-    def generate(
-        regulation: str,
-        version: str,
-        policies: list,
-        output_path: str
-    ):
-        """Generate .policy file"""
-        lines = []
-        
+    def iter_chunks(regulation: str, version: str, policies: list):
+        """Yield the .policy file text piece by piece, one policy at a time"""
         # Header
-        lines.append(f'regulation {regulation} version "{version}"')
-        lines.append("")
-        lines.append("policy starts")
-        lines.append("")
+        yield f'regulation {regulation} version "{version}"\n\npolicy starts\n\n'
         
         # Policies
         for policy in policies:
             # Annotation
             annotation = f'@["{policy["section"]} - {policy["title"]}"]'
-            lines.append(annotation)
             
             # Formula (ensure proper formatting)
             formula = policy['fotl_formula'].strip()
             if not formula.endswith(';'):
                 formula += ' ;'
             
-            lines.append(formula)
-            lines.append("")
+            yield f"{annotation}\n{formula}\n\n"
+        
+        yield "policy ends"
+    
+    @staticmethod
+    def generate(
+        regulation: str,
+        version: str,
+        policies: list,
+        output_path: str,
+        return_content: bool = True
+    ):
+        """
+        Generate .policy file
         
-        lines.append("policy ends")
+        Returns the file content, or with return_content=False streams the
+        policies straight to disk and returns output_path
+        """
+        chunks = PolicyFileGenerator.iter_chunks(regulation, version, policies)
         
-        # Write file
-        content = '\n'.join(lines)
+        if not return_content:
+            with open(output_path, 'w', buffering=1 << 16) as f:
+                f.writelines(chunks)
+            return output_path
+        
+        content = ''.join(chunks)
         
         with open(output_path, 'w') as f:
             f.write(content)
@@ -2007,12 +3717,115 @@ class PolicyFileGenerator:
 # MULTI-REGULATION DOCUMENT PIPELINE
 # ============================================
 
+@lru_cache(maxsize=None)
+def regulation_identify_system(regulation: str) -> list:
+    """Cached system blocks for policy identification in one regulation's text"""
+    return _cached_system(f"""Analyze the {regulation} regulatory text you are given and identify POLICY STATEMENTS.
+
+A policy statement specifies conditions and actions that can be formalized.
+
+Output JSON array:
+[
+  {{
+    "statement": "exact text of requirement",
+    "section": "the section given with the text",
+    "title": "brief title",
+    "conditions": ["condition1", "condition2"],
+    "action": "what is required/permitted"
+  }}
+]
+
+If no clear policies, return [].
+Output ONLY JSON.""")
+
+
+@lru_cache(maxsize=None)
+def regulation_identify_batch_system(regulation: str) -> list:
+    """regulation_identify_system for several numbered sections, answered in one {"results": [...]} object"""
+    return _cached_system(f"""Analyze the {regulation} regulatory text you are given and identify POLICY STATEMENTS.
+
+A policy statement specifies conditions and actions that can be formalized.
+
+The text comes as several numbered sections. Identify the policies in EACH section separately.
+
+Output ONLY valid JSON, one entry per section:
+{{
+  "results": [
+    {{
+      "id": 1,
+      "policies": [
+        {{
+          "statement": "exact text of requirement",
+          "section": "the section given with the text",
+          "title": "brief title",
+          "conditions": ["condition1", "condition2"],
+          "action": "what is required/permitted"
+        }}
+      ]
+    }}
+  ]
+}}
+
+A section with no clear policies gets "policies": [].""")
+
+
+def _regulation_translate_rules(regulation: str) -> str:
+    """Translation instructions shared by the single and batched prompts, up to the output format"""
+    config = RegulationConfig.get_config(regulation)
+    # Constants are a set: sort them so the prefix is byte-identical across processes
+    return f"""Convert the {config['name']} policy you are given to first-order logic (FOTL).
+
+AVAILABLE PREDICATES:
+{', '.join([f"{p}({a} args)" for p, a in config['predicates'].items()])}
+
+CONSTANTS:
+{', '.join([f"@{c}" for c in sorted(config['constants'])])}
+
+EXAMPLE:
+{config['example_formula']}
+
+CRITICAL:
+1. Output a COMPLETE formula with both sides of implies
+2. Use purposeIsPurpose(var, @Constant) for purposes
+3. Formula must end with closing parenthesis
+"""
+
+
+@lru_cache(maxsize=None)
+def regulation_translate_system(regulation: str) -> list:
+    """Cached system blocks for FOTL translation, one per regulation so each keeps its own prompt-cache entry"""
+    return _cached_system(_regulation_translate_rules(regulation) + """4. Single line output
+
+Output ONLY the formula.""")
+
+
+@lru_cache(maxsize=None)
+def regulation_translate_batch_system(regulation: str) -> list:
+    """regulation_translate_system for several numbered policies, answered in one {"results": [...]} object"""
+    return _cached_system(_regulation_translate_rules(regulation) + """4. Each formula on a single line
+
+The policies come numbered. Translate EACH one separately.
+
+Output ONLY valid JSON, one entry per policy:
+{"results": [{"id": 1, "formula": "..."}, ...]}""")
+
+
+# A policy statement without one of these has nothing to formalize
+DEONTIC_KEYWORDS = frozenset(('may', 'shall', 'must', 'required', 'permitted', 'prohibited'))
+
+# Anthropic requests in flight at once while processing one document
+PIPELINE_MAX_CONCURRENCY = 8
+# Sections (or policies) sent together in one identification (or translation) request
+PIPELINE_BATCH_SIZE = 8
+
+
 class MultiRegulationPipeline:
     """Complete pipeline with auto-generation"""
     
-    def __init__(self, client: Anthropic, precis_path: str):
+    def __init__(self, client: Anthropic, precis_path: str, translate_model: str = FOTL_TRANSLATE_MODEL):
         self.client = client
         self.precis_path = precis_path
+        self.translate_model = translate_model
     
     def process_document(
         self,
@@ -2030,43 +3843,49 @@ class MultiRegulationPipeline:
             'errors': []
         }
         
-        # Step 1: Extract text
-        from io import BytesIO
-        import PyPDF2
-        
+        # Step 1-2: Extract text and detect regulation
         file_bytes = uploaded_file.read()
+        regulation = None
         
         if uploaded_file.name.endswith('.pdf'):
-            pdf_file = BytesIO(file_bytes)
-            reader = PyPDF2.PdfReader(pdf_file)
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text() + "\n\n"
+            # Page by page: the regulation is known once its sample is in,
+            # and reading stops as soon as the sections step has what it needs
+            parts = []
+            size = headers = 0
+            section_re = None
+            for page_text in DocumentExtractor.iter_pdf_pages(file_bytes):
+                parts.append(page_text)
+                size += len(page_text) + 2
+                if section_re is None:
+                    if size < REGULATION_SAMPLE_CHARS:
+                        continue
+                    regulation = RegulationConfig.detect_regulation("\n\n".join(parts))
+                    config = RegulationConfig.get_config(regulation)
+                    section_re = config['section_re']
+                    headers = sum(1 for p in parts for _ in section_re.finditer(p))
+                else:
+                    headers += sum(1 for _ in section_re.finditer(page_text))
+                # max_sections headers, plus the one that ends the last section
+                if headers > max_sections:
+                    break
+            text = "\n\n".join(parts)
         else:
             text = file_bytes.decode('utf-8')
         
-        # Step 2: Detect regulation
-        regulation = RegulationConfig.detect_regulation(text)
+        if regulation is None:
+            regulation = RegulationConfig.detect_regulation(text)
+            config = RegulationConfig.get_config(regulation)
         results['regulation'] = regulation
         
-        config = RegulationConfig.get_config(regulation)
-        
         # Step 3: Extract sections
         sections = self._extract_sections(text, config, max_sections)
         results['sections'] = sections
         
-        # Step 4: Identify policies
-        policies = []
-        for section in sections:
-            section_policies = self._identify_policies(section, regulation)
-            policies.extend(section_policies)
-        
-        # Step 5: Translate to FOTL
-        translated_policies = []
-        for policy in policies:
-            translated = self._translate_policy(policy, config)
-            if translated and len(translated.get('fotl_formula', '')) > 20:
-                translated_policies.append(translated)
+        # Step 4-5: Identify policies and translate them to FOTL, concurrently
+        translated_policies = [
+            translated for translated in asyncio.run(self._identify_and_translate(sections, regulation, config))
+            if translated and len(translated.get('fotl_formula', '')) > 20
+        ]
         
         results['policies'] = translated_policies
         
@@ -2093,115 +3912,253 @@ class MultiRegulationPipeline:
     def _extract_sections(self, text: str, config: dict, max_sections: int) -> list:
         """Extract sections using regulation-specific pattern"""
         sections = []
-        pattern = config['section_pattern']
         prefix = config['section_prefix']
         
-        matches = list(re.finditer(pattern, text, re.IGNORECASE))
+        # Single pass with one match of lookahead; only the first 2000
+        # characters of a section are copied, however far off the next header is
+        matches = config['section_re'].finditer(text)
+        match = next(matches, None)
         
-        for i, match in enumerate(matches[:max_sections]):
-            section_num = match.group(1)
+        for _ in range(max_sections):
+            if match is None:
+                break
+            following = next(matches, None)
             start = match.start()
-            end = matches[i+1].start() if i+1 < len(matches) else len(text)
+            end = following.start() if following else len(text)
+            cut = min(end, start + 2000)
             
-            section_text = text[start:end].strip()[:2000]
+            # Headers never start with whitespace; trailing whitespace goes
+            # only if nothing but whitespace is left before the next header
+            section_text = text[start:cut]
+            if cut == end or not _NONSPACE_RE.search(text, cut, end):
+                section_text = section_text.rstrip()
             
             if len(section_text) > 100:
                 sections.append({
-                    'section': f"{prefix}{section_num}",
+                    'section': f"{prefix}{match.group(1)}",
                     'text': section_text
                 })
+            match = following
         
         return sections
     
+    @staticmethod
+    def _identify_params(section: dict, regulation: str) -> dict:
+        return {
+            "model": POLICY_IDENTIFY_MODEL,
+            "max_tokens": 2000,
+            "system": regulation_identify_system(regulation),
+            "messages": [{"role": "user", "content": f"Section: {section['section']}\n\nText:\n{section['text']}"}],
+        }
+    
+    @staticmethod
+    def _identify_batch_params(sections: list, regulation: str) -> dict:
+        items = [f"Section: {section['section']}\n\nText:\n{section['text']}" for section in sections]
+        return {
+            "model": POLICY_IDENTIFY_MODEL,
+            "max_tokens": 2000 * len(sections),
+            "system": regulation_identify_batch_system(regulation),
+            "messages": [{"role": "user", "content": _numbered(items)}],
+        }
+    
+    @staticmethod
+    def _filter_policies(policies: list) -> list:
+        # Filter quality
+        return [p for p in policies 
+               if len(p.get('statement', '')) > 50 
+               and p.get('conditions') 
+               and p.get('action')]
+    
+    @staticmethod
+    def _policy_looks_translatable(policy: dict) -> bool:
+        """Cheap check before paying for a translation: the statement has to permit, require or forbid something"""
+        statement = policy.get('statement', '')
+        if not isinstance(statement, str):
+            return False
+        statement = statement.lower()
+        return any(word in statement for word in DEONTIC_KEYWORDS)
+    
+    @classmethod
+    def _parse_policies(cls, response_text: str) -> list:
+        json_match = _JSON_ARRAY_RE.search(response_text)
+        
+        if json_match:
+            return cls._filter_policies(json_loads(json_match.group()))
+        return []
+    
+    def _translate_params(self, policy: dict, config: dict) -> dict:
+        return {
+            "model": self.translate_model,
+            "max_tokens": FOTL_TRANSLATE_TOKENS,
+            "system": regulation_translate_system(config['name']),
+            "messages": [{"role": "user", "content": f"Policy: {policy['statement']}\n"
+                                                     f"Section: {policy['section']}\n\n"
+                                                     "Output ONLY the formula:"}],
+        }
+    
+    def _translate_batch_params(self, policies: list, config: dict) -> dict:
+        items = [f"Policy: {policy['statement']}\nSection: {policy['section']}" for policy in policies]
+        return {
+            "model": self.translate_model,
+            "max_tokens": FOTL_TRANSLATE_TOKENS * len(policies),
+            "system": regulation_translate_batch_system(config['name']),
+            "messages": [{"role": "user", "content": _numbered(items)}],
+        }
+    
+    @staticmethod
+    def _parse_formula(policy: dict, response_text: str):
+        formula = response_text.strip()
+        
+        # Clean up
+        if "```" in formula:
+            formula = _FENCED_FORMULA_RE.sub(r'\1', formula)
+            formula = formula.replace('```', '')
+        
+        formula = ' '.join(formula.split())
+        
+        if len(formula) > 20:
+            return {**policy, 'fotl_formula': formula}
+        return None
+    
     def _identify_policies(self, section: dict, regulation: str) -> list:
         """Identify policy statements in section"""
-        prompt = f"""Analyze this {regulation} regulatory text and identify POLICY STATEMENTS.
-
-Text:
-{section['text']}
-
-A policy statement specifies conditions and actions that can be formalized.
-
-Output JSON array:
-[
-  {{
-    "statement": "exact text of requirement",
-    "section": "{section['section']}",
-    "title": "brief title",
-    "conditions": ["condition1", "condition2"],
-    "action": "what is required/permitted"
-  }}
-]
-
-If no clear policies, return [].
-Output ONLY JSON:"""
-        
         try:
-            message = self.client.messages.create(
-                model="claude-sonnet-4-20250514",
-                max_tokens=2000,
-                messages=[{"role": "user", "content": prompt}]
-            )
-            
-            response_text = message.content[0].text
-            json_match = re.search(r'\[.*\]', response_text, re.DOTALL)
-            
-            if json_match:
-                policies = json.loads(json_match.group())
-                # Filter quality
-                return [p for p in policies 
-                       if len(p.get('statement', '')) > 50 
-                       and p.get('conditions') 
-                       and p.get('action')]
-            return []
+            return self._parse_policies(cached_llm_text(self.client, **self._identify_params(section, regulation)))
         except:
             return []
     
     def _translate_policy(self, policy: dict, config: dict) -> dict:
         """Translate policy to FOTL"""
-        prompt = f"""Convert this {config['name']} policy to first-order logic (FOTL).
-
-Policy: {policy['statement']}
-Section: {policy['section']}
-
-AVAILABLE PREDICATES:
-{', '.join([f"{p}({a} args)" for p, a in config['predicates'].items()])}
-
-CONSTANTS:
-{', '.join([f"@{c}" for c in config['constants']])}
-
-EXAMPLE:
-{config['example_formula']}
-
-CRITICAL:
-1. Output a COMPLETE formula with both sides of implies
-2. Use purposeIsPurpose(var, @Constant) for purposes
-3. Formula must end with closing parenthesis
-4. Single line output
-
-Output ONLY the formula:"""
+        try:
+            return self._parse_formula(policy, cached_llm_text(self.client, **self._translate_params(policy, config)))
+        except Exception as e:
+            return None
+    
+    async def _identify_policies_async(self, client: AsyncAnthropic, limit: asyncio.Semaphore,
+                                       section: dict, regulation: str) -> list:
+        try:
+            async with limit:
+                response_text = await cached_llm_text_async(client, **self._identify_params(section, regulation))
+            return self._parse_policies(response_text)
+        except Exception:
+            return []
+    
+    async def _translate_policy_async(self, client: AsyncAnthropic, limit: asyncio.Semaphore,
+                                      policy: dict, config: dict):
+        try:
+            async with limit:
+                response_text = await cached_llm_text_async(client, **self._translate_params(policy, config))
+            return self._parse_formula(policy, response_text)
+        except Exception:
+            return None
+    
+    @classmethod
+    def _recall_policies(cls, section: dict, regulation: str):
+        """
+        Policies already identified for this section, or for a near-identical
+        one of the same regulation (semantic cache); None if neither is known
+        """
+        params = cls._identify_params(section, regulation)
+        key = LLMCache.key_for(params)
+        text = LLM_CACHE.get(key)
+        if text is not None:
+            return cls._parse_policies(text)
+        
+        cache = _semantic_cache(f"identify_{regulation.lower()}")
+        hit = cache.lookup(section['text']) if cache is not None else None
+        if hit is None:
+            return None
+        policies = [{**policy, 'section': section['section']} for policy in hit[0]]
+        # Backfill the exact-match cache so this text is not embedded again
+        LLM_CACHE.set(key, params, json_dumps_bytes(policies).decode())
+        return policies
+    
+    @staticmethod
+    def _remember_policies(section: dict, regulation: str, policies: list):
+        # Empty lists are left out: failed requests also come back empty
+        cache = _semantic_cache(f"identify_{regulation.lower()}")
+        if cache is not None and policies:
+            cache.insert(section['text'], policies)
+    
+    async def _identify_batch_async(self, client: AsyncAnthropic, limit: asyncio.Semaphore,
+                                    sections: list, regulation: str) -> list:
+        """
+        Policies for each section; sections seen before are answered from the
+        caches, the rest from one request, and sections the batch missed are asked alone
+        """
+        recalled = await asyncio.to_thread(
+            lambda: [self._recall_policies(section, regulation) for section in sections]
+        )
+        misses = [section for section, policies in zip(sections, recalled) if policies is None]
+        if not misses:
+            return recalled
         
         try:
-            message = self.client.messages.create(
-                model="claude-sonnet-4-20250514",
-                max_tokens=500,
-                messages=[{"role": "user", "content": prompt}]
-            )
-            
-            formula = message.content[0].text.strip()
-            
-            # Clean up
-            if "```" in formula:
-                formula = re.sub(r'```(?:ocaml|fotl)?\s*\n(.*?)\n```', r'\1', formula, flags=re.DOTALL)
-                formula = re.sub(r'```', '', formula)
-            
-            formula = ' '.join(formula.split())
-            
-            if len(formula) > 20:
-                return {**policy, 'fotl_formula': formula}
+            async with limit:
+                response_text = await cached_llm_text_async(client, **self._identify_batch_params(misses, regulation))
+            batch = _parse_batch_results(response_text, "policies", len(misses))
+        except Exception:
+            batch = [None] * len(misses)
+        
+        async def one(section, policies):
+            if isinstance(policies, list):
+                return self._filter_policies([p for p in policies if isinstance(p, dict)])
+            return await self._identify_policies_async(client, limit, section, regulation)
+        
+        answered = await asyncio.gather(*(one(section, policies) for section, policies in zip(misses, batch)))
+        await asyncio.to_thread(
+            lambda: [self._remember_policies(s, regulation, p) for s, p in zip(misses, answered)]
+        )
+        
+        answers = iter(answered)
+        return [next(answers) if policies is None else policies for policies in recalled]
+    
+    async def _translate_batch_async(self, client: AsyncAnthropic, limit: asyncio.Semaphore,
+                                     policies: list, config: dict) -> list:
+        """Translations for each policy from one request; policies the batch missed are asked alone"""
+        try:
+            async with limit:
+                response_text = await cached_llm_text_async(client, **self._translate_batch_params(policies, config))
+            batch = _parse_batch_results(response_text, "formula", len(policies))
+        except Exception:
+            batch = [None] * len(policies)
+        
+        async def one(policy, formula):
+            if isinstance(formula, str):
+                return self._parse_formula(policy, formula)
+            return await self._translate_policy_async(client, limit, policy, config)
+        
+        return await asyncio.gather(*(one(policy, formula) for policy, formula in zip(policies, batch)))
+    
+    async def _identify_and_translate(self, sections: list, regulation: str, config: dict) -> list:
+        """
+        Steps 4-5 for all sections concurrently, PIPELINE_BATCH_SIZE sections
+        (then policies) per request: each batch of sections has its policies
+        translated as soon as it is answered; at most PIPELINE_MAX_CONCURRENCY
+        requests are in flight. Results keep document order.
+        """
+        from anthropic import AsyncAnthropic
+        
+        limit = asyncio.Semaphore(PIPELINE_MAX_CONCURRENCY)
+        
+        def batches(items):
+            return [items[i:i + PIPELINE_BATCH_SIZE] for i in range(0, len(items), PIPELINE_BATCH_SIZE)]
+        
+        # A fresh async client per run: it is bound to the running event loop
+        async with AsyncAnthropic(api_key=self.client.api_key) as async_client:
+            async def one_batch(section_batch):
+                per_section = await self._identify_batch_async(async_client, limit, section_batch, regulation)
+                policies = [
+                    policy for section_policies in per_section for policy in section_policies
+                    if self._policy_looks_translatable(policy)
+                ]
+                translated = await asyncio.gather(*(
+                    self._translate_batch_async(async_client, limit, policy_batch, config)
+                    for policy_batch in batches(policies)
+                ))
+                return [t for policy_batch in translated for t in policy_batch]
             
-        except Exception as e:
-            pass
+            per_batch = await asyncio.gather(*(one_batch(section_batch) for section_batch in batches(sections)))
         
-        return None
+        return [translated for batch_results in per_batch for translated in batch_results]
 
@@ -1,7 +1,8 @@
 import streamlit as st
 import sys
-from pathlib import Path
-import importlib.util
+import os
+
+from projects_config import PROJECTS, PROJECTS_BY_KEY
 
 # Page config
 st.set_page_config(
@@ -10,50 +11,114 @@ st.set_page_config(
     layout="wide"
 )
 
-# Get the base directory
-BASE_DIR = Path(__file__).parent.absolute()
-
-# Project configurations - ALL THREE PROJECTS
-PROJECTS = [
-    {
-        "key": "NL2LTL",
-        "name": "NL2LTL Phase 2",
-        "description": "Natural Language to Linear Temporal Logic conversion",
-        "path": BASE_DIR / "NL2LTL_PHASE2",
-        "streamlit_app": "streamlit_app.py",
-        "icon": "🔄",
-        "color": "#FF6B6B"
-    },
-    {
-        "key": "PROTOCOL",
-        "name": "Protocol Formalization",
-        "description": "Protocol specification and formalization system",
-        "path": BASE_DIR / "PROTOCOL_FORMALIZATION",
-        "streamlit_app": "streamlit_app.py",
-        "icon": "📋",
-        "color": "#4ECDC4"
-    },
-    {
-        "key": "REGULATORY",
-        "name": "Regulatory Policy Checker",
-        "description": "Policy compliance verification system",
-        "path": BASE_DIR / "REGULATORY_POLICY_CHECKER",
-        "streamlit_app": "streamlit_app.py",
-        "icon": "✅",
-        "color": "#95E1D3"
+# Dashboard styles, sent in the same element as the header
+DASHBOARD_CSS = """
+<style>
+    .project-card {
+        padding: 2rem;
+        border-radius: 15px;
+        border: 2px solid #e0e0e0;
+        height: 100%;
+        transition: all 0.3s ease;
+        background: white;
+        margin-bottom: 1rem;
+        cursor: pointer;
+    }
+    .project-card:hover {
+        border-color: #4ECDC4;
+        box-shadow: 0 8px 16px rgba(0,0,0,0.15);
+        transform: translateY(-5px);
+    }
+    .project-icon {
+        font-size: 5rem;
+        text-align: center;
+        margin-bottom: 1.5rem;
+    }
+    .project-title {
+        font-size: 1.8rem;
+        font-weight: bold;
+        text-align: center;
+        margin-bottom: 1rem;
+        color: #333;
+    }
+    .project-desc {
+        text-align: center;
+        color: #666;
+        font-size: 1rem;
+        line-height: 1.6;
+        margin-bottom: 1.5rem;
+    }
+    .status-badge {
+        display: inline-block;
+        padding: 0.4rem 1rem;
+        border-radius: 20px;
+        font-size: 0.9rem;
+        font-weight: 600;
     }
-]
+    .status-ready {
+        background-color: #d4edda;
+        color: #155724;
+    }
+    .status-missing {
+        background-color: #f8d7da;
+        color: #721c24;
+    }
+    .main-header {
+        text-align: center;
+        margin-bottom: 3rem;
+    }
+</style>
+"""
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _app_exists(app_str):
+    """Filesystem probe behind check_project_exists, reused across reruns for a minute"""
+    # One stat: the app file can only exist if its project directory does
+    try:
+        os.stat(app_str)
+        return True
+    except OSError:
+        return False
 
 def check_project_exists(project_info):
     """Check if project directory and streamlit app exist"""
-    project_path = project_info["path"]
-    app_path = project_path / project_info["streamlit_app"]
-    return project_path.exists() and app_path.exists()
+    return _app_exists(project_info.app_path_str)
+
+@st.cache_data(show_spinner=False)
+def help_status_markdown(status):
+    """The help expander's per-project status list as one markdown block; status is ((project, exists), ...)"""
+    lines = []
+    for project, exists in status:
+        icon = "✅" if exists else "❌"
+        lines.append(f"{icon} **{project.name}**  ")
+        lines.append(f"<small>Expected at: `{project.path}`</small>  ")
+        if exists:
+            lines.append(f"<small>✓ Found: `{project.path}/{project.streamlit_app}`</small>  ")
+        lines.append("")
+    return "\n".join(lines)
+
+@st.cache_data(show_spinner=False)
+def render_card_html(project, exists):
+    """Card markup for a project in the given state (ready/missing)"""
+    status = "ready" if exists else "missing"
+    status_text = "✅ Available" if exists else "❌ Not Found"
+    return f"""
+            <div class="project-card" style="border-color: {project.color};">
+                <div class="project-icon">{project.icon}</div>
+                <div class="project-title">{project.name}</div>
+                <div class="project-desc">{project.description}</div>
+                <div style="text-align: center;">
+                    <span class="status-badge status-{status}">{status_text}</span>
+                </div>
+            </div>
+            """
 
 def load_and_run_project(project_info):
     """Load and execute the project's streamlit app"""
-    project_path = project_info["path"]
-    app_file = project_path / project_info["streamlit_app"]
+    import runpy
+    
+    project_path = project_info.path
+    app_file = project_info.app_path
     
     # Add project directory to sys.path so imports work
     if str(project_path) not in sys.path:
@@ -61,9 +126,7 @@ def load_and_run_project(project_info):
     
     # Import and run the project's app
     try:
-        spec = importlib.util.spec_from_file_location("project_app", app_file)
-        module = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(module)
+        runpy.run_path(str(app_file), run_name="__main__")
         return True
     except Exception as e:
         st.error(f"Error loading project: {e}")
@@ -76,7 +139,7 @@ if 'selected_project' not in st.session_state:
 # Check if a project is selected
 if st.session_state.selected_project is not None:
     # Find the selected project
-    selected = next((p for p in PROJECTS if p['key'] == st.session_state.selected_project), None)
+    selected = PROJECTS_BY_KEY.get(st.session_state.selected_project)
     
     if selected:
         # Show back button
@@ -86,7 +149,7 @@ if st.session_state.selected_project is not None:
                 st.session_state.selected_project = None
                 st.rerun()
         with col2:
-            st.title(f"{selected['icon']} {selected['name']}")
+            st.title(f"{selected.icon} {selected.name}")
         
         st.markdown("---")
         
@@ -94,72 +157,16 @@ if st.session_state.selected_project is not None:
         if check_project_exists(selected):
             load_and_run_project(selected)
         else:
-            st.error(f"Project not found at: {selected['path']}")
+            st.error(f"Project not found at: {selected.path}")
     
 else:
     # Show dashboard/home page
     
-    # Custom CSS
-    st.markdown("""
-    <style>
-        .project-card {
-            padding: 2rem;
-            border-radius: 15px;
-            border: 2px solid #e0e0e0;
-            height: 100%;
-            transition: all 0.3s ease;
-            background: white;
-            margin-bottom: 1rem;
-            cursor: pointer;
-        }
-        .project-card:hover {
-            border-color: #4ECDC4;
-            box-shadow: 0 8px 16px rgba(0,0,0,0.15);
-            transform: translateY(-5px);
-        }
-        .project-icon {
-            font-size: 5rem;
-            text-align: center;
-            margin-bottom: 1.5rem;
-        }
-        .project-title {
-            font-size: 1.8rem;
-            font-weight: bold;
-            text-align: center;
-            margin-bottom: 1rem;
-            color: #333;
-        }
-        .project-desc {
-            text-align: center;
-            color: #666;
-            font-size: 1rem;
-            line-height: 1.6;
-            margin-bottom: 1.5rem;
-        }
-        .status-badge {
-            display: inline-block;
-            padding: 0.4rem 1rem;
-            border-radius: 20px;
-            font-size: 0.9rem;
-            font-weight: 600;
-        }
-        .status-ready {
-            background-color: #d4edda;
-            color: #155724;
-        }
-        .status-missing {
-            background-color: #f8d7da;
-            color: #721c24;
-        }
-        .main-header {
-            text-align: center;
-            margin-bottom: 3rem;
-        }
-    </style>
-    """, unsafe_allow_html=True)
+    # Probe each project once; the metric, the cards and the status list all read this
+    exists_map = {project.key: check_project_exists(project) for project in PROJECTS}
     
-    # Header
-    st.markdown('<div class="main-header">', unsafe_allow_html=True)
+    # Custom CSS and header, sent as one element
+    st.markdown(DASHBOARD_CSS + '<div class="main-header">', unsafe_allow_html=True)
     st.title("🚀 Project Dashboard")
     st.markdown("### Select a project to launch")
     st.markdown("</div>", unsafe_allow_html=True)
@@ -169,11 +176,15 @@ else:
     with col_info1:
         st.metric("Total Projects", len(PROJECTS))
     with col_info2:
-        available = sum(1 for p in PROJECTS if check_project_exists(p))
+        available = sum(exists_map.values())
         st.metric("Available", available)
     with col_info3:
         st.metric("Status", "✅ Ready" if available == len(PROJECTS) else "⚠️ Check Setup")
-    
+        # Only the filesystem probe goes stale; CSS and card HTML caches stay warm
+        if st.button("🔄 Refresh Status", key="refresh_status"):
+            _app_exists.clear()
+            st.rerun()
+
     st.markdown("---")
     
     # Create three columns - ONE FOR EACH PROJECT
@@ -184,39 +195,28 @@ else:
     for idx, project in enumerate(PROJECTS):
         with columns[idx]:
             # Check if project exists
-            exists = check_project_exists(project)
-            status = "ready" if exists else "missing"
-            status_text = "✅ Available" if exists else "❌ Not Found"
+            exists = exists_map[project.key]
             
             # Create card
-            st.markdown(f"""
-            <div class="project-card" style="border-color: {project['color']};">
-                <div class="project-icon">{project['icon']}</div>
-                <div class="project-title">{project['name']}</div>
-                <div class="project-desc">{project['description']}</div>
-                <div style="text-align: center;">
-                    <span class="status-badge status-{status}">{status_text}</span>
-                </div>
-            </div>
-            """, unsafe_allow_html=True)
+            st.markdown(render_card_html(project, exists), unsafe_allow_html=True)
             
             # Launch button
             if exists:
                 if st.button(
                     "🚀 Launch Project",
-                    key=f"btn_{project['key']}",
+                    key=f"btn_{project.key}",
                     use_container_width=True,
                     type="primary"
                 ):
-                    st.session_state.selected_project = project['key']
+                    st.session_state.selected_project = project.key
                     st.rerun()
             else:
                 st.error("⚠️ Project files not found")
             
             # Details expander
             with st.expander("📁 Project Info"):
-                st.caption(f"**Path:** `{project['path']}`")
-                st.caption(f"**Entry:** `{project['streamlit_app']}`")
+                st.caption(f"**Path:** `{project.path}`")
+                st.caption(f"**Entry:** `{project.streamlit_app}`")
                 if exists:
                     st.success("✓ All files present")
                 else:
@@ -251,13 +251,10 @@ YourRepo/
         """)
         
         st.markdown("### Current Status")
-        for project in PROJECTS:
-            exists = check_project_exists(project)
-            icon = "✅" if exists else "❌"
-            st.markdown(f"{icon} **{project['name']}**")
-            st.caption(f"Expected at: `{project['path']}`")
-            if exists:
-                st.caption(f"✓ Found: `{project['path']}/{project['streamlit_app']}`")
+        st.markdown(
+            help_status_markdown(tuple((project, exists_map[project.key]) for project in PROJECTS)),
+            unsafe_allow_html=True
+        )
         
         st.markdown("### Deployment Notes")
         st.markdown("""
@@ -0,0 +1,62 @@
+"""
+Project definitions shared by the launcher (main_app.py) and project_runner.py
+"""
+
+from dataclasses import dataclass, field
+from pathlib import Path
+
+# Get the base directory
+BASE_DIR = Path(__file__).parent.absolute()
+
+
+@dataclass(frozen=True, slots=True)
+class Project:
+    key: str
+    name: str
+    description: str
+    path: Path
+    streamlit_app: str
+    icon: str
+    color: str
+    # Entry point, as a Path and as the string subprocess/importers want
+    app_path: Path = field(init=False)
+    app_path_str: str = field(init=False)
+    
+    def __post_init__(self):
+        app_path = self.path / self.streamlit_app
+        object.__setattr__(self, "app_path", app_path)
+        object.__setattr__(self, "app_path_str", str(app_path))
+
+
+# Project configurations - ALL THREE PROJECTS
+PROJECTS = (
+    Project(
+        key="NL2LTL",
+        name="NL2LTL Phase 2",
+        description="Natural Language to Linear Temporal Logic conversion",
+        path=BASE_DIR / "NL2LTL_PHASE2",
+        streamlit_app="streamlit_app.py",
+        icon="🔄",
+        color="#FF6B6B"
+    ),
+    Project(
+        key="PROTOCOL",
+        name="Protocol Formalization",
+        description="Protocol specification and formalization system",
+        path=BASE_DIR / "PROTOCOL_FORMALIZATION",
+        streamlit_app="streamlit_app.py",
+        icon="📋",
+        color="#4ECDC4"
+    ),
+    Project(
+        key="REGULATORY",
+        name="Regulatory Policy Checker",
+        description="Policy compliance verification system",
+        path=BASE_DIR / "REGULATORY_POLICY_CHECKER",
+        streamlit_app="streamlit_app.py",
+        icon="✅",
+        color="#95E1D3"
+    ),
+)
+
+PROJECTS_BY_KEY = {project.key: project for project in PROJECTS}